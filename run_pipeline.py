@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+This is used to run the processing pipeline of fetch_data_and_export.ipynb without a notebook (e.g., on a schedule on a build node).
+It fetches and merges the data with run_fetch_and_merge(), aggregates the results with aggregate_results(), writes the QC CSVs
+and the results table, and joins the results to census polygons, using the memoized stages of run_pipeline() from utilities/pipeline.py.
+Stages with unchanged inputs are served from the stored artifacts, so scheduled runs only recompute what changed.
+
+Examples:
+    python run_pipeline.py --cache_dir tbl/api_cache/ --processes 4 --max_threads 2
+    python run_pipeline.py --ids AK124 AK131 --reference cache --targets export
+    python run_pipeline.py --cache_dir tbl/api_cache/ --offline --polygon_formats gpkg fgb
+"""
+
+import sys
+import argparse
+from utilities.pipeline import default_params, run_pipeline, stages
+
+
+def cmdline_args():
+    # Make parser object
+    p = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    p.add_argument(
+        "--lookup",
+        type=str,
+        default=default_params["lookup_path"],
+        help=f"Lookup table CSV of GVV IDs and GEOIDFQs. Defaults to {default_params['lookup_path']}.",
+    )
+    p.add_argument(
+        "--ids",
+        type=str,
+        nargs="+",
+        help="GVV IDs to run (e.g., AK124 AK131). Defaults to every ID in the lookup table.",
+    )
+    p.add_argument(
+        "--ids_file",
+        type=str,
+        help="Text file of GVV IDs to run, one per line. Combined with --ids if both are given.",
+    )
+    p.add_argument(
+        "--reference",
+        type=str,
+        choices=["fetch", "cache", "skip"],
+        default=default_params["reference"],
+        help="How to add the state of AK and US reference rows, see run_fetch_and_merge(). Defaults to fetch.",
+    )
+    p.add_argument(
+        "--vintages",
+        type=int,
+        nargs="+",
+        help="Vintages to fetch (e.g., 2021 2022 2023). Defaults to the current vintage only.",
+    )
+    p.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes for fetching and writing payloads. Defaults to the number of CPUs.",
+    )
+    p.add_argument(
+        "--max_threads",
+        type=int,
+        help="Maximum number of concurrent census requests in each worker process. Defaults to one per endpoint.",
+    )
+    p.add_argument(
+        "--cache_dir",
+        type=str,
+        help="Directory of cached API responses shared between runs (e.g., tbl/api_cache/). Defaults to no response cache.",
+    )
+    p.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use responses from --cache_dir, without making any requests. A response that is not cached is an error.",
+    )
+    p.add_argument(
+        "--ci_method",
+        type=str,
+        choices=["pooled", "monte_carlo"],
+        default=default_params["ci_method"],
+        help="How to compute the 90%% CIs of aggregated rows, see aggregate_results(). Defaults to pooled.",
+    )
+    p.add_argument(
+        "--n_draws",
+        type=int,
+        default=default_params["n_draws"],
+        help="Number of samples per census geography for the monte_carlo CI method. Defaults to 10000.",
+    )
+    p.add_argument(
+        "--targets",
+        type=str,
+        nargs="+",
+        choices=list(stages),
+        default=["qc", "export", "polygons"],
+        help="Pipeline stages to run, along with the stages they depend on. Defaults to qc export polygons.",
+    )
+    p.add_argument(
+        "--force",
+        type=str,
+        nargs="+",
+        choices=list(stages),
+        default=[],
+        help="Stages to recompute even if their inputs are unchanged (e.g., fetch to get the latest data from the APIs).",
+    )
+    p.add_argument(
+        "--polygon_formats",
+        type=str,
+        nargs="+",
+        choices=["gpkg", "fgb"],
+        default=["gpkg"],
+        help="Formats of the demographics layer written to shp/ (GeoPackage and/or FlatGeobuf). Defaults to gpkg.",
+    )
+    p.add_argument(
+        "--report_formats",
+        type=str,
+        nargs="+",
+        choices=["csv", "parquet"],
+        default=["csv"],
+        help="Formats of the borough reports, if the report stage is a target. Defaults to csv.",
+    )
+    p.add_argument(
+        "--store_dir",
+        type=str,
+        default="tbl/pipeline/",
+        help="Directory of the stored stage artifacts. Defaults to tbl/pipeline/.",
+    )
+
+    args = p.parse_args()
+    if args.offline and args.cache_dir is None:
+        p.error("--offline needs a --cache_dir of saved responses")
+    for arg in ["processes", "max_threads", "n_draws"]:
+        if getattr(args, arg) is not None and getattr(args, arg) < 1:
+            p.error(f"--{arg} must be at least 1")
+
+    return args
+
+
+def read_ids(args):
+    """Combine the GVV IDs from --ids and --ids_file, or return None to run every ID in the lookup table."""
+    if args.ids is None and args.ids_file is None:
+        return None
+    ids = list(args.ids or [])
+    if args.ids_file is not None:
+        with open(args.ids_file) as f:
+            ids.extend(line.strip() for line in f if line.strip())
+    return list(dict.fromkeys(ids))
+
+
+def get_params(args):
+    """Convert the command line arguments to pipeline parameters for run_pipeline()."""
+    return {
+        "lookup_path": args.lookup,
+        "ids": read_ids(args),
+        "reference": args.reference,
+        "vintages": args.vintages,
+        "cache_dir": args.cache_dir,
+        "processes": args.processes,
+        "max_threads": args.max_threads,
+        "offline": args.offline,
+        "ci_method": args.ci_method,
+        "n_draws": args.n_draws,
+        "polygon_paths": [f"shp/demographics.{fmt}" for fmt in args.polygon_formats],
+        "report_formats": [f".{fmt}" for fmt in args.report_formats],
+    }
+
+
+if __name__ == "__main__":
+    args = cmdline_args()
+    try:
+        artifacts = run_pipeline(
+            get_params(args), args.targets, args.store_dir, args.force
+        )
+    except (ValueError, FileNotFoundError) as e:
+        # exit with an error status so that schedulers can detect failed runs
+        print(f"Pipeline failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    for name, artifact in artifacts.items():
+        if isinstance(artifact, list):
+            for path in artifact:
+                print(f"{name}: wrote {path}")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+This is used to share one fetch run between worker processes on several machines, using the SQLite work queue of utilities/work_queue.py.
+Create the queue once, start workers on any machine that can open the queue database (e.g., on a shared drive), and collect the results when the queue is done.
+
+Examples:
+    python run_queue.py create tbl/queue.sqlite --ids AK124 AK131
+    python run_queue.py create tbl/queue.sqlite --states 02 53 --areatypes tract place
+    python run_queue.py work tbl/queue.sqlite --cache_dir tbl/api_cache/ --processes 2
+    python run_queue.py status tbl/queue.sqlite
+    python run_queue.py collect tbl/queue.sqlite --out tbl/queue_results.csv
+"""
+
+import sys
+import argparse
+import pandas as pd
+from utilities.luts import state_dict
+from utilities.functions import validate_census_requests
+from utilities.export import export_results, write_results_parquet
+from utilities.national import national_areatype_dict
+from utilities.pipeline import default_params
+from utilities.work_queue import (
+    create_queue,
+    enqueue_gvv_ids,
+    enqueue_state_batches,
+    run_worker,
+    run_workers,
+    queue_status,
+    retry_failed,
+    collect_results,
+)
+
+
+def cmdline_args():
+    # Make parser object
+    p = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = p.add_subparsers(dest="command", required=True)
+
+    create = subparsers.add_parser(
+        "create", help="Create a queue and add tasks for GVV IDs or state batches."
+    )
+    create.add_argument("queue", type=str, help="SQLite database of the queue.")
+    create.add_argument(
+        "--lookup",
+        type=str,
+        default=default_params["lookup_path"],
+        help=f"Lookup table CSV of GVV IDs and GEOIDFQs. Defaults to {default_params['lookup_path']}.",
+    )
+    create.add_argument(
+        "--ids",
+        type=str,
+        nargs="+",
+        help="GVV IDs to add (e.g., AK124 AK131). Defaults to every ID in the lookup table, unless --states is given.",
+    )
+    create.add_argument(
+        "--states",
+        type=str,
+        nargs="+",
+        choices=list(state_dict),
+        help="2 digit state FIPS codes to add batches of census geographies for, instead of GVV IDs (e.g., 02 53).",
+    )
+    create.add_argument(
+        "--areatypes",
+        type=str,
+        nargs="+",
+        choices=list(national_areatype_dict),
+        default=["tract"],
+        help="Area types of the geographies of --states. Defaults to tract.",
+    )
+    create.add_argument(
+        "--batch_size",
+        type=int,
+        default=100,
+        help="Maximum number of geographies per task for --states. Defaults to 100.",
+    )
+    create.add_argument(
+        "--skip_reference",
+        action="store_true",
+        help="Leave out the state and US reference rows.",
+    )
+    create.add_argument(
+        "--vintages",
+        type=int,
+        nargs="+",
+        help="Vintages to fetch (e.g., 2021 2022 2023). Defaults to the current vintage only.",
+    )
+    create.add_argument(
+        "--max_attempts",
+        type=int,
+        default=3,
+        help="Number of times a task is tried before it is marked as failed. Defaults to 3.",
+    )
+    create.add_argument(
+        "--retry_delay",
+        type=float,
+        default=60,
+        help="Seconds before a failed task is retried, doubled after each attempt. Defaults to 60.",
+    )
+    create.add_argument(
+        "--cache_dir",
+        type=str,
+        help="Directory of cached API responses used to check the variables and list the geographies of --states.",
+    )
+
+    work = subparsers.add_parser(
+        "work", help="Fetch tasks from a queue until no tasks are left."
+    )
+    work.add_argument("queue", type=str, help="SQLite database of the queue.")
+    work.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of worker processes on this machine. Defaults to 1.",
+    )
+    work.add_argument(
+        "--worker_id",
+        type=str,
+        help="ID of the worker (with --processes 1). Defaults to the host name and process ID.",
+    )
+    work.add_argument(
+        "--lease_seconds",
+        type=float,
+        default=600,
+        help="Seconds until the task of a worker that stopped is leased by another worker. Defaults to 600.",
+    )
+    work.add_argument(
+        "--max_threads",
+        type=int,
+        help="Maximum number of concurrent census requests in each worker process. Defaults to one per endpoint.",
+    )
+    work.add_argument(
+        "--cache_dir",
+        type=str,
+        help="Directory of cached API responses of this machine. Defaults to no response cache.",
+    )
+    work.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use responses from --cache_dir, without making any requests.",
+    )
+    work.add_argument(
+        "--no_wait",
+        action="store_true",
+        help="Stop as soon as no task is available, instead of waiting for the tasks leased by other workers.",
+    )
+
+    status = subparsers.add_parser(
+        "status", help="Show the tasks of a queue by status."
+    )
+    status.add_argument("queue", type=str, help="SQLite database of the queue.")
+    status.add_argument(
+        "--retry_failed",
+        action="store_true",
+        help="Return failed tasks to the queue with their attempts reset.",
+    )
+
+    collect = subparsers.add_parser(
+        "collect", help="Combine and aggregate the results of a queue."
+    )
+    collect.add_argument("queue", type=str, help="SQLite database of the queue.")
+    collect.add_argument(
+        "--out",
+        type=str,
+        required=True,
+        help="Output CSV (written with a Parquet copy) or Parquet file of the results, by extension.",
+    )
+    collect.add_argument(
+        "--ci_method",
+        type=str,
+        choices=["pooled", "monte_carlo"],
+        default=default_params["ci_method"],
+        help="How to compute the 90%% CIs of aggregated rows, see aggregate_results(). Defaults to pooled.",
+    )
+    collect.add_argument(
+        "--n_draws",
+        type=int,
+        default=default_params["n_draws"],
+        help="Number of samples per census geography for the monte_carlo CI method. Defaults to 10000.",
+    )
+    collect.add_argument(
+        "--allow_incomplete",
+        action="store_true",
+        help="Collect the finished tasks even if other tasks are unfinished or failed.",
+    )
+
+    args = p.parse_args()
+    if args.command == "create" and args.ids is not None and args.states is not None:
+        p.error("use either --ids or --states")
+    if args.command == "work" and args.offline and args.cache_dir is None:
+        p.error("--offline needs a --cache_dir of saved responses")
+    for arg in ["processes", "max_threads", "batch_size", "max_attempts", "n_draws"]:
+        if getattr(args, arg, None) is not None and getattr(args, arg) < 1:
+            p.error(f"--{arg} must be at least 1")
+
+    return args
+
+
+def create(args):
+    """Create a queue and add its tasks."""
+    if args.states is not None:
+        areatypes = [national_areatype_dict[a]["AREATYPE"] for a in args.areatypes]
+        check_df = pd.DataFrame({"AREATYPE": areatypes + ["State", "Nation"]})
+    else:
+        check_df = pd.read_csv(args.lookup)
+    # fail before queueing any tasks if a request would be rejected
+    validate_census_requests(
+        check_df, args.vintages, args.cache_dir or "tbl/api_cache/"
+    )
+
+    create_queue(args.queue, args.vintages, args.max_attempts, args.retry_delay)
+    if args.states is not None:
+        added = enqueue_state_batches(
+            args.queue,
+            args.states,
+            args.areatypes,
+            args.batch_size,
+            cache_dir=args.cache_dir,
+            reference=not args.skip_reference,
+        )
+    else:
+        added = enqueue_gvv_ids(
+            args.queue, check_df, args.ids, reference=not args.skip_reference
+        )
+    print(f"Added {added} tasks to {args.queue}")
+
+
+def work(args):
+    """Run workers of a queue on this machine."""
+    worker_kwargs = {
+        "lease_seconds": args.lease_seconds,
+        "cache_dir": args.cache_dir,
+        "max_threads": args.max_threads,
+        "offline": args.offline,
+        "wait": not args.no_wait,
+    }
+    if args.processes == 1:
+        run_worker(args.queue, args.worker_id, **worker_kwargs)
+    else:
+        run_workers(args.queue, args.processes, **worker_kwargs)
+
+
+def status(args):
+    """Print the number of tasks of a queue by status, and the errors of failed tasks."""
+    status_df = queue_status(args.queue)
+    print(status_df["status"].value_counts().to_string())
+    failed = status_df[status_df["status"] == "failed"]
+    if len(failed) > 0:
+        print(failed[["task_id", "attempts", "worker", "error"]].to_string(index=False))
+    if args.retry_failed:
+        print(f"Returned {retry_failed(args.queue)} failed tasks to the queue")
+
+
+def collect(args):
+    """Write the aggregated results of a queue."""
+    results_df = collect_results(
+        args.queue,
+        ci_method=args.ci_method,
+        n_draws=args.n_draws,
+        allow_incomplete=args.allow_incomplete,
+    )
+    if args.out.endswith(".parquet"):
+        write_results_parquet(results_df, args.out)
+    else:
+        export_results(results_df, args.out)
+    print(f"Wrote {len(results_df)} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    args = cmdline_args()
+    commands = {"create": create, "work": work, "status": status, "collect": collect}
+    try:
+        commands[args.command](args)
+    except (ValueError, FileNotFoundError) as e:
+        # exit with an error status so that schedulers can detect failed runs
+        print(f"Queue {args.command} failed: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -28,37 +28,57 @@ def cmdline_args():
     p.add_argument(
         "name",
         type=str,
-        help="Primary name of point location. Required.",
+        nargs="?",
+        help="Primary name of point location. Required unless using --batch.",
     )
     p.add_argument(
         "region",
         type=str,
+        nargs="?",
         choices=["AB", "AK", "BC", "MB", "SK", "NT", "YT"],
-        help="Region postal code of point location. Required.",
+        help="Region postal code of point location. Required unless using --batch.",
     )
     p.add_argument(
         "country",
         type=str,
+        nargs="?",
         choices=["CA", "US"],
-        help="Country abbreviation of the point location. Required.",
+        help="Country abbreviation of the point location. Required unless using --batch.",
     )
     p.add_argument(
         "latitude",
         type=float,
-        help="Latitude of the point location. Required.",
+        nargs="?",
+        help="Latitude of the point location. Required unless using --batch.",
     )
     p.add_argument(
         "longitude",
         type=float,
-        help="Longitude of the point location. Required.",
+        nargs="?",
+        help="Longitude of the point location. Required unless using --batch.",
     )
     p.add_argument(
         "--optional_name",
         type=str,
         help="Secondary or alternate name of point location. Optional.",
     )
+    p.add_argument(
+        "--batch",
+        type=str,
+        help="CSV of new point locations to add in one batch, with name, region, country, latitude, and longitude columns (and an optional alt_name column). Region may be a postal code or spelled out. Optional.",
+    )
 
-    return p.parse_args()
+    args = p.parse_args()
+    if args.batch is None and None in [
+        args.name,
+        args.region,
+        args.country,
+        args.latitude,
+        args.longitude,
+    ]:
+        p.error("name, region, country, latitude, and longitude are required")
+
+    return args
 
 
 def read_csv_by_region(region):
@@ -86,7 +106,7 @@ def create_new_record(new_id, name, region, country, lat, lon, alt_name):
     """Create the new point location from user input.
     A defualt value of 0 will be added for the coastal distance which can
     then be computed later."""
-    if alt_name == None:
+    if alt_name == None or (isinstance(alt_name, float) and np.isnan(alt_name)):
         alt_name = np.nan
     # ignoring region dict here, since region is already spelled out in source df
     record = [new_id, name, alt_name, region, country, lat, lon, 0]
@@ -103,6 +123,53 @@ def insert_new_record(df, record):
     return new_df
 
 
+def read_new_locations(csv_path):
+    """Read a CSV of new point locations to add in one batch. Region names are converted to postal codes."""
+    new_locations = pd.read_csv(csv_path)
+    if "alt_name" not in new_locations.columns:
+        new_locations["alt_name"] = np.nan
+    postal_codes = {v: k for k, v in postal_di.items()}
+    new_locations["region"] = new_locations["region"].replace(postal_codes)
+    return new_locations
+
+
+def create_new_ids(region, last_id_number, count):
+    """Create a contiguous range of new unique ids for a batch of records."""
+    return [region + str(last_id_number + i) for i in range(1, count + 1)]
+
+
+def insert_new_records(df, records):
+    """Insert a batch of new records at end of DataFrame. Only the new records are rounded."""
+    new_rows = pd.DataFrame(records, columns=df.columns).round(4)
+    new_df = pd.concat([df, new_rows], ignore_index=True)
+    return new_df
+
+
+def batch_insert_new_records(df, region, new_locations):
+    """Add a batch of new point locations for one region: allocate the new ids once,
+    append all new records at once, and sort once.
+    The spelled out region name is used in the region column, to match the source df."""
+    last_id = get_last_id_number_in_df(df)
+    new_ids = create_new_ids(region, last_id, len(new_locations))
+    records = [
+        create_new_record(
+            new_id,
+            row.name,
+            postal_di[region],
+            row.country,
+            row.latitude,
+            row.longitude,
+            row.alt_name,
+        )
+        for new_id, row in zip(
+            new_ids, new_locations.itertuples(index=False, name="Location")
+        )
+    ]
+    new_df = insert_new_records(df, records)
+    new_df = sort_alphabetically(new_df)
+    return new_df
+
+
 def sort_alphabetically(new_df):
     """Sort dataframe alphabetically by location name."""
     new_df.sort_values("name", inplace=True)
@@ -142,29 +209,45 @@ def yes_no(answer):
 
 
 if __name__ == "__main__":
+    args = cmdline_args()
     try:
-        args = cmdline_args()
-        df, csv_path = read_csv_by_region(args.region)
-        last_id = get_last_id_number_in_df(df)
-        new_id = create_new_id(args.region, last_id)
-        record = create_new_record(
-            new_id,
-            args.name,
-            args.region,
-            args.country,
-            args.latitude,
-            args.longitude,
-            args.optional_name,
-        )
-        new_df = insert_new_record(df, record)
-        new_df = sort_alphabetically(new_df)
-        show_diff(df, new_df)
-        create = yes_no("Do you wish to proceed with creating the new file (y/n)?")
-        if create:
-            write_new_csv(new_df, csv_path)
+        if args.batch:
+            new_locations = read_new_locations(args.batch)
+            for region, region_locations in new_locations.groupby("region"):
+                df, csv_path = read_csv_by_region(region)
+                new_df = batch_insert_new_records(df, region, region_locations)
+                show_diff(df, new_df)
+                create = yes_no(
+                    f"Do you wish to proceed with adding {len(region_locations)} new locations to {csv_path} (y/n)?"
+                )
+                if create:
+                    write_new_csv(new_df, csv_path)
+                else:
+                    print(f"No new file was created for {region}.")
         else:
-            print("No new file was created. Program exiting.")
-    except:
+            df, csv_path = read_csv_by_region(args.region)
+            last_id = get_last_id_number_in_df(df)
+            new_id = create_new_id(args.region, last_id)
+            record = create_new_record(
+                new_id,
+                args.name,
+                args.region,
+                args.country,
+                args.latitude,
+                args.longitude,
+                args.optional_name,
+            )
+            new_df = insert_new_record(df, record)
+            new_df = sort_alphabetically(new_df)
+            show_diff(df, new_df)
+            create = yes_no("Do you wish to proceed with creating the new file (y/n)?")
+            if create:
+                write_new_csv(new_df, csv_path)
+            else:
+                print("No new file was created. Program exiting.")
+    except Exception as e:
+        print(f"Error: {e}")
         print(
             "Try python add_point_location.py 'Vanta' 'AK' 'US' 99.9999 -99.9999 --optional_name='Bubba'"
         )
+        print("or python add_point_location.py --batch new_locations.csv")
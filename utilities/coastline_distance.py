@@ -0,0 +1,101 @@
+"""
+This is used to compute the distance from point locations to the nearest coastline, for the km_distance_to_ocean column of point location CSV files.
+"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely import STRtree
+
+# regions of the coastline to use for Alaska and Canada, as (minx, miny, maxx, maxy) in WGS84
+# Alaska crosses the antimeridian, so the western Aleutians are in a separate box
+coastline_bboxes = [(-180, 40, -50, 85), (165, 40, 180, 85)]
+
+
+def load_coastline_segments(
+    coastline_path="shp/ne_10m_coastline.shp", bboxes=coastline_bboxes, crs=3338
+):
+    """Read the coastline for the Alaska / Canada region only, reproject it, and split it into individual line segments.
+    Short segments have tight bounding boxes, which makes nearest-segment queries in an STRtree fast.
+
+    Args:
+        coastline_path (str or pathlib.Path): coastline shapefile (e.g., Natural Earth 10m coastline)
+        bboxes (list): (minx, miny, maxx, maxy) WGS84 boxes of the coastline to read
+        crs (int): EPSG code of a projected coordinate system to compute distances in (defaults to Alaska Albers)
+    Returns:
+        numpy.ndarray of shapely LineString segments
+    """
+    coastline = pd.concat(
+        [gpd.read_file(coastline_path, bbox=bbox) for bbox in bboxes]
+    ).to_crs(crs)
+
+    # get consecutive coordinate pairs of every line as segments
+    lines = coastline.geometry.explode(index_parts=False).values
+    coords, line_idx = shapely.get_coordinates(lines, return_index=True)
+    same_line = line_idx[:-1] == line_idx[1:]
+    starts = coords[:-1][same_line]
+    ends = coords[1:][same_line]
+
+    return shapely.linestrings(np.stack([starts, ends], axis=1))
+
+
+def compute_km_distance_to_ocean(df, segments, crs=3338):
+    """Compute the distance from each point to the nearest coastline segment, in km rounded to 1 decimal place.
+
+    Args:
+        df (pandas.DataFrame): point locations with "latitude" and "longitude" columns
+        segments (numpy.ndarray): coastline segments from load_coastline_segments()
+        crs (int): EPSG code of the coastline segments
+    Returns:
+        pandas.Series of distances with the same index as df
+    """
+    points = gpd.points_from_xy(df["longitude"], df["latitude"], crs=4326).to_crs(crs)
+
+    tree = STRtree(segments)
+    # query_nearest returns the nearest segment for every point, so each point appears once (ties are not returned)
+    (point_idx, _), distance = tree.query_nearest(
+        np.asarray(points), return_distance=True, all_matches=False
+    )
+
+    km = np.full(len(df), np.nan)
+    km[point_idx] = distance / 1000
+    return pd.Series(np.round(km, 1), index=df.index)
+
+
+def update_km_distance_to_ocean(df, previous_df, segments, crs=3338):
+    """Fill in the km_distance_to_ocean column, recomputing it only for points that are new or have moved since the previous version of the table.
+
+    Args:
+        df (pandas.DataFrame): point locations with "id", "latitude", and "longitude" columns
+        previous_df (pandas.DataFrame): previous version of the point locations table, with "km_distance_to_ocean" values
+        segments (numpy.ndarray): coastline segments from load_coastline_segments()
+        crs (int): EPSG code of the coastline segments
+    Returns:
+        pandas.DataFrame with the km_distance_to_ocean column updated
+    """
+    df = df.copy()
+    previous = previous_df.set_index("id")[
+        ["latitude", "longitude", "km_distance_to_ocean"]
+    ]
+    previous = previous.reindex(df["id"])
+
+    # points are unchanged if they have the same id and coordinates as in the previous table
+    unchanged = (
+        (previous["latitude"].to_numpy() == df["latitude"].to_numpy())
+        & (previous["longitude"].to_numpy() == df["longitude"].to_numpy())
+        & previous["km_distance_to_ocean"].notna().to_numpy()
+    )
+
+    df.loc[unchanged, "km_distance_to_ocean"] = previous[
+        "km_distance_to_ocean"
+    ].to_numpy()[unchanged]
+    if (~unchanged).any():
+        print(
+            f"Computing distance to ocean for {(~unchanged).sum()} new or moved points"
+        )
+        df.loc[~unchanged, "km_distance_to_ocean"] = compute_km_distance_to_ocean(
+            df[~unchanged], segments, crs
+        ).to_numpy()
+
+    return df
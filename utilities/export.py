@@ -0,0 +1,182 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from utilities.luts import *
+
+
+def get_column_metadata(col):
+    """Get the long name and data source for a column in the results table, using var_dict and computed_var_dict.
+    CI columns (e.g., "pct_asthma_low") are described using the long name of their measure.
+
+    Args:
+        col (str): column name in the results table
+    Returns:
+        dictionary with "long_name" and "source" keys (values are empty strings if the column is not found)
+    """
+    # the survey level of var_dict is nested one level deeper for the CDC datasets
+    surveys = {
+        "dhc": var_dict["dhc"],
+        "acs5": var_dict["acs5"],
+        "PLACES": var_dict["cdc"]["PLACES"],
+        "SDOH": var_dict["cdc"]["SDOH"],
+    }
+
+    for suffix, bound in [("_low", "Lower"), ("_high", "Upper")]:
+        if col.endswith(suffix):
+            measure = get_column_metadata(col[: -len(suffix)])
+            if measure["long_name"] != "":
+                return {
+                    "long_name": f"{bound} bound of the 90% confidence interval for {measure['long_name']}",
+                    "source": measure["source"],
+                }
+
+    for survey, survey_dict in surveys.items():
+        for var in survey_dict["vars"].values():
+            if var["short_name"] == col:
+                return {"long_name": var["long_name"], "source": survey_dict["source"]}
+        if col in computed_var_dict.get(survey, {}):
+            return {
+                "long_name": computed_var_dict[survey][col],
+                "source": survey_dict["source"],
+            }
+
+    return {"long_name": "", "source": ""}
+
+
+def results_schema(df):
+    """Build an explicit Arrow schema for the results table. Non-data columns (including the zero-padded GEOID) are strings,
+    and all data columns are float64. Each field carries the long name and source of the column as metadata.
+
+    Args:
+        df (pandas.DataFrame): results table from aggregate_results()
+    Returns:
+        pyarrow.Schema
+    """
+    fields = []
+    for col in df.columns:
+        metadata = get_column_metadata(col)
+        if col in non_data_cols:
+            dtype = pa.string()
+        else:
+            dtype = pa.float64()
+        fields.append(
+            pa.field(
+                col,
+                dtype,
+                metadata={
+                    "long_name": metadata["long_name"],
+                    "source": metadata["source"],
+                },
+            )
+        )
+    return pa.schema(fields)
+
+
+def export_results(df, csv_path, parquet_path=None, row_group_size=None):
+    """Export the results table to CSV, and also to a typed, compressed Parquet file with an explicit schema.
+    The Parquet file is written next to the CSV with the same name unless a path is given.
+
+    Args:
+        df (pandas.DataFrame): results table from aggregate_results()
+        csv_path (str or pathlib.Path): output CSV path (e.g., "tbl/data_to_export.csv")
+        parquet_path (str or pathlib.Path): output Parquet path, defaults to the CSV path with a ".parquet" suffix
+        row_group_size (int): maximum number of rows per Parquet row group, defaults to the pyarrow default
+    Returns:
+        pathlib.Path of the Parquet file
+    """
+    df.to_csv(csv_path, index=False)
+
+    if parquet_path is None:
+        parquet_path = Path(csv_path).with_suffix(".parquet")
+
+    return write_results_parquet(df, parquet_path, row_group_size)
+
+
+def write_results_parquet(df, parquet_path, row_group_size=None):
+    """Write the results table to a typed, compressed Parquet file with an explicit schema (see results_schema()).
+
+    Args:
+        df (pandas.DataFrame): results table from aggregate_results()
+        parquet_path (str or pathlib.Path): output Parquet path
+        row_group_size (int): maximum number of rows per Parquet row group, defaults to the pyarrow default
+    Returns:
+        pathlib.Path of the Parquet file
+    """
+    # make sure non-data columns are strings (GEOIDs may have been read back as integers)
+    df = df.copy()
+    for col in df.columns:
+        if col in non_data_cols:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+
+    table = pa.Table.from_pandas(df, schema=results_schema(df), preserve_index=False)
+    pq.write_table(
+        table,
+        parquet_path,
+        compression="zstd",
+        row_group_size=row_group_size,
+        write_statistics=True,
+    )
+
+    return Path(parquet_path)
+
+
+def read_results(parquet_path, columns=None, ids=None):
+    """Read the results table from Parquet, optionally selecting columns and filtering by GVV ID.
+    Only the requested columns are read, and row groups without the requested IDs are skipped using their statistics.
+
+    Args:
+        parquet_path (str or pathlib.Path): Parquet file written by export_results()
+        columns (list): columns to read, defaults to all columns
+        ids (list): GVV IDs to read, defaults to all IDs
+    Returns:
+        pandas.DataFrame
+    """
+    filters = None
+    if ids is not None:
+        filters = [("id", "in", list(ids))]
+
+    return pq.read_table(parquet_path, columns=columns, filters=filters).to_pandas()
+
+
+def select_vintage(df, vintage=None):
+    """Select the rows of one vintage from a results table with several vintages, so that each GVV ID has one row.
+    Results tables without a "vintage" column are returned as-is.
+
+    Args:
+        df (pandas.DataFrame): results table from aggregate_results(), or read with read_results()
+        vintage (int): vintage to select, defaults to the latest vintage of the results table
+    Returns:
+        pandas.DataFrame
+    """
+    if "vintage" not in df.columns:
+        return df
+
+    vintages = sorted(df["vintage"].unique().tolist())
+    if vintage is None:
+        vintage = vintages[-1]
+        if len(vintages) > 1:
+            print(
+                f"Results have vintages {vintages}, using the {vintage} rows (pass a vintage to use another one)"
+            )
+    elif vintage not in vintages:
+        raise ValueError(
+            f"Vintage {vintage} is not in the results table (available: {vintages})"
+        )
+
+    return df[df["vintage"] == vintage].reset_index(drop=True)
+
+
+def read_column_metadata(parquet_path):
+    """Read the long name and source of each column from the Parquet schema, without reading any data.
+
+    Args:
+        parquet_path (str or pathlib.Path): Parquet file written by export_results()
+    Returns:
+        dictionary with column names as keys and dictionaries of long name and source as values
+    """
+    schema = pq.read_schema(parquet_path)
+    return {
+        field.name: {k.decode(): v.decode() for k, v in (field.metadata or {}).items()}
+        for field in schema
+    }
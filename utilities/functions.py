@@ -1,9 +1,19 @@
 import requests
+import os
+import copy
+import json
+import hashlib
+import difflib
 import pandas as pd
 import numpy as np
-import math
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from urllib.parse import urlparse
 from multiprocessing.pool import Pool
+from concurrent.futures import ThreadPoolExecutor
 from utilities.luts import *
+from utilities.uncertainty import simulate_intervals
 from functools import reduce
 
 
@@ -23,41 +33,48 @@ def calculate_pop_variance(df):
         df["total_population"] - (df["total_population"] * (df["pct_under_18"] / 100))
     )
 
-    # add new empty columns to hold adult population variance for each measure
+    # back calculate the standard deviation for the adult population, for all rows of each measure at once
+    variances = {}
     for var in var_dict["cdc"]["PLACES"]["vars"]:
-        short_name = var_dict["cdc"]["PLACES"]["vars"][var]["short_name"]
-        df[short_name + "_adult_population_variance"] = None
-
-    # iterate through the rows and measures to back calculate the standard deviation for the adult population
-    for i, row in df.iterrows():
-        for var in var_dict["cdc"]["PLACES"]["vars"]:
-            # identify the columns for the measure and the high CI
-            measure_col = var_dict["cdc"]["PLACES"]["vars"][var]["short_name"]
-            ci_high_col = str(measure_col + "_high")
-            # find the difference between high CI and the measure value (ie, the margin of error)
-            moe = row[ci_high_col] - row[measure_col]
-            # multiply moe by square root of adult population and divide by 1.96 to get the standard deviation for 95% CI
-            sd = (moe * (math.sqrt(row["adult_population"]))) / 1.96
-            # calculate variance and adult population variance, then populate the empty columns we created
-            # formula = (adult_population - 1) * variance
-            variance = sd**2
-            adult_population_variance = (row["adult_population"] - 1) * variance
-            df[measure_col + "_adult_population_variance"].iloc[
-                i
-            ] = adult_population_variance
-
-    return df
-
-
-def aggregate_results(results_df):
+        # identify the columns for the measure and the high CI
+        measure_col = var_dict["cdc"]["PLACES"]["vars"][var]["short_name"]
+        ci_high_col = str(measure_col + "_high")
+        # find the difference between high CI and the measure value (ie, the margin of error)
+        moe = df[ci_high_col] - df[measure_col]
+        # multiply moe by square root of adult population and divide by 1.96 to get the standard deviation for 95% CI
+        sd = (moe * np.sqrt(df["adult_population"])) / 1.96
+        # calculate variance and adult population variance
+        # formula = (adult_population - 1) * variance
+        variance = sd**2
+        variances[measure_col + "_adult_population_variance"] = (
+            df["adult_population"] - 1
+        ) * variance
+
+    # add all of the new columns at once
+    df = df.drop(columns=list(variances), errors="ignore")
+    return pd.concat([df, pd.DataFrame(variances, index=df.index)], axis=1)
+
+
+def aggregate_results(results_df, ci_method="pooled", n_draws=10000, seed=0):
     """Aggregates any one-to-many relationships in the final results table.
     Includes calculating the pooled standard deviation and the 90% CI for each measure that reports those statistics.
+    All one-to-many entries are aggregated at once with grouped operations.
+    With the "monte_carlo" CI method, the 90% CIs of aggregated entries are instead estimated by simulation with simulate_intervals() from utilities/uncertainty.py,
+    which also gives intervals for the averaged measures (non_pop_cols) and does not assume the intervals are symmetric.
 
     Args:
         df (pandas.DataFrame): concatenated dataframe result from the run_fetch_and_merge() function
+        ci_method (str): how to compute the 90% CIs of aggregated entries, "pooled" (closed-form) or "monte_carlo"
+        n_draws (int): number of samples per row for the "monte_carlo" CI method
+        seed (int): seed of the random number generator for the "monte_carlo" CI method
     Returns:
         pandas.DataFrame with any one-to-many entries aggregated into one-to-one entries
     """
+    if ci_method not in ["pooled", "monte_carlo"]:
+        raise ValueError(
+            f'Unknown CI method: {ci_method} (use "pooled" or "monte_carlo")'
+        )
+
     # reset index just in case there are duplicate indices
     df = results_df.reset_index(drop=True)
 
@@ -65,202 +82,110 @@ def aggregate_results(results_df):
     # required for calculation of pooled 90% CI
     df = calculate_pop_variance(df)
 
-    # make sure GEOIDs are strings in order to list them with sum (instead of summing them as integers!)
+    # make sure GEOIDs are strings in order to list them (instead of summing them as integers!)
     df["GEOID"] = df["GEOID"].astype(str)
 
-    # create wrapper to concatenate strings for placename and GEOID columns
-    # this info will already be preserved in the comments, but also need to list in these columns to be more explicit
-    def concat_strings(x):
-        return (", ").join(x)
-
-    # create wrapper to use np.sum, or return NA if any NA values exist
-    def sum_no_nan(x):
-        if x.isna().any():
-            return np.nan
-        else:
-            return np.sum(x)
-
-    # create wrapper to use np.nanmean
-    def nanmean(x):
-        return np.nanmean(x)
-
-    # create function to replace negative values with 0 (ignoring nans)
-    def replace_negatives(x):
-        if np.isnan(x):
-            return np.nan
-        else:
-            return max(0, x)
+    # columns that are only for adult population use the "adult_population" field when aggregating
+    # columns that have MOE values are aggregated according the formula defined below
+    # columns that do not deal with population at all (pct of housing units, etc...) are simply averaged
+    # all other data columns are summed; they will be converted from pct to real population counts before summing
+    # (adult_only_cols, moe_cols, non_pop_cols, and non_data_cols are listed in luts.py)
 
-    # create moe aggregation function
-    # as defined here: https://www.census.gov/content/dam/Census/library/publications/2018/acs/acs_general_handbook_2018_ch08.pdf
-    def aggregate_moe(x):
-        if x.isna().any():
-            return np.nan
-        else:
-            return math.sqrt(np.sum(x**2))
-
-    # build an aggregation dict for all data columns
-    # use "first" for non-data columns, or the custom function when aggregating placename and GEOID strings
-    # list columns that are only for adult population; we need to use the "adult_population" field when aggregating these
-    # list columns that have MOE values; we need to aggregate these according the formula defined above
-    # lis columns that do not deal with population at all (pct of housing units, etc...)... these will simply be averaged
-    # sum all other data columns; they will be converted from pct to real population counts before summing
-    non_data_cols = ["id", "name", "areatype", "placename", "GEOID", "comment"]
-
-    adult_only_cols = [
-        "pct_asthma",
-        "pct_copd",
-        "pct_chd",
-        "pct_stroke",
-        "pct_diabetes",
-        "pct_mh",
-        "pct_foodstamps",
-        "pct_emospt",
+    variance_cols = [
+        col for col in df.columns if col.endswith("_adult_population_variance")
     ]
-
-    moe_cols = [
-        "moe_pct_w_disability",
-        "moe_pct_insured",
-        "moe_pct_uninsured",
-        "pct_no_bband_moe",
-        "pct_crowding_moe",
-        "pct_hcost_moe",
-        "pct_no_hsdiploma_moe",
-        "pct_below_150pov_moe",
-        "pct_minority_moe",
-        "pct_single_parent_moe",
-        "pct_unemployed_moe",
+    count_cols = ["total_population", "adult_population"]
+    # CI columns of measures with a pooled SD are recomputed after aggregation
+    ci_cols = [
+        col
+        for col in df.columns
+        if col.endswith(("_low", "_high")) and col not in non_data_cols
     ]
-
-    non_pop_cols = [
-        "pct_no_bband",
-        "pct_crowding",
-        "pct_hcost",
-        "pct_single_parent",
+    pop_cols = [
+        col
+        for col in df.columns
+        if col not in count_cols
+        and col not in adult_only_cols
+        and col not in moe_cols
+        and col not in non_pop_cols
+        and col not in non_data_cols
+        and col not in variance_cols
+        and col not in ci_cols
     ]
-
-    agg_dict = {}
-
-    for col in df.columns:
-        if col in non_data_cols:
-            if col in ["placename", "GEOID"]:
-                agg_dict[col] = concat_strings
-            else:
-                agg_dict[col] = "first"
-        elif col in moe_cols:
-            agg_dict[col] = aggregate_moe
-        elif col in non_pop_cols:
-            agg_dict[col] = nanmean
-        else:
-            agg_dict[col] = sum_no_nan
-
-    # create list to collect results
-    agg_df_list = []
-
-    # list duplicated ids and names; these rows need to be aggregated
-    dups = list(
-        zip(
-            df[df.duplicated(subset="id")]["id"].unique().tolist(),
-            df[df.duplicated(subset="id")]["name"].unique().tolist(),
+    adult_cols = [col for col in adult_only_cols if col in df.columns]
+
+    # list duplicated ids; these rows need to be aggregated
+    # results with several vintages are aggregated separately for each vintage
+    keys = ["id", "vintage"] if "vintage" in df.columns else ["id"]
+    is_dup = df.duplicated(keys, keep=False)
+    dup_ids = df.loc[df.duplicated(keys), keys].drop_duplicates().set_index(keys).index
+
+    simulated = None
+    if len(dup_ids) > 0:
+        sub_df = df[is_dup]
+        groups = sub_df.groupby(keys, sort=False)
+        names = groups[["id", "name"]].first().loc[dup_ids]
+        for dup_id, name in dict.fromkeys(zip(names["id"], names["name"])):
+            print(f"Aggregating values for {dup_id}: {name}")
+
+        # sum, or return NA if any NA values exist
+        def sum_no_nan(values):
+            group_keys = [sub_df[key] for key in keys]
+            grouped = values.groupby(group_keys, sort=False)
+            return grouped.sum().where(~values.isna().groupby(group_keys).any())
+
+        # use "first" for non-data columns, and list the placenames and GEOIDs of each group
+        info = groups[[col for col in df.columns if col in non_data_cols]].first()
+        for col in ["placename", "GEOID"]:
+            info[col] = groups[col].agg(", ".join)
+
+        counts = sum_no_nan(sub_df[count_cols])
+
+        # compute population counts by row, sum them, and convert the sums back to percentages
+        pop_counts = sub_df[pop_cols].mul(sub_df["total_population"], axis=0) / 100
+        pop_pcts = round(
+            sum_no_nan(pop_counts).div(counts["total_population"], axis=0) * 100, 2
         )
-    )
-
-    # iterate thru the list of duplicated ids and names
-    for dup in dups:
-        print(f"Aggregating values for {dup[0]}: {dup[1]}")
-
-        # get duplicated rows into a subset dataframe
-        sub_df = df[df["id"] == dup[0]]
-
-        # calculate the pooled SD for each measure and add as a new column to each row in the subset dataframe
-        # note that these values will just be identical in every row of the subset dataframe, so that we can use "first" aggregation method
-        for col in sub_df.columns:
-            if col.endswith("_adult_population_variance"):
-                pooled_sd_col_name = "pct_" + col.split("_")[1] + "_pooled_sd"
-                # calculate the pooled SD for each measure
-                # formula = sqrt(sum of variances / sum of adult populations - count of rows)
-                sum_of_variances = np.sum(sub_df[col])
-                sum_of_adult_populations = np.sum(sub_df["adult_population"])
-                count_of_rows = len(sub_df)
-                pooled_sd = np.sqrt(
-                    sum_of_variances / (sum_of_adult_populations - count_of_rows)
-                )
-
-                sub_df[pooled_sd_col_name] = pooled_sd
-                agg_dict[pooled_sd_col_name] = "first"
-
-        # compute population counts by row, only for columns dealing with population percentages
-        for col in sub_df.columns:
-            if (
-                col != "total_population"
-                and col != "adult_population"
-                and col.endswith("pooled_sd") is False
-                and col not in adult_only_cols
-                and col not in moe_cols
-                and col not in non_pop_cols
-                and col not in non_data_cols
-            ):
-                sub_df[col] = sub_df["total_population"] * sub_df[col] / 100
-            elif col in adult_only_cols:
-                sub_df[col] = sub_df["adult_population"] * sub_df[col] / 100
-
-        # in this version of sub_df, some of the columns are population counts and NOT percentages
-        # so now we can use groupby and aggregate the data columns according to the agg_dict functions
-        agg_df = sub_df.groupby("id").agg(agg_dict)
-
-        # convert the columns dealing with population percentages from counts back to percentages
-        for col in agg_df.columns:
-            if (
-                col != "total_population"
-                and col != "adult_population"
-                and col.endswith("pooled_sd") is False
-                and col not in adult_only_cols
-                and col not in moe_cols
-                and col not in non_pop_cols
-                and col not in non_data_cols
-            ):
-                agg_df[col] = round((agg_df[col] / agg_df["total_population"] * 100), 2)
-            elif col in adult_only_cols:
-                agg_df[col] = round((agg_df[col] / agg_df["adult_population"] * 100), 2)
-
-        # calculate the pooled CI for each measure and replace the values in each row in the subset dataframe
-        for col in agg_df.columns:
-            if col.endswith("_high"):
-                # drop the column (it already exists with an incorrect value)
-                agg_df.drop(columns=col, inplace=True)
-                # get the measure name from the column name and set up the new column name
-                measure_name = col.split("_")[1]
-                measure_col_name = "pct_" + measure_name
-                pooled_sd_col_name = measure_col_name + "_pooled_sd"
-                # use first value as pooled SD for each measure
-                pooled_sd = agg_df[pooled_sd_col_name].values[0]
-                # high 90% CI formula: value + (1.64 * (pooled SD / sqrt(adult population)))
-                agg_df[col] = agg_df[measure_col_name] + (
-                    1.64 * (pooled_sd / math.sqrt(agg_df["adult_population"].sum()))
-                )
-            elif col.endswith("_low"):
-                # drop the column (it already exists with an incorrect value)
-                agg_df.drop(columns=col, inplace=True)
-                # get the measure name from the column name and set up the new column name
-                measure_name = col.split("_")[1]
-                measure_col_name = "pct_" + measure_name
-                pooled_sd_col_name = measure_col_name + "_pooled_sd"
-                # use first value as pooled SD for each measure
-                pooled_sd = agg_df[pooled_sd_col_name].values[0]
-                # low 90% CI formula: value - (1.64 * (pooled SD / sqrt(adult population)))
-                agg_df[col] = agg_df[measure_col_name] - (
-                    1.64 * (pooled_sd / math.sqrt(agg_df["adult_population"].sum()))
-                )
-
-        # drop the original duplicated rows
-        df.drop(df[df["id"] == dup[0]].index, inplace=True)
-
-        # add the newly aggregated rows to agg_df_list and concatenate them with the original dataframe
-        agg_df_list.append(agg_df)
-
-        df = pd.concat([df, *agg_df_list])
+        adult_counts = sub_df[adult_cols].mul(sub_df["adult_population"], axis=0) / 100
+        adult_pcts = round(
+            sum_no_nan(adult_counts).div(counts["adult_population"], axis=0) * 100, 2
+        )
+        pcts = pd.concat([pop_pcts, adult_pcts], axis=1)
+
+        # aggregate MOE as defined here: https://www.census.gov/content/dam/Census/library/publications/2018/acs/acs_general_handbook_2018_ch08.pdf
+        moes = np.sqrt(sum_no_nan(sub_df[moe_cols] ** 2))
+
+        # average columns that do not deal with population
+        means = groups[non_pop_cols].mean()
+
+        # calculate the pooled SD and the pooled 90% CI for each measure
+        # pooled SD formula = sqrt(sum of variances / sum of adult populations - count of rows)
+        sum_of_adult_populations = groups["adult_population"].sum()
+        count_of_rows = groups.size()
+        adult_population_sqrt = np.sqrt(counts["adult_population"])
+        cis = {}
+        for col in variance_cols:
+            measure_col_name = "pct_" + col.split("_")[1]
+            pooled_sd = np.sqrt(
+                groups[col].sum() / (sum_of_adult_populations - count_of_rows)
+            )
+            # 90% CI formula: value +/- (1.64 * (pooled SD / sqrt(adult population)))
+            margin = 1.64 * (pooled_sd / adult_population_sqrt)
+            if measure_col_name + "_high" in ci_cols:
+                cis[measure_col_name + "_high"] = pcts[measure_col_name] + margin
+            if measure_col_name + "_low" in ci_cols:
+                cis[measure_col_name + "_low"] = pcts[measure_col_name] - margin
+
+        if ci_method == "monte_carlo":
+            simulated = simulate_intervals(sub_df, keys, n_draws, seed=seed)
+
+        # replace the original duplicated rows with the aggregated rows
+        agg_df = pd.concat([info, counts, pcts, moes, means, pd.DataFrame(cis)], axis=1)
+        agg_df = agg_df.loc[dup_ids].reset_index(drop=True)
+        df = pd.concat([df[~is_dup], agg_df.reindex(columns=df.columns)])
         df.reset_index(drop=True, inplace=True)
 
+    cis = {}
     for col in moe_cols:
         # subtract "_moe" from the col name if that substring is in the col name string
         if "_moe" in col:
@@ -271,11 +196,19 @@ def aggregate_results(results_df):
         high_col_name = measure_name + "_high"
         low_col_name = measure_name + "_low"
         # calculate high and low CI values
-        df[high_col_name] = df[measure_name] + df[col]
-        df[low_col_name] = df[measure_name] - df[col]
-        df[low_col_name] = df[low_col_name].apply(
-            replace_negatives
-        )  # the low CI value cannot go below zero!
+        cis[high_col_name] = df[measure_name] + df[col]
+        # the low CI value cannot go below zero!
+        cis[low_col_name] = (df[measure_name] - df[col]).clip(lower=0)
+    df = pd.concat(
+        [df.drop(columns=list(cis), errors="ignore"), pd.DataFrame(cis)], axis=1
+    )
+
+    # use the simulated CIs for the aggregated rows
+    if simulated is not None:
+        sim_cols = [col for col in simulated.columns if col not in keys]
+        merged = df[keys].merge(simulated, how="left", on=keys, indicator=True)
+        is_simulated = (merged["_merge"] == "both").to_numpy()
+        df.loc[is_simulated, sim_cols] = merged.loc[is_simulated, sim_cols].to_numpy()
 
     # list columns we want to drop from the final results dataframe
     drop_cols = [
@@ -288,11 +221,7 @@ def aggregate_results(results_df):
     df = df.drop(columns=drop_cols)
 
     # round all data columns to 2 decimal places (ie columns not in non_data_cols)
-    for col in df.columns:
-        if col not in non_data_cols:
-            df[col] = round(df[col], 2)
-
-    return df
+    return df.round({col: 2 for col in df.columns if col not in non_data_cols})
 
 
 def create_comment_dict(geoid_lu_df):
@@ -349,89 +278,233 @@ def create_comment_dict(geoid_lu_df):
     return comment_dict
 
 
-def fetch_and_merge(geoid_lu_df, gvv_id, comment_dict):
+def fetch_and_merge(
+    geoid_lu_df,
+    gvv_id,
+    comment_dict,
+    vintages=None,
+    cache_dir=None,
+    max_threads=None,
+    offline=False,
+):
     """Given the lookup table and GVV ID, fetches all data and merges the results into a dataframe.
+    If vintages are given, the results of each vintage are stacked with a "vintage" column.
 
     Args:
         geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs
         gvv_id (str): GVV ID used to look up associated GEOIDFQ(s)
         comment_dict (dictionary): dictionary with GVV ID's as keys and comments as values
+        vintages (list): vintages to fetch (keys of vintage_dict, or current_vintage), defaults to the current vintage only, with no "vintage" column
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        max_threads (int): maximum number of concurrent census requests, see fetch_census_data_and_compute()
+        offline (bool): whether to only use cached responses, see request_json()
     Returns:
         pandas.DataFrame
     """
     geoids = get_standard_geoid_df(geoid_lu_df, gvv_id)
-    dhc = fetch_census_data_and_compute("dhc", gvv_id, geoid_lu_df)
-    acs5 = fetch_census_data_and_compute("acs5", gvv_id, geoid_lu_df)
-    cdc = fetch_cdc_data_and_compute(gvv_id, geoid_lu_df)
-
-    df = (
-        geoids.merge(dhc, how="left", left_on="GEOID", right_on="GEOID")
-        .merge(acs5, how="left", left_on="GEOID", right_on="GEOID")
-        .merge(cdc, how="left", left_on="GEOID", right_on="locationid")
-    )
 
-    # drop locationid column
-    df.drop(columns="locationid", inplace=True)
+    # requests that are the same for several vintages (e.g., the 2020 DHC) are only made once
+    cache = {}
+    vintage_dfs = []
+    for vintage in vintages or [None]:
+        dhc = fetch_census_data_and_compute(
+            "dhc",
+            gvv_id,
+            geoid_lu_df,
+            vintage=vintage,
+            cache=cache,
+            cache_dir=cache_dir,
+            max_threads=max_threads,
+            offline=offline,
+        )
+        acs5 = fetch_census_data_and_compute(
+            "acs5",
+            gvv_id,
+            geoid_lu_df,
+            vintage=vintage,
+            cache=cache,
+            cache_dir=cache_dir,
+            max_threads=max_threads,
+            offline=offline,
+        )
+        cdc = fetch_cdc_data_and_compute(
+            gvv_id,
+            geoid_lu_df,
+            vintage=vintage,
+            cache=cache,
+            cache_dir=cache_dir,
+            offline=offline,
+        )
+
+        # join on integer GEOID keys; the GEOID strings from the lookup table are kept for export
+        df = (
+            geoids.merge(dhc, how="left", on="geoid_key")
+            .merge(acs5, how="left", on="geoid_key")
+            .merge(cdc, how="left", on="geoid_key")
+        )
+        if vintage is not None:
+            df.insert(df.columns.get_loc("GEOID") + 1, "vintage", vintage)
+        vintage_dfs.append(df)
+
+    df = pd.concat(vintage_dfs, ignore_index=True)
+
+    # drop geoid_key column
+    df.drop(columns="geoid_key", inplace=True)
 
     # add comments column and populate from comment dictionary
-    df["comment"] = ""
-    for index, row in df.iterrows():
-        df.loc[index, "comment"] = comment_dict[row["id"]]
+    df["comment"] = df["id"].map(comment_dict)
 
     return df
 
 
-def run_fetch_and_merge(geoid_lu_df):
+def run_fetch_and_merge(
+    geoid_lu_df,
+    reference="fetch",
+    reference_cache="tbl/reference_rows.parquet",
+    vintages=None,
+    cache_dir=None,
+    validate=True,
+    processes=None,
+    max_threads=None,
+    offline=False,
+    state="02",
+):
     """Use multiprocessing to run the fetch and merge functions.
-    Collected results will be concatenated.
+    Collected results will be concatenated. The lookup table is not modified.
+    Several vintages can be fetched in one run; each GVV ID is fetched for all vintages by the same process,
+    so requests that are the same for each vintage are only made once.
 
     Args:
         geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs, census places, and comments
+        reference (str): how to add the state and US reference rows ("AK0" and "US0" for Alaska, see get_reference_ids()):
+            "fetch" to fetch them with the other rows and save them to the reference row cache,
+            "cache" to reuse them from the reference row cache if it matches the current variables (or fetch and save them if not),
+            or "skip" to leave them out (e.g., for neighborhood or incremental runs)
+        reference_cache (str or pathlib.Path): Parquet file of the reference row cache
+        vintages (list): vintages to fetch (keys of vintage_dict, or current_vintage); if given, the results of each vintage are stacked with a "vintage" column
+        cache_dir (str or pathlib.Path): on-disk response cache directory shared between runs (e.g., "tbl/api_cache/"), see request_json()
+        validate (bool): whether to check the census variables and geographies with validate_census_requests() before fetching any data
+            (the endpoint metadata is cached in cache_dir, or in "tbl/api_cache/" if no cache_dir is given)
+        processes (int): number of worker processes, defaults to the number of CPUs
+        max_threads (int): maximum number of concurrent census requests in each worker process, defaults to one per endpoint
+        offline (bool): whether to only use responses from cache_dir (and cached endpoint metadata) without making any requests;
+            a response that is not cached raises an error
+        state (str): 2 digit state FIPS code of the state reference row (a key of state_dict), defaults to "02" for Alaska
     Returns:
         pandas.DataFrame
     """
-    geoid_lu_df = add_ak_us(geoid_lu_df)
+    if reference not in ["fetch", "cache", "skip"]:
+        raise ValueError(
+            f'Unknown reference option: {reference} (use "fetch", "cache", or "skip")'
+        )
+    if offline and cache_dir is None:
+        raise ValueError("Offline mode needs a cache_dir of saved responses")
+
+    ref_ids = get_reference_ids(state)
+    cached_rows = None
+    if reference == "cache":
+        cached_rows = read_reference_cache(reference_cache, vintages)
+        if cached_rows is not None and set(cached_rows["id"]) != set(ref_ids):
+            print(
+                f"Reference row cache at {reference_cache} is for other reference rows, fetching reference rows"
+            )
+            cached_rows = None
+    if reference == "skip" or cached_rows is not None:
+        geoid_lu_df = geoid_lu_df[~geoid_lu_df["id"].isin(ref_ids)]
+    else:
+        geoid_lu_df = add_reference_rows(geoid_lu_df, state)
+
+    # fail before scheduling any fetches if a request would be rejected
+    if validate:
+        validate_census_requests(
+            geoid_lu_df, vintages, cache_dir or "tbl/api_cache/", offline
+        )
 
     # create dict
     comment_dict = create_comment_dict(geoid_lu_df)
     # create a list of tuples to use as arguments in the fetch_and_merge() function
     arg_tuples = []
     for gvv_id in list(geoid_lu_df.id.unique()):
-        arg_tuple = geoid_lu_df, gvv_id, comment_dict
+        arg_tuple = (
+            geoid_lu_df,
+            gvv_id,
+            comment_dict,
+            vintages,
+            cache_dir,
+            max_threads,
+            offline,
+        )
         arg_tuples.append(arg_tuple)
     # collect results from all tuple args
     results = []
-    with Pool() as pool:
+    with Pool(processes) as pool:
         for result in pool.starmap(fetch_and_merge, arg_tuples):
             results.append(result)
+
+    if cached_rows is not None:
+        results.append(cached_rows)
+    elif reference != "skip":
+        write_reference_cache(
+            pd.concat([r for r in results if r["id"].isin(ref_ids).all()]),
+            reference_cache,
+            vintages,
+        )
+
     # concatenate results and return the dataframe
     return pd.concat(results)
 
 
+def get_reference_ids(state="02"):
+    """Get the GVV IDs of the reference rows for a state (the state abbreviation followed by "0", e.g. "AK0") and the US ("US0").
+
+    Args:
+        state (str): 2 digit state FIPS code, a key of state_dict
+    Returns:
+        list of GVV IDs
+    """
+    return [f"{state_dict[state]['abbr']}0", "US0"]
+
+
 def add_ak_us(df):
     """Adds rows to the GVV lookup table for state of Alaska and entire US.
+    The input table is not modified; a new table is returned.
+
     Args:
         geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs, census places, and comments
     Returns:
         pandas.DataFrame
     """
+    return add_reference_rows(df, "02")
+
+
+def add_reference_rows(df, state="02"):
+    """Adds reference rows to the GVV lookup table for a state and entire US (see get_reference_ids()).
+    The input table is not modified; a new table is returned.
+
+    Args:
+        geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs, census places, and comments
+        state (str): 2 digit state FIPS code, a key of state_dict
+    Returns:
+        pandas.DataFrame
+    """
+    state_id, us_id = get_reference_ids(state)
     # fields are: id,name,alt_name,region,country,latitude,longitude,type,GEOIDFQ,PLACENAME,AREATYPE,COMMENT
-    ak_row = [
-        "AK0",
-        "Alaska",
+    state_row = [
+        state_id,
+        state_dict[state]["name"],
         "",
         "",
         "",
         "",
         "",
         "",
-        "0400000US02",
-        "Alaska",
+        f"0400000US{state}",
+        state_dict[state]["name"],
         "State",
         np.nan,
     ]
     us_row = [
-        "US0",
+        us_id,
         "United States",
         "",
         "",
@@ -445,15 +518,216 @@ def add_ak_us(df):
         np.nan,
     ]
 
-    df.loc[len(df.index)] = ak_row
-    df.loc[len(df.index)] = us_row
+    reference_rows = pd.DataFrame([state_row, us_row], columns=df.columns)
+    return pd.concat([df, reference_rows], ignore_index=True)
 
-    return df
+
+def reference_version(vintages=None):
+    """Get a version string for the reference rows, from a hash of the variables and API URLs in the var_dict of each vintage.
+    Any change to var_dict or vintage_dict (e.g., a new survey year or variable), or to the list of vintages, changes the version.
+
+    Args:
+        vintages (list): vintages of the reference rows, defaults to the current vintage only
+    Returns:
+        string of 16 hex characters
+    """
+    if vintages is None:
+        var_json = json.dumps(var_dict, sort_keys=True, default=str)
+    else:
+        var_json = json.dumps(
+            [[vintage, get_var_dict(vintage)] for vintage in vintages],
+            sort_keys=True,
+            default=str,
+        )
+    return hashlib.sha256(var_json.encode()).hexdigest()[:16]
+
+
+def read_reference_cache(cache_path="tbl/reference_rows.parquet", vintages=None):
+    """Read the state of AK and US reference rows from the reference row cache, if it matches the current reference_version().
+
+    Args:
+        cache_path (str or pathlib.Path): Parquet file of the reference row cache
+        vintages (list): vintages of the reference rows, defaults to the current vintage only
+    Returns:
+        pandas.DataFrame of the unaggregated reference rows, or None if the cache does not exist or is out of date
+    """
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        print(f"No reference row cache found at {cache_path}, fetching reference rows")
+        return None
+
+    table = pq.read_table(cache_path)
+    version = (table.schema.metadata or {}).get(b"reference_version", b"").decode()
+    if version != reference_version(vintages):
+        print(
+            f"Reference row cache at {cache_path} is out of date, fetching reference rows"
+        )
+        return None
+
+    return table.to_pandas()
+
+
+def write_reference_cache(df, cache_path="tbl/reference_rows.parquet", vintages=None):
+    """Write unaggregated state of AK and US reference rows to the reference row cache, tagged with the current reference_version().
+
+    Args:
+        df (pandas.DataFrame): reference rows from fetch_and_merge()
+        cache_path (str or pathlib.Path): Parquet file of the reference row cache
+        vintages (list): vintages of the reference rows, defaults to the current vintage only
+    Returns:
+        None
+    """
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"reference_version"] = reference_version(vintages).encode()
+    pq.write_table(
+        table.replace_schema_metadata(metadata), cache_path, compression="zstd"
+    )
+
+
+def _to_int_array(values):
+    """Convert a scalar or array-like of digit strings or numbers to an int64 array. Empty strings are converted to 0."""
+    values = pd.Series(np.atleast_1d(values))
+    return pd.to_numeric(values, errors="coerce").fillna(0).astype("int64").to_numpy()
+
+
+def encode_geoid_key(areatype_str, state, code):
+    """Encode geography codes as fixed-width integer GEOID keys (summary level + state FIPS code + geography code).
+    Integer keys are used to join results from the different APIs and the census polygons, instead of hashing strings.
+
+    Args:
+        areatype_str (str): area type used in API queries, one of the keys in luts.sumlev_dict
+        state (str, int, or array-like): state FIPS code(s), use 0 for areas without a state (ZCTAs and the US)
+        code (str, int, or array-like): geography code(s) in the standard GEOID format (e.g., 9 digit county + tract code)
+    Returns:
+        numpy.ndarray of int64 GEOID keys
+    """
+    sumlev = sumlev_dict[areatype_str]["sumlev"]
+    return (
+        sumlev * geoid_key_sumlev_factor
+        + _to_int_array(state) * geoid_key_state_factor
+        + _to_int_array(code)
+    )
+
+
+def encode_geoidfq(geoidfqs):
+    """Encode fully qualified GEOIDs (e.g., "1400000US02020000500") as fixed-width integer GEOID keys.
+    All GEOIDFQs are parsed at once, and may include any mix of area types.
+
+    Args:
+        geoidfqs (list or pandas.Series): GEOIDFQ strings
+    Returns:
+        numpy.ndarray of int64 GEOID keys
+    """
+    geoidfqs = pd.Series(geoidfqs, dtype=object).astype(str)
+    parts = geoidfqs.str.extract(r"^(\d{3})\d{4}US(\d*)$")
+
+    if parts[0].isna().any():
+        bad = geoidfqs[parts[0].isna()].tolist()
+        raise ValueError(f"Unrecognized GEOIDFQ(s): {bad}")
+
+    sumlev = _to_int_array(parts[0])
+    # ZCTA GEOIDFQs do not include a state FIPS code
+    is_zcta = sumlev == sumlev_dict["zcta"]["sumlev"]
+    state = np.where(is_zcta, 0, _to_int_array(parts[1].str[:2]))
+    code = np.where(is_zcta, _to_int_array(parts[1]), _to_int_array(parts[1].str[2:]))
+
+    return sumlev * geoid_key_sumlev_factor + state * geoid_key_state_factor + code
+
+
+def decode_geoid_key(geoid_keys):
+    """Split integer GEOID keys into their summary level, state FIPS code, and geography code.
+
+    Args:
+        geoid_keys (array-like): int64 GEOID keys
+    Returns:
+        Tuple of int64 arrays: (summary level, state FIPS code, geography code)
+    """
+    geoid_keys = np.asarray(geoid_keys, dtype="int64")
+    sumlev = geoid_keys // geoid_key_sumlev_factor
+    state = (geoid_keys // geoid_key_state_factor) % 100
+    code = geoid_keys % geoid_key_state_factor
+    return sumlev, state, code
+
+
+def geoid_key_to_geoid(geoid_keys):
+    """Restore the standard GEOID strings used in the results tables from integer GEOID keys.
+    These are the 3 digit county code, 5 digit place code or zip code, 9 digit county + tract code,
+    2 digit state FIPS code for the state, and "1" for the US.
+
+    Args:
+        geoid_keys (array-like): int64 GEOID keys
+    Returns:
+        list of GEOID strings
+    """
+    sumlev, state, code = decode_geoid_key(geoid_keys)
+    geoids = np.empty(len(sumlev), dtype=object)
+
+    for areatype_str, level in sumlev_dict.items():
+        mask = sumlev == level["sumlev"]
+        if not mask.any():
+            continue
+        if areatype_str == "us":
+            geoids[mask] = "1"
+        elif areatype_str == "state":
+            geoids[mask] = pd.Series(state[mask]).astype(str).str.zfill(2).to_numpy()
+        else:
+            geoids[mask] = (
+                pd.Series(code[mask])
+                .astype(str)
+                .str.zfill(level["code_width"])
+                .to_numpy()
+            )
+
+    return geoids.tolist()
+
+
+def geoid_key_to_geoidfq(geoid_keys):
+    """Restore fully qualified GEOID strings (e.g., "1400000US02020000500") from integer GEOID keys.
+
+    Args:
+        geoid_keys (array-like): int64 GEOID keys
+    Returns:
+        list of GEOIDFQ strings
+    """
+    sumlev, state, code = decode_geoid_key(geoid_keys)
+    geoidfqs = pd.Series(sumlev).astype(str).str.zfill(3) + "0000US"
+    state_str = pd.Series(state).astype(str).str.zfill(2)
+
+    for areatype_str, level in sumlev_dict.items():
+        mask = sumlev == level["sumlev"]
+        if not mask.any() or areatype_str == "us":
+            continue
+        if areatype_str == "state":
+            geoidfqs[mask] += state_str[mask]
+        else:
+            code_str = pd.Series(code[mask]).astype(str).str.zfill(level["code_width"])
+            if areatype_str != "zcta":
+                code_str = state_str[mask].to_numpy() + code_str
+            geoidfqs[mask] += code_str.to_numpy()
+
+    return geoidfqs.tolist()
+
+
+def get_state_fips(geoid_lu_df, gvv_id):
+    """Get the 2 digit state FIPS code of the census geographies for a given GVV ID (e.g., "02" for Alaska), from its first GEOIDFQ.
+
+    Args:
+        geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs
+        gvv_id (str): GVV ID used to look up associated GEOIDFQ(s)
+    Returns:
+        state FIPS code string, or None for the US and ZCTAs (their GEOIDFQs do not include a state)
+    """
+    geoidfqs = geoid_lu_df.loc[geoid_lu_df["id"] == gvv_id, "GEOIDFQ"]
+    _, state, _ = decode_geoid_key(encode_geoidfq(geoidfqs.iloc[:1]))
+    if state[0] == 0:
+        return None
+    return f"{state[0]:02d}"
 
 
 def get_standard_geoid_df(geoid_lu_df, gvv_id):
-    """Create a simple dataframe of requested GEOIDS, with no state FIPS code.
-    All results tables will be joined to this table.
+    """Create a simple dataframe of requested GEOIDS, with no state FIPS code, and their integer GEOID keys.
+    All results tables will be joined to this table using the GEOID keys.
 
     Args:
         geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs
@@ -472,72 +746,22 @@ def get_standard_geoid_df(geoid_lu_df, gvv_id):
     if len(areatypes) == 0:
         # TODO: raise an error
         print("no associated AREATYPE found!")
-    else:
-        if areatypes[0] == "County":
-            areatype_str = "county"
-        elif areatypes[0] in ["Census designated place", "Incorporated place"]:
-            areatype_str = "place"
-        elif areatypes[0] == "ZCTA":
-            areatype_str = "zcta"
-        elif areatypes[0] == "Census tract":
-            areatype_str = "tract"
-        elif areatypes[0] == "State":
-            areatype_str = "state"
-        elif areatypes[0] == "Nation":
-            areatype_str = "us"
-        else:
-            # TODO: raise an error
-            print("unrecognized AREATYPE!")
-
-    if len(geoidfqs) > 1:
-        if areatype_str == "county":
-            # get last 3 digits as county FIPS code
-            geoid_list = []
-            for geoidfq in geoidfqs:
-                geoid_list.append(geoidfq[-3:])
-        elif areatype_str == "place":
-            # get last 5 digits as place code
-            geoid_list = []
-            for geoidfq in geoidfqs:
-                geoid_list.append(geoidfq[-5:])
-        elif areatype_str == "zcta":
-            # get last 5 digits for zip code
-            geoid_list = []
-            for geoidfq in geoidfqs:
-                geoid_list.append(geoidfq[-5:])
-        elif areatype_str == "tract":
-            # get last 9 digits for county FIPS code + tract code
-            geoid_list = []
-            for geoidfq in geoidfqs:
-                geoid_list.append(geoidfq[-9:])
-
-    elif len(geoidfqs) == 1:
-        if areatype_str == "county":
-            # get last 3 digits as county FIPS code
-            geoid_list = [geoidfqs[0][-3:]]
-        elif areatype_str == "place":
-            # get last 5 digits as place code
-            geoid_list = [geoidfqs[0][-5:]]
-        elif areatype_str == "zcta":
-            # get last 5 digits for zip code
-            geoid_list = [geoidfqs[0][-5:]]
-        elif areatype_str == "tract":
-            # get last 9 digits for county FIPS code + tract code
-            geoid_list = [geoidfqs[0][-9:]]
-        elif areatype_str == "state":
-            # return 2 digit AK FIPs code
-            geoid_list = ["02"]
-        elif areatype_str == "us":
-            # return 1 digit country code
-            geoid_list = ["1"]
+    elif areatypes[0] not in areatype_dict:
+        # TODO: raise an error
+        print("unrecognized AREATYPE!")
 
-    else:
+    if len(geoidfqs) == 0:
         # TODO: raise an error
         print("no associated GEOIDFQs found!")
 
+    # encode all GEOIDFQs as integer keys, then restore the standard GEOID strings from the keys
+    # (3 digit county code, 5 digit place code or zip code, 9 digit county + tract code, 2 digit state FIPS code for a state (e.g., "02" for AK), and "1" for the US)
+    geoid_keys = encode_geoidfq(geoidfqs)
+    geoid_list = geoid_key_to_geoid(geoid_keys)
+
     df = pd.DataFrame(
-        zip(gvv_ids, gvv_names, areatypes, placenames, geoid_list),
-        columns=["id", "name", "areatype", "placename", "GEOID"],
+        zip(gvv_ids, gvv_names, areatypes, placenames, geoid_list, geoid_keys),
+        columns=["id", "name", "areatype", "placename", "GEOID", "geoid_key"],
     )
 
     return df
@@ -611,8 +835,8 @@ def get_cdc_areatype_locationid_list(geoid_lu_df, gvv_id):
             # get last 11 digits as state FIPS + county FIPS code + tract code
             locationid_list = [geoidfqs[0][-11:]]
         elif areatype_str == "state":
-            # return 2 digit AK FIPs code
-            locationid_list = ["02"]
+            # return 2 digit state FIPS code
+            locationid_list = [geoidfqs[0][-2:]]
         elif areatype_str == "us":
             # return 1 digit country code
             locationid_list = ["1"]
@@ -702,8 +926,8 @@ def get_census_areatype_geoid_strings(geoid_lu_df, gvv_id):
             # return as list: tract is a special case that will be checked for in fetch_census_data_and_compute()
             geoidfq_str = [county_geoid, tract_geoid]
         elif areatype_str == "state":
-            # return 2 digit AK FIPs code
-            geoidfq_str = ["02"]
+            # return 2 digit state FIPS code
+            geoidfq_str = [geoidfqs[0][-2:]]
         elif areatype_str == "us":
             # return 1 digit country code
             geoidfq_str = ["1"]
@@ -788,7 +1012,7 @@ def compute_dhc(dhc_data):
 
     return dhc_data[
         [
-            "GEOID",
+            "geoid_key",
             "total_population",
             "pct_65_plus",
             "pct_under_18",
@@ -817,87 +1041,389 @@ def compute_cdc(cdc_data):
     return cdc_data
 
 
-def fetch_census_data_and_compute(survey_id, gvv_id, geoid_lu_df, print_url=False):
-    """Fetch census data from their API. Using the census survey id, joins a base URL to a list of variable codes, area type, and GEOIDFQ(s),
-    and requests the URL. Returns the JSON response. Print an error message if no response.
+def get_var_dict(vintage=None):
+    """Get the var_dict of a vintage, by replacing the entries of var_dict that are listed for the vintage in vintage_dict.
+
+    Args:
+        vintage (int): vintage (a key of vintage_dict, or current_vintage), defaults to the current vintage
+    Returns:
+        dictionary with the same structure as var_dict, where "cdc" is None if the vintage does not list a CDC release in vintage_dict
+    """
+    if vintage is None or vintage == current_vintage:
+        return var_dict
+    if vintage not in vintage_dict:
+        raise ValueError(
+            f"Unknown vintage: {vintage} (use {current_vintage} or one of {list(vintage_dict)})"
+        )
+
+    vintage_var_dict = copy.deepcopy(var_dict)
+    # without its own CDC release, a vintage has no CDC data
+    if "cdc" not in vintage_dict[vintage]:
+        vintage_var_dict["cdc"] = None
+    for survey, entries in vintage_dict[vintage].items():
+        # the survey level of var_dict is nested one level deeper for the CDC datasets
+        if survey == "cdc":
+            for dataset, dataset_entries in entries.items():
+                vintage_var_dict["cdc"][dataset].update(dataset_entries)
+        else:
+            vintage_var_dict[survey].update(entries)
+
+    return vintage_var_dict
+
+
+def request_json(url, cache=None, cache_dir=None, offline=False):
+    """Request a URL and return the JSON response, or None if the response status is not 200.
+    Responses can be reused from an in-memory cache (a dictionary keyed by URL, e.g. shared by the fetches of several vintages
+    for one GVV ID, so that requests that are the same for each vintage are only made once), and from an on-disk cache directory
+    shared between runs. On disk, responses are stored in a directory per endpoint (e.g., "api.census.gov/data/2023/acs/acs5/subject/"),
+    so the cache of each vintage can be cleared separately. API keys are left out of the cache keys.
+    In offline mode, responses are only read from the caches and no requests are made.
+
+    Args:
+        url (str): URL to request
+        cache (dict): in-memory response cache, updated with the response
+        cache_dir (str or pathlib.Path): on-disk response cache directory, updated with the response
+        offline (bool): whether to raise an error instead of making a request if the response is not cached
+    Returns:
+        JSON response (list or dictionary), or None
+    """
+    key = url.replace(census_, "").replace(cdc_, "")
+    if cache is not None and key in cache:
+        return cache[key]
+
+    cache_path = None
+    if cache_dir is not None:
+        parts = urlparse(key)
+        endpoint = parts.path.strip("/").removesuffix(".json")
+        cache_path = Path(
+            cache_dir,
+            parts.netloc,
+            endpoint,
+            hashlib.sha256(key.encode()).hexdigest()[:32] + ".json",
+        )
+
+    if cache_path is not None and cache_path.exists():
+        r_json = json.loads(cache_path.read_text())
+    elif offline:
+        raise ValueError(f"No cached response in offline mode for {key}")
+    else:
+        with requests.get(url) as r:
+            if r.status_code != 200:
+                return None
+            r_json = r.json()
+        if cache_path is not None:
+            # write to a temporary file first, so that other processes never read a partial response
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(r_json))
+            os.replace(tmp_path, cache_path)
+
+    if cache is not None:
+        cache[key] = r_json
+    return r_json
+
+
+def get_census_endpoints(survey_id, survey_dict):
+    """Group the variables of a census survey by the endpoint that serves them.
+    DHC variables all use the survey URL. ACS variables use the endpoint they declare with an "endpoint" key, or else the endpoint
+    of their table ID prefix in acs_endpoint_dict (e.g., detailed tables for "B" variables), so variables from different ACS tables
+    can be listed together under "acs5" in var_dict.
+
+    Args:
+        survey_id (str): census survey id, one of "dhc" or "acs5"
+        survey_dict (dict): survey level of var_dict, e.g. get_var_dict(vintage)["acs5"]
+    Returns:
+        dictionary with endpoint URLs as keys and lists of variable codes as values
+    """
+    endpoints = {}
+    for var, var_info in survey_dict["vars"].items():
+        url = survey_dict["url"]
+        if survey_id == "acs5":
+            endpoint = var_info.get("endpoint")
+            if endpoint is None:
+                prefix = next((p for p in acs_endpoint_dict if var.startswith(p)), None)
+                endpoint = acs_endpoint_dict.get(prefix)
+            if endpoint is not None:
+                # the survey URL may point to any of the ACS endpoints of the vintage
+                acs_root = url.split("/acs/acs5")[0] + "/acs/acs5"
+                url = acs_root + acs_endpoint_paths[endpoint]
+        endpoints.setdefault(url, []).append(var)
+
+    return endpoints
+
+
+def fetch_census_metadata(base_url, cache_dir="tbl/api_cache/", offline=False):
+    """Download the variables.json and geography.json metadata of a census endpoint, and cache the variable names and
+    geographies on disk, once per endpoint (and so once per vintage). Later calls read the cached metadata without any requests.
+
+    Args:
+        base_url (str): URL of the endpoint, e.g. "https://api.census.gov/data/2023/acs/acs5/subject"
+        cache_dir (str or pathlib.Path): cache directory; metadata is written to a "metadata.json" file in the directory of the endpoint
+        offline (bool): whether to raise an error instead of downloading the metadata if it is not cached
+    Returns:
+        dictionary with "variables" (list of variable names) and "geography" (list of geography dictionaries from geography.json) keys
+    """
+    parts = urlparse(base_url)
+    cache_path = Path(cache_dir, parts.netloc, parts.path.strip("/"), "metadata.json")
+    if cache_path.exists():
+        return json.loads(cache_path.read_text())
+    if offline:
+        raise ValueError(f"No cached census metadata in offline mode for {base_url}")
+
+    metadata = {}
+    for name in ["variables", "geography"]:
+        url = f"{base_url}/{name}.json"
+        with requests.get(url) as r:
+            if r.status_code != 200:
+                raise ValueError(
+                    f"Could not download census metadata from {url} (status {r.status_code}), check the URL in luts.py"
+                )
+            metadata[name] = r.json()
+    metadata = {
+        "variables": sorted(metadata["variables"]["variables"]),
+        "geography": metadata["geography"]["fips"],
+    }
+
+    # write to a temporary file first, so that other processes never read partial metadata
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(metadata))
+    os.replace(tmp_path, cache_path)
+
+    return metadata
+
+
+def validate_census_requests(
+    geoid_lu_df, vintages=None, cache_dir="tbl/api_cache/", offline=False
+):
+    """Check the census requests of a run before any data are fetched, using the cached metadata of each endpoint from fetch_census_metadata().
+    Checks that every AREATYPE in the lookup table is recognized, that every variable code in var_dict exists at the endpoint it is
+    fetched from (see get_census_endpoints()), and that the geography clauses used for each area type are supported by each endpoint.
+    All problems are reported at once.
+
+    Args:
+        geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs, census places, and comments
+        vintages (list): vintages to check (keys of vintage_dict, or current_vintage), defaults to the current vintage
+        cache_dir (str or pathlib.Path): metadata cache directory, see fetch_census_metadata()
+        offline (bool): whether to only use cached metadata, see fetch_census_metadata()
+    Returns:
+        None
+    Raises:
+        ValueError listing every problem found
+    """
+    errors = []
+
+    areatypes = set(geoid_lu_df["AREATYPE"].dropna())
+    unknown = sorted(areatypes - set(areatype_dict))
+    if len(unknown) > 0:
+        errors.append(f"unrecognized AREATYPE values in the lookup table: {unknown}")
+    areatype_strs = sorted({areatype_dict[a] for a in areatypes if a in areatype_dict})
+
+    for vintage in vintages or [None]:
+        vintage_var_dict = get_var_dict(vintage)
+        for survey_id in ["dhc", "acs5"]:
+            survey_dict = vintage_var_dict[survey_id]
+            endpoints = get_census_endpoints(survey_id, survey_dict)
+            for base_url, endpoint_vars in endpoints.items():
+                metadata = fetch_census_metadata(base_url, cache_dir, offline)
+                variables = set(metadata["variables"])
+
+                for var in endpoint_vars:
+                    if var in variables:
+                        continue
+                    error = f"{survey_id} variable {var} not found at {base_url}"
+                    if survey_id == "acs5":
+                        # a declared endpoint can disagree with the endpoint of the table ID prefix
+                        prefix = next(
+                            (p for p in acs_endpoint_dict if var.startswith(p)), None
+                        )
+                        endpoint = survey_dict["vars"][var].get("endpoint")
+                        if prefix is not None and endpoint not in [
+                            None,
+                            acs_endpoint_dict[prefix],
+                        ]:
+                            error += f' ({prefix} tables are served by the {acs_endpoint_dict[prefix]} endpoint, but the variable declares "endpoint": "{endpoint}")'
+                    # suggest similar variables of the same table
+                    table = var.split("_")[0] + "_"
+                    close = difflib.get_close_matches(
+                        var, [v for v in variables if v.startswith(table)], n=3
+                    )
+                    if len(close) > 0:
+                        error += f"; did you mean {' or '.join(close)}?"
+                    errors.append(error)
+
+                for areatype_str in areatype_strs:
+                    clause = census_geography_dict[areatype_str]
+                    supported = False
+                    for geo in metadata["geography"]:
+                        requires = set(geo.get("requires") or [])
+                        allowed = requires | set(geo.get("wildcard") or [])
+                        if (
+                            geo["name"] == clause["for"]
+                            and requires <= set(clause["in"]) <= allowed
+                        ):
+                            supported = True
+                            break
+                    if not supported:
+                        in_str = "".join(f"&in={g}" for g in clause["in"])
+                        errors.append(
+                            f"{survey_id} geography for={clause['for']}{in_str} (used for {areatype_str}) is not supported at {base_url}"
+                        )
+
+    if len(errors) > 0:
+        raise ValueError(
+            "Census requests failed validation, no data were fetched:\n"
+            + "\n".join(f"- {e}" for e in errors)
+        )
+
+
+def get_census_rename_dict(survey_dict):
+    """Map the variable codes of a census survey to their short names, for the variables that have one.
+
+    Args:
+        survey_dict (dict): survey level of var_dict, e.g. get_var_dict(vintage)["acs5"]
+    Returns:
+        dictionary with variable codes as keys and short names as values
+    """
+    return {
+        var: var_info["short_name"]
+        for var, var_info in survey_dict["vars"].items()
+        if "short_name" in var_info
+    }
+
+
+def decode_census_response(r_json, areatype_str, rename_dict=None):
+    """Convert a census API response (a header row followed by one row of strings per geography) to a table of floats keyed by integer GEOID keys.
+    The variable columns are converted to one float array at once, and negative values are changed to NA for the whole array:
+    -666666666 is a commonly used nodata value, but there may be others. Assume all zero values and positive values are valid.
+
+    Args:
+        r_json (list): census API response from request_json()
+        areatype_str (str): area type used in the API query, one of the keys in luts.sumlev_dict
+        rename_dict (dict): variable codes and their short names from get_census_rename_dict(), other columns keep their codes
+    Returns:
+        pandas.DataFrame with a column per variable and a "geoid_key" column
+    """
+    header = r_json[0]
+    rows = np.array(r_json[1:], dtype=object).reshape(len(r_json) - 1, len(header))
+    # geography codes are always digit strings
+    geo_cols = {
+        c: rows[:, i].astype("int64")
+        for i, c in enumerate(header)
+        if c in census_geo_cols
+    }
+    data_idx = [i for i, c in enumerate(header) if c not in census_geo_cols]
+
+    data = rows[:, data_idx].astype(float)
+    data[data < 0] = np.nan
+
+    # encode the geography columns as integer GEOID keys for joining
+    # tract codes are the 3 digit county code followed by the 6 digit tract code, the standard 9 digit tract code
+    if areatype_str == "tract":
+        code = geo_cols["county"] * 10**6 + geo_cols["tract"]
+    elif areatype_str == "zcta":
+        code = geo_cols["zip code tabulation area"]
+    elif areatype_str in ["place", "county"]:
+        code = geo_cols[areatype_str]
+    else:
+        code = 0
+    state = geo_cols.get("state", 0)
+
+    rename_dict = rename_dict or {}
+    df = pd.DataFrame(
+        data, columns=[rename_dict.get(header[i], header[i]) for i in data_idx]
+    )
+    df["geoid_key"] = encode_geoid_key(areatype_str, state, code)
+    return df
+
+
+def fetch_census_data_and_compute(
+    survey_id,
+    gvv_id,
+    geoid_lu_df,
+    print_url=False,
+    vintage=None,
+    cache=None,
+    cache_dir=None,
+    max_threads=None,
+    offline=False,
+):
+    """Fetch census data from their API. Using the census survey id, joins the base URL of each endpoint to a list of variable codes, area type, and GEOIDFQ(s),
+    and requests the URLs. Variables are grouped by endpoint with get_census_endpoints(), and groups are requested concurrently and joined on
+    the GEOID keys of the geographies. Print an error message if no response.
 
     Args:
         survey_id (str): census survey id, one of "dhc" or "acs5"
         gvvid (str): GVV ID used to look up associated GEOIDFQ(s) and fetch data
         geoid_lu_df (pandas.DataFrame): lookup table with GVV IDs and GEOIDFQs
         print (bool): whether or not to print URLs for QC
+        vintage (int): vintage to fetch (a key of vintage_dict), defaults to the current vintage
+        cache (dict): in-memory response cache, see request_json()
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        max_threads (int): maximum number of concurrent requests, defaults to one per URL
+        offline (bool): whether to only use cached responses, see request_json()
     Returns:
         pandas.DataFrame
     """
+    survey_dict = get_var_dict(vintage)[survey_id]
+
     # get strings to build URL
-    base_url = var_dict[survey_id]["url"]
-    var_str = (",").join(list(var_dict[survey_id]["vars"].keys()))
     areatype_str, geoidfq_str = get_census_areatype_geoid_strings(geoid_lu_df, gvv_id)
+    state = get_state_fips(geoid_lu_df, gvv_id)
 
-    # exclude state code from query if ZCTA
-    if areatype_str == "zcta":
-        url = f"{base_url}?get={var_str}&for={areatype_str}:{geoidfq_str}&key={census_}"
-    # separate list to get county and tract strings, include state FIPS code "02" for Alaska
+    # exclude state code from query if ZCTA (the area type is URL encoded at this point)
+    if areatype_str == "zip%20code%20tabulation%20area":
+        geo_str = f"for={areatype_str}:{geoidfq_str}"
+    # separate list to get county and tract strings, include state FIPS code (e.g., "02" for Alaska)
     elif areatype_str == "tract":
-        url = f"{base_url}?get={var_str}&for={areatype_str}:{geoidfq_str[1]}&in=state:02&in=county:{geoidfq_str[0]}&key={census_}"
-    # for statewide data, do not use geoid strings
+        geo_str = f"for={areatype_str}:{geoidfq_str[1]}&in=state:{state}&in=county:{geoidfq_str[0]}"
+    # for statewide data, use the state FIPS code
     elif areatype_str == "state":
-        url = f"{base_url}?get={var_str}&for=state:02&key={census_}"
+        geo_str = f"for=state:{state}"
     # for us data, do not use geoid strings
     elif areatype_str == "us":
-        url = f"{base_url}?get={var_str}&for=us&key={census_}"
-    # otherwise (for places and counties) include state FIPS code "02" for Alaska
+        geo_str = "for=us"
+    # otherwise (for places and counties) include state FIPS code, if the GEOIDFQs have one
+    elif state is None:
+        geo_str = f"for={areatype_str}:{geoidfq_str}"
     else:
-        url = f"{base_url}?get={var_str}&for={areatype_str}:{geoidfq_str}&in=state:02&key={census_}"
+        geo_str = f"for={areatype_str}:{geoidfq_str}&in=state:{state}"
+
+    # one URL per endpoint, or several if an endpoint has more variables than one request allows
+    urls = []
+    for base_url, endpoint_vars in get_census_endpoints(survey_id, survey_dict).items():
+        for i in range(0, len(endpoint_vars), census_max_vars):
+            var_str = (",").join(endpoint_vars[i : i + census_max_vars])
+            urls.append(f"{base_url}?get={var_str}&{geo_str}&key={census_}")
 
     if print_url:
-        print(f"Requesting US Census data from: {url}")
+        for url in urls:
+            print(f"Requesting US Census data from: {url}")
+
+    # request the data concurrently, raise error if not returned
+    with ThreadPoolExecutor(
+        max_workers=min(len(urls), max_threads or len(urls))
+    ) as executor:
+        responses = list(
+            executor.map(lambda url: request_json(url, cache, cache_dir, offline), urls)
+        )
 
-    # request the data, raise error if not returned
-    with requests.get(url) as r:
-        if r.status_code != 200:
-            # TODO: raise error?
-            print(f"No response from {survey_id} for {gvv_id}, check your URL: {url}")
-        else:
-            r_json = r.json()
+    # the ZCTA area type is URL encoded for the query
+    if areatype_str == "zip%20code%20tabulation%20area":
+        areatype_str = "zcta"
 
-    # convert to dataframe and reformat
-    df = pd.DataFrame(r_json[1:], columns=r_json[0])
+    # use short names for variables columns if they exist in the dict
+    rename_dict = get_census_rename_dict(survey_dict)
 
-    # rename geo column depending on areatype
-    if areatype_str == "tract":
-        df["GEOID"] = (
-            df["county"] + df["tract"]
-        )  # concatenate columns to get standard 9 digit tract code
-        df.drop(columns=["state", "county", "tract"], inplace=True)
-    else:
-        geolist = ["place", "county", "zip code tabulation area"]
-        for c in df.columns:
-            if c in geolist:
-                df.rename(columns={c: "GEOID"}, inplace=True)
-            if c == "state" and areatype_str != "state":
-                df.drop(columns="state", inplace=True)
-            if c == "state" and areatype_str == "state":
-                df.rename(columns={c: "GEOID"}, inplace=True)
-            if c == "us" and areatype_str == "us":
-                df.rename(columns={c: "GEOID"}, inplace=True)
-
-    # convert non-GEOID columns to floats, and change any negative data values to NA...
-    # -6666666 is a commonly used nodata value, but there may be others. Assume all zero values and positive values are valid.
-    for c in df.columns:
-        if c != "GEOID":
-            df[c] = df[c].astype(float)
-            df[c].where(df[c] >= 0, np.nan, inplace=True)
+    dfs = []
+    for url, r_json in zip(urls, responses):
+        if r_json is None:
+            # TODO: raise error?
+            print(f"No response from {survey_id} for {gvv_id}, check your URL: {url}")
+        dfs.append(decode_census_response(r_json, areatype_str, rename_dict))
 
-    # use short names for variables columns if they exist in the dict
-    new_cols_dict = {}
-    for col in df.columns:
-        try:
-            new_col = var_dict[survey_id]["vars"][col]["short_name"]
-            new_cols_dict[col] = new_col
-        except:
-            new_cols_dict[col] = col
-    df.rename(columns=new_cols_dict, inplace=True)
+    # join the variables from each endpoint on the geographies
+    df = reduce(lambda x, y: x.merge(y, how="outer", on="geoid_key"), dfs)
 
     # compute tables based on survey id
     if survey_id == "dhc":
@@ -906,7 +1432,93 @@ def fetch_census_data_and_compute(survey_id, gvv_id, geoid_lu_df, print_url=Fals
         return compute_acs5(df)
 
 
-def fetch_cdc_data_and_compute(gvv_id, geoid_lu_df, print_url=False):
+def get_cdc_rename_dict(cdc_dict, survey):
+    """Map the (value field, measure ID) columns of a pivoted CDC response to their short names:
+    the short names in var_dict for data values, and the names in ci_dict for confidence limits and MOEs.
+
+    Args:
+        cdc_dict (dict): "cdc" level of var_dict, e.g. get_var_dict(vintage)["cdc"]
+        survey (str): CDC dataset, one of "PLACES" or "SDOH"
+    Returns:
+        dictionary with (value field, measure ID) tuples as keys and short names as values, in the order of the output columns
+    """
+    survey_vars = cdc_dict[survey]["vars"]
+    rename_dict = {}
+    # columns are ordered like the pivot: each value field, with the measure IDs in sorted order
+    for field, suffix in cdc_value_fields[survey].items():
+        for measureid in sorted(survey_vars):
+            if suffix is None:
+                rename_dict[(field, measureid)] = survey_vars[measureid]["short_name"]
+            else:
+                rename_dict[(field, measureid)] = ci_dict[f"{measureid}_{suffix}"]
+    return rename_dict
+
+
+def empty_cdc_frame(locationid_list, rename_dict):
+    """Build the table of a CDC dataset with no data for the requested locations, with the same columns as reshape_cdc_response().
+
+    Args:
+        locationid_list (list): locationids of the request
+        rename_dict (dict): column names from get_cdc_rename_dict()
+    Returns:
+        pandas.DataFrame with a "locationid" column and an empty column for each short name
+    """
+    return pd.DataFrame({"locationid": locationid_list}).reindex(
+        columns=["locationid"] + list(rename_dict.values())
+    )
+
+
+def reshape_cdc_response(r_json, survey, rename_dict):
+    """Reshape a CDC API response (one record per location and measure) to a wide table with one row per location.
+    All value fields are pivoted together: they are scattered into a single (location, field, measure) array, with negative nodata values masked,
+    and the flattened columns are named from the precomputed rename_dict. Measures that are missing from the response are left empty.
+
+    Args:
+        r_json (list): CDC API response from request_json()
+        survey (str): CDC dataset, one of "PLACES" or "SDOH"
+        rename_dict (dict): column names from get_cdc_rename_dict()
+    Returns:
+        tuple of a pandas.DataFrame indexed by locationid with a column per short name, and a pandas.Series of the total population of each location
+    """
+    fields = list(cdc_value_fields[survey])
+    measureids = pd.Index(dict.fromkeys(measureid for _, measureid in rename_dict))
+
+    df = pd.DataFrame(
+        r_json, columns=["locationid", "measureid", "totalpopulation"] + fields
+    )
+    loc_codes, locationids = pd.factorize(df["locationid"], sort=True)
+    meas_codes = measureids.get_indexer(df["measureid"])
+    values = df[fields].to_numpy(dtype=float)
+    values[values < 0] = np.nan
+
+    # pivot: one row per location, and one block of measure columns per field
+    keep = meas_codes >= 0
+    wide = np.full((len(locationids), len(fields), len(measureids)), np.nan)
+    wide[loc_codes[keep], :, meas_codes[keep]] = values[keep]
+    index = pd.Index(locationids, name="locationid")
+    df_wide = pd.DataFrame(
+        wide.reshape(len(locationids), -1),
+        index=index,
+        columns=[rename_dict[(f, m)] for f in fields for m in measureids],
+    )
+
+    # the total population is the same in every record of a location
+    first = np.unique(loc_codes, return_index=True)[1]
+    population = pd.Series(
+        df["totalpopulation"].to_numpy()[first].astype(float), index=index
+    )
+    return df_wide[list(rename_dict.values())], population
+
+
+def fetch_cdc_data_and_compute(
+    gvv_id,
+    geoid_lu_df,
+    print_url=False,
+    vintage=None,
+    cache=None,
+    cache_dir=None,
+    offline=False,
+):
     """Fetch CDC data from their API. Depending on the geography, joins a base URL to a individual variable codes and locationid(s),
     and requests the URL. Returns the JSON response. Print an error message if no response.
 
@@ -914,34 +1526,55 @@ def fetch_cdc_data_and_compute(gvv_id, geoid_lu_df, print_url=False):
         gvvid (str): GVV ID used to look up associated GEOIDFQ(s) and fetch data
         geoid_lu_df (pandas.DataFrame): lookup table with GVV IDs and GEOIDFQs
         print (bool): whether or not to print URLs for QC
+        vintage (int): vintage to fetch (a key of vintage_dict), defaults to the current vintage
+        cache (dict): in-memory response cache, see request_json()
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        offline (bool): whether to only use cached responses, see request_json()
     Returns:
-        pandas.DataFrame
+        pandas.DataFrame, with empty CDC columns for a vintage without a CDC release in vintage_dict
     """
+    cdc_dict = get_var_dict(vintage)["cdc"]
+
     # get strings to build URL
     areatype_str, locationid_list = get_cdc_areatype_locationid_list(
         geoid_lu_df, gvv_id
     )
 
+    # vintages without their own CDC release get empty CDC columns instead of the current release
+    if cdc_dict is None:
+        if print_url:
+            print(
+                f"No CDC release listed for vintage {vintage}, returning empty CDC data"
+            )
+        results = [
+            empty_cdc_frame(
+                locationid_list, get_cdc_rename_dict(var_dict["cdc"], survey)
+            )
+            for survey in ["PLACES", "SDOH"]
+        ]
+        return merge_cdc_results(results, areatype_str)
+
     # get base urls based on area type
-    places_base_url = var_dict["cdc"]["PLACES"]["url"][areatype_str]
-    sdoh_base_url = var_dict["cdc"]["SDOH"]["url"][areatype_str]
+    places_base_url = cdc_dict["PLACES"]["url"][areatype_str]
+    sdoh_base_url = cdc_dict["SDOH"]["url"][areatype_str]
 
     # combine variable strings into comma separated string of strings for SoQL query
     places_var_string = (",").join(
-        [f"'{x}'" for x in list(var_dict["cdc"]["PLACES"]["vars"].keys())]
+        [f"'{x}'" for x in list(cdc_dict["PLACES"]["vars"].keys())]
     )
     sdoh_var_string = (",").join(
-        [f"'{x}'" for x in list(var_dict["cdc"]["SDOH"]["vars"].keys())]
+        [f"'{x}'" for x in list(cdc_dict["SDOH"]["vars"].keys())]
     )
 
     # construct SoQL query based on area type
     if areatype_str == "state":
+        state_name = state_dict[locationid_list[0]]["name"]
         if use_cdc_token:
-            places_url = f"{places_base_url}?$$app_token={cdc_}$where=statedesc IN ('Alaska') AND measureid IN ({places_var_string}) AND datavaluetypeid IN ('CrdPrv')&$limit=1000000"
-            sdoh_url = f"{sdoh_base_url}?$$app_token={cdc_}$where=statedesc IN ('Alaska') AND measureid IN ({sdoh_var_string})&$limit=1000000"
+            places_url = f"{places_base_url}?$$app_token={cdc_}$where=statedesc IN ('{state_name}') AND measureid IN ({places_var_string}) AND datavaluetypeid IN ('CrdPrv')&$limit=1000000"
+            sdoh_url = f"{sdoh_base_url}?$$app_token={cdc_}$where=statedesc IN ('{state_name}') AND measureid IN ({sdoh_var_string})&$limit=1000000"
         else:
-            places_url = f"{places_base_url}?$where=statedesc IN ('Alaska') AND measureid IN ({places_var_string}) AND datavaluetypeid IN ('CrdPrv')&$limit=1000000"
-            sdoh_url = f"{sdoh_base_url}?$where=statedesc IN ('Alaska') AND measureid IN ({sdoh_var_string})&$limit=1000000"
+            places_url = f"{places_base_url}?$where=statedesc IN ('{state_name}') AND measureid IN ({places_var_string}) AND datavaluetypeid IN ('CrdPrv')&$limit=1000000"
+            sdoh_url = f"{sdoh_base_url}?$where=statedesc IN ('{state_name}') AND measureid IN ({sdoh_var_string})&$limit=1000000"
 
     elif areatype_str == "us":
         if use_cdc_token:
@@ -962,214 +1595,79 @@ def fetch_cdc_data_and_compute(gvv_id, geoid_lu_df, print_url=False):
             places_url = f"{places_base_url}?$where=measureid IN ({places_var_string}) AND datavaluetypeid IN ('CrdPrv') AND locationid IN ({locationid_string})"
             sdoh_url = f"{sdoh_base_url}?$where=measureid IN ({sdoh_var_string}) AND locationid IN ({locationid_string})"
 
+        # there is one row per location and measure, and Socrata only returns the first 1000 rows unless a $limit is given
+        # (batches of many locations, e.g. from run_national(), need more; smaller queries are left as-is so cached responses are reused)
+        places_rows = len(locationid_list) * len(cdc_dict["PLACES"]["vars"])
+        sdoh_rows = len(locationid_list) * len(cdc_dict["SDOH"]["vars"])
+        if places_rows > cdc_default_limit:
+            places_url += f"&$limit={places_rows}"
+        if sdoh_rows > cdc_default_limit:
+            sdoh_url += f"&$limit={sdoh_rows}"
+
     # collect separate results for PLACES and SDOH datasets
     results = []
 
     for url, survey in zip([places_url, sdoh_url], ["PLACES", "SDOH"]):
         if print_url:
             print(f"Requesting CDC {survey} data from: {url}")
-        with requests.get(url) as r:
-            if r.status_code != 200:
-                print(f"No response from {survey} for {gvv_id}, check your URL: {url}")
-            else:
-                r_json = r.json()
-
-        # convert to dataframe and reformat to wide
-        if len(r_json) == 0 and survey == "PLACES":  # test for empty returns
-            cols = [
-                "pct_asthma",
-                "pct_asthma_low",
-                "pct_asthma_high",
-                "pct_hd",
-                "pct_hd_low",
-                "pct_hd_high",
-                "pct_copd",
-                "pct_copd_low",
-                "pct_copd_high",
-                "pct_diabetes",
-                "pct_diabetes_low",
-                "pct_diabetes_high",
-                "pct_mh",
-                "pct_mh_low",
-                "pct_mh_high",
-                "pct_stroke",
-                "pct_stroke_low",
-                "pct_stroke_high",
-                "pct_foodstamps",
-                "pct_foodstamps_low",
-                "pct_foodstamps_high",
-                "pct_emospt",
-                "pct_emospt_low",
-                "pct_emospt_high",
-            ]
-            empty_df = pd.concat(
-                [
-                    pd.DataFrame(data=locationid_list, columns=["locationid"]),
-                    pd.DataFrame(columns=cols),
-                ]
-            )
-            if print_url:
-                print(
-                    f"Returning empty CDC PLACES dataframe for location: {locationid_list}"
-                )
-            results.append(empty_df)
-            continue
-        elif len(r_json) == 0 and survey == "SDOH":  # test for empty returns
-            cols = [
-                "pct_no_bband",
-                "pct_no_hsdiploma",
-                "pct_below_150pov",
-                "pct_minority",
-                "pct_crowding",
-                "pct_hcost",
-                "pct_single_parent",
-                "pct_unemployed",
-            ]
-            empty_df = pd.concat(
-                [
-                    pd.DataFrame(data=locationid_list, columns=["locationid"]),
-                    pd.DataFrame(columns=cols),
-                ]
-            )
+        r_json = request_json(url, cache, cache_dir, offline)
+        if r_json is None:
+            print(f"No response from {survey} for {gvv_id}, check your URL: {url}")
+
+        rename_dict = get_cdc_rename_dict(cdc_dict, survey)
+        if len(r_json) == 0:  # test for empty returns
             if print_url:
                 print(
-                    f"Returning empty CDC SDOH dataframe for location: {locationid_list}"
+                    f"Returning empty CDC {survey} dataframe for location: {locationid_list}"
                 )
-            results.append(empty_df)
+            results.append(empty_cdc_frame(locationid_list, rename_dict))
             continue
-        else:
-            df = pd.DataFrame(r_json)
 
-        if survey == "PLACES":
-
-            df.rename(
-                columns={
-                    "low_confidence_limit": "low",
-                    "high_confidence_limit": "high",
-                },
-                inplace=True,
-            )
-
-            # add confidence intervals to PLACES dataframe only
-            # pivot data values for measures in wide format
-            df_wide = (
-                df[["locationid", "measureid", "data_value"]]
-                .pivot(columns=["measureid"], index="locationid", values="data_value")
-                .reset_index()
-                .merge(
-                    df[["locationid", "totalpopulation"]].drop_duplicates(),
-                    on="locationid",
-                )
-            )
-            # pivot confidence intervals in separate dataframe and combine measureid name with confidence interval name for new column names
-            df_ci = df[
-                [
-                    "locationid",
-                    "measureid",
-                    "low",
-                    "high",
-                ]
-            ].pivot(
-                columns=["measureid"],
-                index="locationid",
-                values=["low", "high"],
-            )
-            new_cols = []
-            for col_1, col_0 in zip(
-                df_ci.columns.get_level_values(1), df_ci.columns.get_level_values(0)
-            ):
-                new_cols.append(f"{col_1}_{col_0}")
-            df_ci.columns = new_cols
-
-            # merge wide data with confidence interval dataframe
-            df_wide = df_wide.merge(df_ci, on="locationid")
-
-            df_wide["totalpopulation"] = df_wide["totalpopulation"].astype(float)
-
-        else:  # SDOH data
-            df_wide = (
-                df[["locationid", "measureid", "data_value"]]
-                .pivot(columns=["measureid"], index="locationid", values="data_value")
-                .reset_index()
-                .merge(
-                    df[["locationid", "totalpopulation"]].drop_duplicates(),
-                    on="locationid",
-                )
-            )
-
-            # pivot moe in separate dataframe and combine measureid name with moe name for new column names
-            df_moe = df[
-                [
-                    "locationid",
-                    "measureid",
-                    "moe",
-                ]
-            ].pivot(
-                columns=["measureid"],
-                index="locationid",
-                values=["moe"],
-            )
-            new_cols = []
-            for col_1, col_0 in zip(
-                df_moe.columns.get_level_values(1), df_moe.columns.get_level_values(0)
-            ):
-                new_cols.append(f"{col_1}_{col_0}")
-            df_moe.columns = new_cols
-
-            # merge wide data with confidence interval dataframe
-            df_wide = df_wide.merge(df_moe, on="locationid")
-
-            df_wide["totalpopulation"] = df_wide["totalpopulation"].astype(float)
-
-        # change any negative data values to NA
-        # nodata values are also introduced above for any empty returns
-        # at the same time, rename columns using short names from var_dict or ci_dict
-        for c in df_wide.columns:
-            if c not in ["locationid", "totalpopulation"]:
-                df_wide[c] = df_wide[c].astype(float)
-                df_wide[c].where(df_wide[c] >= 0, np.nan, inplace=True)
-                try:
-                    short_name = var_dict["cdc"][survey]["vars"][c]["short_name"]
-                except:
-                    short_name = ci_dict[c]
-                df_wide.rename(columns={c: short_name}, inplace=True)
+        df_wide, population = reshape_cdc_response(r_json, survey, rename_dict)
 
         # if state or US, do the aggregation math
         if areatype_str in ["us", "state"]:
             # set standard location ids
             if areatype_str == "us":
-                df_wide["locationid"] = "1"
+                locationid = "1"
             if areatype_str == "state":
-                df_wide["locationid"] = "02"
-
-            # compute population counts by row
-            for c in df_wide.columns:
-                if c not in ["locationid", "totalpopulation"]:
-                    df_wide[c] = (
-                        df_wide["totalpopulation"] * df_wide[c] / 100
-                    )  # <<< in this temporary version of df, the columns are population counts and NOT percentages
-            # groupby and sum the data columns
-            agg_df = df_wide.groupby("locationid").sum()
-            # then convert back to percentages
-            for c in agg_df.columns:
-                if c not in ["locationid", "totalpopulation"]:
-                    agg_df[c] = round((agg_df[c] / agg_df["totalpopulation"] * 100), 2)
-            results.append(agg_df.reset_index(drop=False))
+                locationid = locationid_list[0]
 
-        else:
-            results.append(df_wide)
+            # compute population counts by row, sum them, then convert back to percentages
+            counts = df_wide.mul(population, axis=0) / 100
+            counts = counts.groupby(np.full(len(counts), locationid)).sum()
+            df_wide = round(counts.div(population.sum(), axis=0) * 100, 2)
+            df_wide.index.name = "locationid"
 
-    for df in results:
-        if "totalpopulation" in df.columns:
-            df.drop(columns="totalpopulation", inplace=True)
-            df.columns.name = ""
+        results.append(df_wide.reset_index())
 
+    return merge_cdc_results(results, areatype_str)
+
+
+def merge_cdc_results(results, areatype_str):
+    """Merge the wide tables of the CDC datasets on their locationids, and replace the locationids with integer GEOID keys.
+
+    Args:
+        results (list): tables of the CDC datasets with a "locationid" column
+        areatype_str (str): area type used in the CDC queries
+    Returns:
+        pandas.DataFrame
+    """
     out_df = reduce(lambda x, y: x.merge(y, on="locationid"), results)
 
-    # standardize locationid to match geoids for joining later on
-    # removes state FIPS for county, place, and tract; should not affect zip codes
-    for idx, row in out_df.iterrows():
-        if row.locationid.startswith("02") and len(row.locationid) > 2:
-            out_df.loc[idx, "locationid"] = row.locationid[2:]
+    # encode locationids as integer GEOID keys for joining later on
+    # locationids include the state FIPS for county, place, and tract; zip codes, the state, and the US do not
+    locationids = out_df["locationid"].astype(str)
+    if areatype_str in ["county", "place", "tract"]:
+        out_df["geoid_key"] = encode_geoid_key(
+            areatype_str, locationids.str[:2], locationids.str[2:]
+        )
+    elif areatype_str == "state":
+        out_df["geoid_key"] = encode_geoid_key(areatype_str, locationids, 0)
+    elif areatype_str == "zcta":
+        out_df["geoid_key"] = encode_geoid_key(areatype_str, 0, locationids)
+    else:
+        out_df["geoid_key"] = encode_geoid_key(areatype_str, 0, 0)
+    out_df.drop(columns="locationid", inplace=True)
 
     return compute_cdc(out_df)
@@ -0,0 +1,317 @@
+"""
+This is used to look up communities and census geographies from arbitrary coordinates (e.g., a point clicked on a map), without a GVV ID.
+Lookups can be run in-process with lookup_coordinates(), or behind a local HTTP server with serve_lookup().
+"""
+
+import json
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+from scipy.spatial import cKDTree
+from pyproj import Transformer
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from utilities.luts import *
+from utilities.functions import decode_geoid_key, geoid_key_to_geoidfq
+from utilities.export import read_results, select_vintage
+from utilities.polygons import load_census_polygons, explode_results_geoids
+from utilities.name_search import search_names
+
+# mean radius of the earth in km
+earth_radius_km = 6371.0088
+
+
+def _unit_vectors(lats, lons):
+    """Convert latitude and longitude in degrees to 3D unit vectors. Euclidean nearest neighbors of these vectors are the great circle nearest neighbors."""
+    lats = np.radians(np.asarray(lats, dtype="float64"))
+    lons = np.radians(np.asarray(lons, dtype="float64"))
+    return np.column_stack(
+        [np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)]
+    )
+
+
+def _check_lookup_args(lats, lons, k):
+    """Raise a ValueError if the coordinates are not finite numbers or k is less than 1, before they are passed to the spatial indexes."""
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    if np.shape(lats) != np.shape(lons):
+        raise ValueError("lats and lons must have the same length")
+    if not (np.isfinite(lats).all() and np.isfinite(lons).all()):
+        raise ValueError("lats and lons must be finite numbers")
+
+
+def _records(df):
+    """Convert a DataFrame to a list of dictionaries with missing values as None, so they can be written as JSON."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def build_lookup_index(
+    points_path="tbl/alaska_point_locations.csv",
+    results_path="tbl/data_to_export.parquet",
+    shp_dir="shp/",
+    store_path="shp/census_polygons.parquet",
+    vintage=None,
+):
+    """Load the community points, census polygons, and results table, and build the spatial indexes used for coordinate lookups.
+    Community points are indexed in a KD-tree of 3D unit vectors, so nearest neighbors are found by great circle distance.
+    Census polygons are indexed in an STRtree. Each polygon is matched to the results row of the GVV ID that uses only that geography, if there is one.
+
+    Args:
+        points_path (str or pathlib.Path): point locations CSV
+        results_path (str or pathlib.Path): results table written by export_results() (Parquet) or data_to_export.csv
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+        store_path (str or pathlib.Path): GeoParquet geometry store path
+        vintage (int): vintage of the demographics, if the results table has several vintages; defaults to the latest vintage
+    Returns:
+        dictionary of the lookup index, to pass to lookup_coordinates()
+    """
+    points = pd.read_csv(points_path)
+    points = points[["id", "name", "alt_name", "latitude", "longitude"]].reset_index(
+        drop=True
+    )
+
+    if str(results_path).endswith(".parquet"):
+        results = read_results(results_path)
+    else:
+        results = pd.read_csv(results_path, dtype={"GEOID": str})
+    results = results.reset_index(drop=True)
+
+    # results with several vintages use the rows of one vintage, so each GVV ID has one row
+    results = select_vintage(results, vintage)
+
+    # only use results rows that represent a single census geography
+    geoids = explode_results_geoids(results)
+    single = geoids[~geoids["id"].duplicated(keep=False)]
+    single = single.drop_duplicates("geoid_key")
+    row_by_key = pd.Series(
+        results.reset_index().set_index("id").loc[single["id"], "index"].to_numpy(),
+        index=single["geoid_key"].to_numpy(),
+    )
+
+    polys = load_census_polygons(shp_dir, store_path).reset_index(drop=True)
+    sumlev, _, _ = decode_geoid_key(polys["geoid_key"])
+    areatype = pd.Series(None, index=polys.index, dtype=object)
+    areatype[sumlev == sumlev_dict["county"]["sumlev"]] = "County"
+    areatype[sumlev == sumlev_dict["tract"]["sumlev"]] = "Census tract"
+    is_place = sumlev == sumlev_dict["place"]["sumlev"]
+    areatype[is_place] = polys.loc[is_place, "classfp"].map(place_classfp_dict)
+    polys["AREATYPE"] = areatype
+    polys = polys[polys["AREATYPE"].notna()].reset_index(drop=True)
+    polys["GEOIDFQ"] = geoid_key_to_geoidfq(polys["geoid_key"])
+    polys["rank"] = polys["AREATYPE"].map(areatype_preference.index)
+    polys["results_row"] = polys["geoid_key"].map(row_by_key).fillna(-1).astype(int)
+
+    polys = polys.rename(columns={"placename": "PLACENAME"})
+    # geographies with a results row come first, then by areatype preference
+    priority = (polys["results_row"] < 0) * len(areatype_preference) + polys["rank"]
+
+    return {
+        "points_records": _records(points[["id", "name", "alt_name"]]),
+        "points_tree": cKDTree(_unit_vectors(points["latitude"], points["longitude"])),
+        "polys_records": _records(polys[["GEOIDFQ", "PLACENAME", "AREATYPE"]]),
+        "polys_priority": priority.to_numpy(),
+        "polys_results_row": polys["results_row"].to_numpy(),
+        "polys_tree": STRtree(polys.geometry.values),
+        "transformer": Transformer.from_crs(4326, polys.crs, always_xy=True),
+        "results_records": _records(results),
+    }
+
+
+def _nearest(index, lats, lons, k):
+    """Get the row numbers of the k nearest community points to each coordinate, and their great circle distances in km, as 2D arrays."""
+    k = min(k, len(index["points_records"]))
+    chord, idx = index["points_tree"].query(
+        _unit_vectors(lats, lons), k=list(range(1, k + 1))
+    )
+    km = 2 * earth_radius_km * np.arcsin(np.clip(chord / 2, 0, 1))
+    return idx, np.round(km, 3)
+
+
+def _containing(index, lats, lons):
+    """Get the row number of the census polygon used for each coordinate, or -1 if the coordinate is outside of all polygons."""
+    x, y = index["transformer"].transform(
+        np.asarray(lons, dtype="float64"), np.asarray(lats, dtype="float64")
+    )
+    query_idx, poly_idx = index["polys_tree"].query(
+        shapely.points(x, y), predicate="within"
+    )
+    # sort matches by coordinate, then by priority, and keep the first match for each coordinate
+    order = np.lexsort((index["polys_priority"][poly_idx], query_idx))
+    query_idx, poly_idx = query_idx[order], poly_idx[order]
+    first = np.unique(query_idx, return_index=True)[1]
+
+    containing = np.full(len(x), -1)
+    containing[query_idx[first]] = poly_idx[first]
+    return containing
+
+
+def find_nearest_communities(index, lats, lons, k=5):
+    """Find the k nearest communities to each coordinate.
+
+    Args:
+        index (dict): lookup index from build_lookup_index()
+        lats (array-like): latitudes in decimal degrees
+        lons (array-like): longitudes in decimal degrees
+        k (int): number of communities to return for each coordinate
+    Returns:
+        pandas.DataFrame with one row per coordinate and community, with "query", "rank", "id", "name", "alt_name", and "distance_km" columns
+    """
+    lats = np.atleast_1d(lats)
+    lons = np.atleast_1d(lons)
+    idx, km = _nearest(index, lats, lons, k)
+
+    nearest = pd.DataFrame([index["points_records"][i] for i in idx.ravel()])
+    nearest.insert(0, "query", np.repeat(np.arange(idx.shape[0]), idx.shape[1]))
+    nearest.insert(1, "rank", np.tile(np.arange(1, idx.shape[1] + 1), idx.shape[0]))
+    nearest["distance_km"] = km.ravel()
+    return nearest
+
+
+def find_containing_geographies(index, lats, lons):
+    """Find the census geography that contains each coordinate. Geographies with a results row are used first,
+    then the most preferred geography in the order of areatype_preference (incorporated place, census designated place, tract, county).
+
+    Args:
+        index (dict): lookup index from build_lookup_index()
+        lats (array-like): latitudes in decimal degrees
+        lons (array-like): longitudes in decimal degrees
+    Returns:
+        pandas.DataFrame with one row per coordinate inside a census polygon, with "query", "GEOIDFQ", "PLACENAME", "AREATYPE", and "results_row" columns
+    """
+    containing = _containing(index, np.atleast_1d(lats), np.atleast_1d(lons))
+    query_idx = np.flatnonzero(containing >= 0)
+
+    geographies = pd.DataFrame(
+        [index["polys_records"][i] for i in containing[query_idx]],
+        columns=["GEOIDFQ", "PLACENAME", "AREATYPE"],
+    )
+    geographies.insert(0, "query", query_idx)
+    geographies["results_row"] = index["polys_results_row"][containing[query_idx]]
+    return geographies
+
+
+def lookup_coordinates(index, lats, lons, k=5):
+    """Look up the nearest communities, the containing census geography, and its demographics for a batch of coordinates.
+
+    Args:
+        index (dict): lookup index from build_lookup_index()
+        lats (array-like): latitudes in decimal degrees
+        lons (array-like): longitudes in decimal degrees
+        k (int): number of nearest communities to return for each coordinate
+    Returns:
+        list of dictionaries, one per coordinate, with "latitude", "longitude", "nearest", "geography", and "demographics" keys
+        ("geography" and "demographics" are None if the coordinate is outside of all census polygons or has no results row)
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype="float64"))
+    lons = np.atleast_1d(np.asarray(lons, dtype="float64"))
+    _check_lookup_args(lats, lons, k)
+
+    idx, km = _nearest(index, lats, lons, k)
+    containing = _containing(index, lats, lons)
+
+    out = []
+    for i in range(len(lats)):
+        geography = None
+        demographics = None
+        if containing[i] >= 0:
+            geography = dict(index["polys_records"][containing[i]])
+            results_row = index["polys_results_row"][containing[i]]
+            if results_row >= 0:
+                demographics = dict(index["results_records"][results_row])
+        out.append(
+            {
+                "latitude": float(lats[i]),
+                "longitude": float(lons[i]),
+                "nearest": [
+                    {**index["points_records"][j], "distance_km": float(d)}
+                    for j, d in zip(idx[i], km[i])
+                ],
+                "geography": geography,
+                "demographics": demographics,
+            }
+        )
+
+    return out
+
+
+def serve_lookup(index, host="127.0.0.1", port=8000, name_index=None):
+    """Serve coordinate lookups over HTTP on the local machine, as a stand-in for a web service.
+    Single lookups use GET /lookup?lat=64.84&lon=-147.72&k=5, and batches use POST /lookup
+    with a JSON body like {"coordinates": [[64.84, -147.72], [61.22, -149.9]], "k": 5}.
+    Responses are JSON lists from lookup_coordinates(). If a name index is given, community names
+    can also be searched (e.g., for autocomplete) with GET /search?q=utqiag&limit=10.
+    This runs until interrupted.
+
+    Args:
+        index (dict): lookup index from build_lookup_index()
+        host (str): host address to serve on
+        port (int): port to serve on
+        name_index (dict): optional name index from build_name_index()
+    Returns:
+        None
+    """
+
+    class LookupHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/search" and name_index is not None:
+                params = parse_qs(url.query)
+                query = params.get("q", [""])[0]
+                try:
+                    limit = int(params.get("limit", [10])[0])
+                except ValueError:
+                    return self.send_json(400, {"error": "limit must be an integer"})
+                return self.send_json(200, search_names(name_index, query, limit))
+            if url.path != "/lookup":
+                return self.send_json(404, {"error": "not found"})
+            try:
+                params = parse_qs(url.query)
+                lat = float(params["lat"][0])
+                lon = float(params["lon"][0])
+                k = int(params.get("k", [5])[0])
+                _check_lookup_args(lat, lon, k)
+            except (KeyError, ValueError):
+                return self.send_json(
+                    400,
+                    {
+                        "error": "lat and lon query parameters are required and must be finite numbers, and k must be at least 1"
+                    },
+                )
+            self.send_json(200, lookup_coordinates(index, lat, lon, k))
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/lookup":
+                return self.send_json(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                coords = np.asarray(body["coordinates"], dtype="float64").reshape(-1, 2)
+                k = int(body.get("k", 5))
+                _check_lookup_args(coords[:, 0], coords[:, 1], k)
+            except (KeyError, TypeError, ValueError):
+                return self.send_json(
+                    400,
+                    {
+                        "error": 'body must be JSON like {"coordinates": [[lat, lon]]} with finite coordinates, and k must be at least 1'
+                    },
+                )
+            self.send_json(
+                200, lookup_coordinates(index, coords[:, 0], coords[:, 1], k)
+            )
+
+    server = ThreadingHTTPServer((host, port), LookupHandler)
+    print(f"Serving coordinate lookups at http://{host}:{port}/lookup")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
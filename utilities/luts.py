@@ -11,6 +11,7 @@ var_dict = dict(
     {
         "dhc": {
             "url": "https://api.census.gov/data/2020/dec/dhc",
+            "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
             "vars": {
                 # total
                 "P12_001N": {
@@ -148,7 +149,8 @@ var_dict = dict(
             },
         },
         "acs5": {
-            "url": "https://api.census.gov/data/2023/acs/acs5/subject",  # note that if any variable not found in a "subject" table is used, this base URL will need to be re-configured!
+            "url": "https://api.census.gov/data/2023/acs/acs5/subject",  # variables from other ACS tables are fetched from their own endpoints, see acs_endpoint_dict
+            "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
             "vars": {
                 "S1810_C03_001E": {
                     "long_name": "Percent with a disability!!Estimate!!Total civilian noninstitutionalized population",
@@ -178,6 +180,7 @@ var_dict = dict(
         },
         "cdc": {
             "PLACES": {
+                "source": "CDC PLACES dataset for 2024",
                 "url": {
                     "us": "https://data.cdc.gov/resource/cwsq-ngmh.json",  # same endpoint as tract: we sum these to get all of US
                     "state": "https://data.cdc.gov/resource/cwsq-ngmh.json",  # same endpoint as tract: we specify state as AK and sum
@@ -238,6 +241,7 @@ var_dict = dict(
                 },
             },
             "SDOH": {
+                "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
                 "url": {
                     "us": "https://data.cdc.gov/resource/e539-uadk.json",  # same endpoint as tract: we sum these to get all of US
                     "state": "https://data.cdc.gov/resource/e539-uadk.json",  # same endpoint as tract: we specify state as AK and sum
@@ -285,6 +289,30 @@ var_dict = dict(
     },
 )
 
+# the vintage (data release) described by var_dict, named by the last year of the ACS 5-year estimates
+current_vintage = 2023
+
+# endpoints and variables of other vintages, keyed by vintage; use get_var_dict() in functions.py to get the var_dict of a vintage
+# each vintage only lists the entries that differ from var_dict (e.g., the "url" and "source" of a survey, or the "url" of a CDC dataset),
+# and replaces those entries of var_dict; surveys that are not listed (e.g., the 2020 DHC) use the same endpoints as var_dict
+# older CDC releases have their own Socrata resource IDs, which can be listed under "cdc" like:
+# "cdc": {"PLACES": {"source": "CDC PLACES dataset for 2023", "url": {"county": "https://data.cdc.gov/resource/<resource id>.json", ...}}}
+# the CDC data of a vintage without "cdc" entries are not fetched, and their columns are left empty (the current release would mislabel the vintage)
+vintage_dict = {
+    2022: {
+        "acs5": {
+            "url": "https://api.census.gov/data/2022/acs/acs5/subject",
+            "source": "U.S. Census American Community Survey 5-year estimates for years 2018-2022",
+        },
+    },
+    2021: {
+        "acs5": {
+            "url": "https://api.census.gov/data/2021/acs/acs5/subject",
+            "source": "U.S. Census American Community Survey 5-year estimates for years 2017-2021",
+        },
+    },
+}
+
 ci_dict = {
     "CASTHMA_low": "pct_asthma_low",
     "CASTHMA_high": "pct_asthma_high",
@@ -311,3 +339,601 @@ ci_dict = {
     "SNGPNT_moe": "pct_single_parent_moe",
     "UNEMP_moe": "pct_unemployed_moe",
 }
+
+# value fields of each measure in CDC PLACES and SDOH responses, and the suffix of their column names in ci_dict
+# (data values are named with the short names in var_dict instead)
+cdc_value_fields = {
+    "PLACES": {
+        "data_value": None,
+        "low_confidence_limit": "low",
+        "high_confidence_limit": "high",
+    },
+    "SDOH": {"data_value": None, "moe": "moe"},
+}
+
+# long names for columns computed from the raw data in compute_dhc(), keyed by survey
+# (all other columns use the long names in var_dict; CI columns are described using the long name of their measure)
+computed_var_dict = {
+    "dhc": {
+        "pct_65_plus": "Percentage of population 65 and older",
+        "pct_under_18": "Percentage of population under age 18",
+        "pct_under_5": "Percentage of population under age 5",
+        "pct_hispanic_latino": "Percentage of population Hispanic or Latino",
+        "pct_white": "Percentage of population White",
+        "pct_african_american": "Percentage of population African American",
+        "pct_amer_indian_ak_native": "Percentage of population American Indian or Alaska Native",
+        "pct_asian": "Percentage of population Asian",
+        "pct_hawaiian_pacislander": "Percentage of population Native Hawaiian and Pacific Islander",
+        "pct_other": "Percentage of population Other Race",
+        "pct_multi": "Percentage of population Two or More Races",
+    },
+}
+
+# non-data columns in the results tables
+non_data_cols = ["id", "name", "areatype", "placename", "GEOID", "vintage", "comment"]
+
+# columns of measures that are only for the adult population; these are weighted by adult population when aggregating results
+adult_only_cols = [
+    "pct_asthma",
+    "pct_copd",
+    "pct_chd",
+    "pct_stroke",
+    "pct_diabetes",
+    "pct_mh",
+    "pct_foodstamps",
+    "pct_emospt",
+]
+
+# columns with 90% margins of error (ACS and SDOH measures)
+moe_cols = [
+    "moe_pct_w_disability",
+    "moe_pct_insured",
+    "moe_pct_uninsured",
+    "pct_no_bband_moe",
+    "pct_crowding_moe",
+    "pct_hcost_moe",
+    "pct_no_hsdiploma_moe",
+    "pct_below_150pov_moe",
+    "pct_minority_moe",
+    "pct_single_parent_moe",
+    "pct_unemployed_moe",
+]
+
+# columns of measures that do not deal with population (pct of housing units, etc...); these are averaged when aggregating results
+non_pop_cols = [
+    "pct_no_bband",
+    "pct_crowding",
+    "pct_hcost",
+    "pct_single_parent",
+]
+
+# state FIPS codes of the 50 states and DC, with the abbreviations used in reference row IDs and the names used in CDC queries
+state_dict = {
+    "01": {"abbr": "AL", "name": "Alabama"},
+    "02": {"abbr": "AK", "name": "Alaska"},
+    "04": {"abbr": "AZ", "name": "Arizona"},
+    "05": {"abbr": "AR", "name": "Arkansas"},
+    "06": {"abbr": "CA", "name": "California"},
+    "08": {"abbr": "CO", "name": "Colorado"},
+    "09": {"abbr": "CT", "name": "Connecticut"},
+    "10": {"abbr": "DE", "name": "Delaware"},
+    "11": {"abbr": "DC", "name": "District of Columbia"},
+    "12": {"abbr": "FL", "name": "Florida"},
+    "13": {"abbr": "GA", "name": "Georgia"},
+    "15": {"abbr": "HI", "name": "Hawaii"},
+    "16": {"abbr": "ID", "name": "Idaho"},
+    "17": {"abbr": "IL", "name": "Illinois"},
+    "18": {"abbr": "IN", "name": "Indiana"},
+    "19": {"abbr": "IA", "name": "Iowa"},
+    "20": {"abbr": "KS", "name": "Kansas"},
+    "21": {"abbr": "KY", "name": "Kentucky"},
+    "22": {"abbr": "LA", "name": "Louisiana"},
+    "23": {"abbr": "ME", "name": "Maine"},
+    "24": {"abbr": "MD", "name": "Maryland"},
+    "25": {"abbr": "MA", "name": "Massachusetts"},
+    "26": {"abbr": "MI", "name": "Michigan"},
+    "27": {"abbr": "MN", "name": "Minnesota"},
+    "28": {"abbr": "MS", "name": "Mississippi"},
+    "29": {"abbr": "MO", "name": "Missouri"},
+    "30": {"abbr": "MT", "name": "Montana"},
+    "31": {"abbr": "NE", "name": "Nebraska"},
+    "32": {"abbr": "NV", "name": "Nevada"},
+    "33": {"abbr": "NH", "name": "New Hampshire"},
+    "34": {"abbr": "NJ", "name": "New Jersey"},
+    "35": {"abbr": "NM", "name": "New Mexico"},
+    "36": {"abbr": "NY", "name": "New York"},
+    "37": {"abbr": "NC", "name": "North Carolina"},
+    "38": {"abbr": "ND", "name": "North Dakota"},
+    "39": {"abbr": "OH", "name": "Ohio"},
+    "40": {"abbr": "OK", "name": "Oklahoma"},
+    "41": {"abbr": "OR", "name": "Oregon"},
+    "42": {"abbr": "PA", "name": "Pennsylvania"},
+    "44": {"abbr": "RI", "name": "Rhode Island"},
+    "45": {"abbr": "SC", "name": "South Carolina"},
+    "46": {"abbr": "SD", "name": "South Dakota"},
+    "47": {"abbr": "TN", "name": "Tennessee"},
+    "48": {"abbr": "TX", "name": "Texas"},
+    "49": {"abbr": "UT", "name": "Utah"},
+    "50": {"abbr": "VT", "name": "Vermont"},
+    "51": {"abbr": "VA", "name": "Virginia"},
+    "53": {"abbr": "WA", "name": "Washington"},
+    "54": {"abbr": "WV", "name": "West Virginia"},
+    "55": {"abbr": "WI", "name": "Wisconsin"},
+    "56": {"abbr": "WY", "name": "Wyoming"},
+}
+
+# lookup table to convert AREATYPE values from the GVV lookup table to the area type strings used in API queries
+areatype_dict = {
+    "County": "county",
+    "Census designated place": "place",
+    "Incorporated place": "place",
+    "ZCTA": "zcta",
+    "Census tract": "tract",
+    "State": "state",
+    "Nation": "us",
+}
+
+# geographies used in the "for" and "in" clauses of the census API queries built in fetch_census_data_and_compute(), keyed by area type
+# these are checked against the geography.json metadata of each census endpoint by validate_census_requests()
+census_geography_dict = {
+    "us": {"for": "us", "in": []},
+    "state": {"for": "state", "in": []},
+    "county": {"for": "county", "in": ["state"]},
+    "place": {"for": "place", "in": ["state"]},
+    "tract": {"for": "tract", "in": ["state", "county"]},
+    "zcta": {"for": "zip code tabulation area", "in": []},
+}
+
+# ACS table ID prefixes and the endpoint that serves those tables
+# e.g., "S1810_C03_001E" is a subject table variable, served at https://api.census.gov/data/2023/acs/acs5/subject
+# ACS variables in var_dict are fetched from the endpoint of their prefix, unless they declare an endpoint with an "endpoint" key (e.g., "endpoint": "detailed")
+acs_endpoint_dict = {
+    "DP": "profile",
+    "CP": "cprofile",
+    "S": "subject",
+    "B": "detailed",
+    "C": "detailed",
+}
+
+# URL path of each ACS endpoint after "acs/acs5"
+acs_endpoint_paths = {
+    "detailed": "",
+    "subject": "/subject",
+    "profile": "/profile",
+    "cprofile": "/cprofile",
+}
+
+# maximum number of variables in one census API request; larger groups of variables are split into several requests
+census_max_vars = 50
+
+# number of rows the CDC (Socrata) API returns when a query does not set a $limit
+cdc_default_limit = 1000
+
+# geography columns of census API responses, which are not variables
+census_geo_cols = [
+    "us",
+    "state",
+    "county",
+    "place",
+    "tract",
+    "zip code tabulation area",
+]
+
+# census summary level codes for each area type, used to encode GEOIDs as integer keys
+# code_width is the number of digits in the standard GEOID used in the results tables
+# (ie, the GEOIDFQ without the summary level, state FIPS code, and "US" component)
+# the state and nation GEOIDs are special cases and do not use a geography code
+sumlev_dict = {
+    "us": {"sumlev": 10, "code_width": 0},
+    "state": {"sumlev": 40, "code_width": 0},
+    "county": {"sumlev": 50, "code_width": 3},
+    "tract": {"sumlev": 140, "code_width": 9},
+    "place": {"sumlev": 160, "code_width": 5},
+    "zcta": {"sumlev": 860, "code_width": 5},
+}
+
+# integer GEOID keys are fixed width: 3 digit summary level + 2 digit state FIPS code + 9 digit geography code
+# eg, "1400000US02020000500" (tract) is encoded as 140_02_020000500 = 14002020000500
+geoid_key_sumlev_factor = 10**11
+geoid_key_state_factor = 10**9
+
+# 2020 TIGER/Line shapefiles for Alaska census polygons, with the columns used to build the standard GEOID for each area type
+tigerline_dict = {
+    "county": {
+        "fname": "tl_2020_02_county20.shp",
+        "code_cols": ["COUNTYFP20"],
+    },
+    "tract": {
+        "fname": "tl_2020_02_tract20.shp",
+        "code_cols": ["COUNTYFP20", "TRACTCE20"],
+    },
+    "place": {
+        "fname": "tl_2020_02_place20.shp",
+        "code_cols": ["PLACEFP20"],
+    },
+}
+
+# AREATYPE labels to use when assigning census geographies to communities, from the most to the least preferred
+# places are split into incorporated places and census designated places using the TIGER/Line CLASSFP code
+areatype_preference = [
+    "Incorporated place",
+    "Census designated place",
+    "Census tract",
+    "County",
+]
+place_classfp_dict = {
+    "C1": "Incorporated place",
+    "U1": "Census designated place",
+    "U2": "Census designated place",
+}
+
+# descriptions and sources of each field in the wide demographics reports (see utilities/reports.py)
+demographics_descriptions = {
+    # population, age, and race
+    "name": {
+        "description": "",
+        "source": "",
+    },
+    "comment": {
+        "description": "",
+        "source": "",
+    },
+    "total_population": {
+        "description": "total_population is the total population of the community",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_under_18": {
+        "description": "pct_under_18 is the percentage of the population under age 18; this value was calculated by summing the population count of multiple sex by age categories and expressing that sum as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_under_5": {
+        "description": "pct_under_5 is the percentage of the population under age 5; this value was calculated by summing the population count of multiple sex by age categories and expressing that sum as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_65_plus": {
+        "description": "pct_65_plus is the percentage of the population age 65 and older; this value was calculated by summing the population count of multiple sex by age categories and expressing that sum as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_african_american": {
+        "description": "pct_african_american is the percentage of the population that is African American; this value was calculated by taking the population count of African Americans and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_amer_indian_ak_native": {
+        "description": "pct_amer_indian_ak_native is the percentage of the population that is American Indian or Alaska Native; this value was calculated by taking the population count of American Indians or Alaska Natives and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_asian": {
+        "description": "pct_asian is the percentage of the population that is Asian; this value was calculated by taking the population count of Asians and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_hawaiian_pacislander": {
+        "description": "pct_hawaiian_pacislander is the percentage of the population that is Native Hawaiian and Pacific Islander; this value was calculated by taking the population count of Native Hawaiians and Pacific Islanders and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_hispanic_latino": {
+        "description": "pct_hispanic_latino is the percentage of the population that is Hispanic or Latino; this value was calculated by taking the population count of Hispanics or Latinos and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_white": {
+        "description": "pct_white is the percentage of the population that is White; this value was calculated by taking the population count of Whites and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_multi": {
+        "description": "pct_multi is the percentage of the population that is two or more races; this value was calculated by taking the population count of two or more races and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    "pct_other": {
+        "description": "pct_other is the percentage of the population that is other race; this value was calculated by taking the population count of other races and expressing that count as a percentage of the total population",
+        "source": "U.S. Census Demographic and Housing Characteristics Survey for 2020",
+    },
+    # health conditions
+    "pct_asthma": {
+        "description": "pct_asthma is the percentage of adults aged >=18 years who report being diagnosed with and currently having asthma; this value is a crude prevalence rate",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_asthma_low": {
+        "description": "pct_asthma_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with and currently having asthma",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_asthma_high": {
+        "description": "pct_asthma_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with and currently having asthma",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_copd": {
+        "description": "pct_copd is the percentage of adults aged >=18 years who report being diagnosed with chronic obstructive pulmonary disease (COPD), emphysema, or chronic bronchitis",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_copd_low": {
+        "description": "pct_copd_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with chronic obstructive pulmonary disease (COPD), emphysema, or chronic bronchitis",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_copd_high": {
+        "description": "pct_copd_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with chronic obstructive pulmonary disease (COPD), emphysema, or chronic bronchitis",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_diabetes": {
+        "description": "pct_diabetes is the percentage of adults aged >=18 years who report being diagnosed with diabetes (excluding diabetes during pregnancy/gestational diabetes); this value is a crude prevalence rate",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_diabetes_low": {
+        "description": "pct_diabetes_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with diabetes (excluding diabetes during pregnancy/gestational diabetes)",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_diabetes_high": {
+        "description": "pct_diabetes_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with diabetes (excluding diabetes during pregnancy/gestational diabetes)",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_hd": {
+        "description": "pct_hd is the percentage of adults aged >=18 years who report being diagnosed with coronary heart disease; this value is a crude prevalence rate",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_hd_low": {
+        "description": "pct_hd_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with coronary heart disease",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_hd_high": {
+        "description": "pct_hd_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report being diagnosed with coronary heart disease",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_mh": {
+        "description": "pct_mh is the percentage of adults aged >=18 years who report having 'frequent mental distress' (mental health including stress, depression, and problems with emotions, was not good for 14 or more days during the past 30 days); this value is a crude prevalence rate",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_mh_low": {
+        "description": "pct_mh_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report having 'frequent mental distress' (mental health including stress, depression, and problems with emotions, was not good for 14 or more days during the past 30 days)",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_mh_high": {
+        "description": "pct_mh_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report having 'frequent mental distress' (mental health including stress, depression, and problems with emotions, was not good for 14 or more days during the past 30 days)",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_stroke": {
+        "description": "pct_stroke is the percentage of adults aged >=18 years who report having ever been told by a doctor, nurse, or other health professional that they have had a stroke; this value is a crude prevalence rate",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_stroke_low": {
+        "description": "pct_stroke_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report having ever been told by a doctor, nurse, or other health professional that they have had a stroke",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_stroke_high": {
+        "description": "pct_stroke_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report having ever been told by a doctor, nurse, or other health professional that they have had a stroke",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_emospt": {
+        "description": "pct_emospt is the percentage of adults aged >=18 years who report 'lack of social and emotional support' (self-report sometimes, rarely, or never getting the social and emotional support needed); this value is a crude prevalence rate",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_emospt_low": {
+        "description": "pct_emospt_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years who report 'lack of social and emotional support' (self-report sometimes, rarely, or never getting the social and emotional support needed)",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_emospt_high": {
+        "description": "pct_emospt_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years who report 'lack of social and emotional support' (self-report sometimes, rarely, or never getting the social and emotional support needed)",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    # social determinants of health
+    "pct_minority": {
+        "description": "pct_minority is the percentage of the population of racial or ethnic minority status (including individuals who identified as any of the following: Hispanic or Latino (any race); Black and African American, non-Hispanic; American Indian and Alaska Native, non-Hispanic; Asian, non-Hispanic; Native Hawaiian and Other Pacific Islander, non-Hispanic; Two or More Races, non-Hispanic; Other Races, non-Hispanic)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_minority_low": {
+        "description": "pct_minority_low is the lower bound of the 90% confidence interval for percentage of the population of racial or ethnic minority status (including individuals who identified as any of the following: Hispanic or Latino (any race); Black and African American, non-Hispanic; American Indian and Alaska Native, non-Hispanic; Asian, non-Hispanic; Native Hawaiian and Other Pacific Islander, non-Hispanic; Two or More Races, non-Hispanic; Other Races, non-Hispanic)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_minority_high": {
+        "description": "pct_minority_high is the upper bound of the 90% confidence interval for percentage of the population of racial or ethnic minority status (including individuals who identified as any of the following: Hispanic or Latino (any race); Black and African American, non-Hispanic; American Indian and Alaska Native, non-Hispanic; Asian, non-Hispanic; Native Hawaiian and Other Pacific Islander, non-Hispanic; Two or More Races, non-Hispanic; Other Races, non-Hispanic)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_foodstamps": {
+        "description": "pct_foodstamps is the percentage of adults aged >=18 years that received food stamps in the past 12 months",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_foodstamps_low": {
+        "description": "pct_foodstamps_low is the lower bound of the 90% confidence interval for percentage of adults aged >=18 years that received food stamps in the past 12 months",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_foodstamps_high": {
+        "description": "pct_foodstamps_high is the upper bound of the 90% confidence interval for percentage of adults aged >=18 years that received food stamps in the past 12 months",
+        "source": "CDC PLACES dataset for 2024",
+    },
+    "pct_w_disability": {
+        "description": "pct_w_disability is the percentage of the population with a reported disability (presence of six types of disability related to serious difficulty including: hearing, vision, concentrating, remembering or making decisions (i.e. cognition), walking or climbing stairs (i.e. mobility), dressing or bathing (i.e., self-care), and doing errands alone (i.e., independent living))",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_w_disability_low": {
+        "description": "pct_w_disability_low is the lower bound of the 90% confidence interval for percentage of the population with a reported disability (presence of six types of disability related to serious difficulty including: hearing, vision, concentrating, remembering or making decisions (i.e. cognition), walking or climbing stairs (i.e. mobility), dressing or bathing (i.e., self-care), and doing errands alone (i.e., independent living))",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_w_disability_high": {
+        "description": "pct_w_disability_high is the upper bound of the 90% confidence interval for percentage of the population with a reported disability (presence of six types of disability related to serious difficulty including: hearing, vision, concentrating, remembering or making decisions (i.e. cognition), walking or climbing stairs (i.e. mobility), dressing or bathing (i.e., self-care), and doing errands alone (i.e., independent living))",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_insured": {
+        "description": "pct_insured is the percentage of the population with health insurance",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_insured_low": {
+        "description": "pct_insured_low is the lower bound of the 90% confidence interval for percentage of the population with health insurance",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_insured_high": {
+        "description": "pct_insured_high is the upper bound of the 90% confidence interval for percentage of the population with health insurance",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_uninsured": {
+        "description": "pct_uninsured is the percentage of the population without health insurance",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_uninsured_low": {
+        "description": "pct_uninsured_low is the lower bound of the 90% confidence interval for percentage of the population without health insurance",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_uninsured_high": {
+        "description": "pct_uninsured_high is the upper bound of the 90% confidence interval for percentage of the population without health insurance",
+        "source": "U.S. Census American Community Survey 5-year estimates for years 2019-2023",
+    },
+    "pct_no_bband": {
+        "description": "pct_no_bband is the percentage of households with no broadband internet subscription",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_no_bband_low": {
+        "description": "pct_no_bband_low is the lower bound of the 90% confidence interval for percentage of households with no broadband internet subscription",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_no_bband_high": {
+        "description": "pct_no_bband_high is the upper bound of the 90% confidence interval for percentage of households with no broadband internet subscription",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_no_hsdiploma": {
+        "description": "pct_no_hsdiploma is the percentage of adults aged >=25 years with no high school diploma",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_no_hsdiploma_low": {
+        "description": "pct_no_hsdiploma_low is the lower bound of the 90% confidence interval for percentage of adults aged >=25 years with no high school diploma",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_no_hsdiploma_high": {
+        "description": "pct_no_hsdiploma_high is the upper bound of the 90% confidence interval for percentage of adults aged >=25 years with no high school diploma",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_below_150pov": {
+        "description": "pct_below_150pov is the percentage of population living below 150% of the federal poverty threshold",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_below_150pov_low": {
+        "description": "pct_below_150pov_low is the lower bound of the 90% confidence interval for percentage of population living below 150% of the federal poverty threshold",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_below_150pov_high": {
+        "description": "pct_below_150pov_high is the upper bound of the 90% confidence interval for percentage of population living below 150% of the federal poverty threshold",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_crowding": {
+        "description": "pct_crowding is the percentage of households with 'crowding' (occupied housing units with 1.01 to 1.50 and 1.51 or more occupants per room)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_crowding_low": {
+        "description": "pct_crowding_low is the lower bound of the 90% confidence interval for percentage of households with 'crowding' (occupied housing units with 1.01 to 1.50 and 1.51 or more occupants per room)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_crowding_high": {
+        "description": "pct_crowding_high is the upper bound of the 90% confidence interval for percentage of households with 'crowding' (occupied housing units with 1.01 to 1.50 and 1.51 or more occupants per room)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_hcost": {
+        "description": "pct_hcost is the percentage of households with 'housing cost burden' (households with annual income less than $75,000 that spend 30% or more of their household income on housing)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_hcost_low": {
+        "description": "pct_hcost_low is the lower bound of the 90% confidence interval for percentage of households with 'housing cost burden' (households with annual income less than $75,000 that spend 30% or more of their household income on housing)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_hcost_high": {
+        "description": "pct_hcost_high is the upper bound of the 90% confidence interval for percentage of households with 'housing cost burden' (households with annual income less than $75,000 that spend 30% or more of their household income on housing)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_unemployed": {
+        "description": "pct_unemployed is the percentage of the population >= 16 years in the civilian labor force who are unemployed (jobless but are available to work and have actively looked for work in the past 4 weeks)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_unemployed_low": {
+        "description": "pct_unemployed_low is the lower bound of the 90% confidence interval for percentage of the population >= 16 years in the civilian labor force who are unemployed (jobless but are available to work and have actively looked for work in the past 4 weeks)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_unemployed_high": {
+        "description": "pct_unemployed_high is the upper bound of the 90% confidence interval for percentage of the population >= 16 years in the civilian labor force who are unemployed (jobless but are available to work and have actively looked for work in the past 4 weeks)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_single_parent": {
+        "description": "pct_single_parent is the percentage of single parent households (households with a male or female householder with no spouse or partner present with children of the householder)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_single_parent_low": {
+        "description": "pct_single_parent_low is the lower bound of the 90% confidence interval for percentage of single parent households (households with a male or female householder with no spouse or partner present with children of the householder)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+    "pct_single_parent_high": {
+        "description": "pct_single_parent_high is the upper bound of the 90% confidence interval for percentage of single parent households (households with a male or female householder with no spouse or partner present with children of the householder)",
+        "source": "CDC PLACES Social Determinants of Health dataset for 2024 (originally derived from ACS estimates 2017-2021)",
+    },
+}
+
+# order of fields for demographics CSV (should match presentation of fields in NCR)
+demographics_order = [
+    # etc
+    "comment",
+    # population
+    "total_population",
+    # age by category
+    "pct_under_5",
+    "pct_under_18",
+    "pct_65_plus",
+    # race/ethnicity
+    "pct_hispanic_latino",
+    "pct_white",
+    "pct_african_american",
+    "pct_amer_indian_ak_native",
+    "pct_asian",
+    "pct_hawaiian_pacislander",
+    "pct_other",
+    "pct_multi",
+    # health conditions
+    "pct_asthma",
+    "pct_asthma_low",
+    "pct_asthma_high",
+    "pct_copd",
+    "pct_copd_low",
+    "pct_copd_high",
+    "pct_hd",
+    "pct_hd_low",
+    "pct_hd_high",
+    "pct_stroke",
+    "pct_stroke_low",
+    "pct_stroke_high",
+    "pct_diabetes",
+    "pct_diabetes_low",
+    "pct_diabetes_high",
+    "pct_mh",
+    "pct_mh_low",
+    "pct_mh_high",
+    # social determinants of health
+    "pct_minority",
+    "pct_minority_low",
+    "pct_minority_high",
+    "pct_no_hsdiploma",
+    "pct_no_hsdiploma_low",
+    "pct_no_hsdiploma_high",
+    "pct_below_150pov",
+    "pct_below_150pov_low",
+    "pct_below_150pov_high",
+    "pct_unemployed",
+    "pct_unemployed_low",
+    "pct_unemployed_high",
+    "pct_foodstamps",
+    "pct_foodstamps_low",
+    "pct_foodstamps_high",
+    "pct_single_parent",
+    "pct_single_parent_low",
+    "pct_single_parent_high",
+    "pct_no_bband",
+    "pct_no_bband_low",
+    "pct_no_bband_high",
+    "pct_crowding",
+    "pct_crowding_low",
+    "pct_crowding_high",
+    "pct_hcost",
+    "pct_hcost_low",
+    "pct_hcost_high",
+    "pct_emospt",
+    "pct_emospt_low",
+    "pct_emospt_high",
+    "pct_w_disability",
+    "pct_w_disability_low",
+    "pct_w_disability_high",
+    "pct_insured",
+    "pct_insured_low",
+    "pct_insured_high",
+    "pct_uninsured",
+    "pct_uninsured_low",
+    "pct_uninsured_high",
+]
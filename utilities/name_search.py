@@ -0,0 +1,158 @@
+"""
+This is used to find GVV IDs from community names with fuzzy matching, including Native language alt names with diacritics (e.g., Utqiaġvik, Agw’aneq).
+Names are normalized and indexed by trigrams once with build_name_index(), and then searched with search_names() or match_names().
+"""
+
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# letters that do not decompose into an ASCII letter and a diacritic
+special_letters = str.maketrans({"ł": "l", "Ł": "l", "ŋ": "ng", "Ŋ": "ng"})
+# apostrophes and glottal stops are dropped so that e.g. "Agw’aneq" matches "agwaneq"
+apostrophes = str.maketrans({"’": "", "ʼ": "", "'": "", "‘": "", "`": ""})
+
+
+def normalize_name(name):
+    """Normalize a name for matching: remove diacritics and apostrophes, lowercase, and replace any other punctuation with spaces.
+
+    Args:
+        name (str): name to normalize
+    Returns:
+        normalized name string (e.g., "Utqiaġvik" -> "utqiagvik")
+    """
+    name = name.translate(special_letters).translate(apostrophes)
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = "".join(c if c.isalnum() else " " for c in name.casefold())
+    return " ".join(name.split())
+
+
+def name_trigrams(normalized):
+    """Get the set of trigrams of each word in a normalized name, padded so that the start of each word gets more weight.
+
+    Args:
+        normalized (str): name from normalize_name()
+    Returns:
+        set of trigram strings
+    """
+    trigrams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def build_name_index(points):
+    """Build a trigram index over the name and alt_name of each community. Alt names with several names (e.g., "Cingik / Siŋik") are indexed separately.
+
+    Args:
+        points (pandas.DataFrame): point locations with "id", "name", and "alt_name" columns (e.g., alaska_point_locations.csv)
+    Returns:
+        dictionary of the name index, to pass to search_names() and match_names()
+    """
+    points = points[["id", "name", "alt_name"]].reset_index(drop=True)
+
+    entry_rows = []
+    entry_names = []
+    for row, name, alt_name in zip(points.index, points["name"], points["alt_name"]):
+        names = [name]
+        if isinstance(alt_name, str):
+            names += [n.strip() for n in alt_name.split("/") if n.strip()]
+        entry_rows += [row] * len(names)
+        entry_names += names
+
+    normalized = [normalize_name(n) for n in entry_names]
+    postings = {}
+    n_trigrams = np.zeros(len(normalized), dtype="int64")
+    for entry, norm in enumerate(normalized):
+        trigrams = name_trigrams(norm)
+        n_trigrams[entry] = len(trigrams)
+        for trigram in trigrams:
+            postings.setdefault(trigram, []).append(entry)
+
+    return {
+        "points_records": points.astype(object)
+        .where(points.notna(), None)
+        .to_dict("records"),
+        "entry_rows": np.array(entry_rows, dtype="int64"),
+        "entry_names": entry_names,
+        # padded with spaces so that word prefixes can be found with a substring search
+        "entry_normalized": np.array([f" {n}" for n in normalized]),
+        "n_trigrams": n_trigrams,
+        "postings": {t: np.array(e, dtype="int64") for t, e in postings.items()},
+    }
+
+
+def search_names(index, query, limit=10, min_score=0.3):
+    """Search community names and alt names. Results are ranked with exact matches first, then names with a word
+    that starts with the query (for autocomplete), then by trigram similarity (Dice coefficient).
+
+    Args:
+        index (dict): name index from build_name_index()
+        query (str): name or partial name to search for
+        limit (int): maximum number of communities to return
+        min_score (float): minimum trigram similarity of matches that are not exact or prefix matches
+    Returns:
+        list of dictionaries with "id", "name", "alt_name", "matched" (the name or alt name that matched), and "score" keys
+    """
+    norm = normalize_name(query)
+    if norm == "":
+        return []
+    trigrams = name_trigrams(norm)
+
+    hits = [index["postings"][t] for t in trigrams if t in index["postings"]]
+    n_entries = len(index["entry_rows"])
+    if len(hits) > 0:
+        common = np.bincount(np.concatenate(hits), minlength=n_entries)
+    else:
+        common = np.zeros(n_entries, dtype="int64")
+    score = 2 * common / (len(trigrams) + index["n_trigrams"])
+
+    exact = index["entry_normalized"] == f" {norm}"
+    prefix = np.char.find(index["entry_normalized"], f" {norm}") >= 0
+    candidates = np.flatnonzero(exact | prefix | (score >= min_score))
+    order = np.lexsort((-score[candidates], ~prefix[candidates], ~exact[candidates]))
+
+    out = []
+    seen = set()
+    for entry in candidates[order]:
+        row = index["entry_rows"][entry]
+        if row in seen:
+            continue
+        seen.add(row)
+        out.append(
+            {
+                **index["points_records"][row],
+                "matched": index["entry_names"][entry],
+                "score": round(float(score[entry]), 3),
+            }
+        )
+        if len(out) == limit:
+            break
+
+    return out
+
+
+def match_names(index, names, min_score=0.5):
+    """Find the best matching community for each of a list of names, e.g. to build a test subset of the lookup table
+    without exact spelling: geoid_lu_df[geoid_lu_df["id"].isin(match_names(index, ["Utqiagvik", "Fairbanks"])["id"])]
+
+    Args:
+        index (dict): name index from build_name_index()
+        names (list): names to match
+        min_score (float): minimum trigram similarity of matches that are not exact or prefix matches
+    Returns:
+        pandas.DataFrame with one row per name that has a match, with "query", "id", "name", "alt_name", "matched", and "score" columns
+    """
+    matches = []
+    for name in names:
+        result = search_names(index, name, limit=1, min_score=min_score)
+        if len(result) == 0:
+            print(f"No community found for {name}")
+            continue
+        matches.append({"query": name, **result[0]})
+
+    return pd.DataFrame(
+        matches, columns=["query", "id", "name", "alt_name", "matched", "score"]
+    )
@@ -0,0 +1,347 @@
+"""
+This is used to run the fetch and aggregation steps of the pipeline for census geographies in every state (e.g., all census tracts in the US), not only Alaska.
+The work is sharded by state FIPS code across worker processes. Each state shard lists the geographies of the state from the census API, fetches their data
+in batches (several geographies per request), adds a reference row for the state, and writes its results to a Parquet file. Finished shards are kept,
+so an interrupted run only fetches the remaining states. The shards and a US reference row are then combined into a single national results table.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from multiprocessing.pool import Pool
+from utilities.luts import *
+from utilities.functions import (
+    request_json,
+    fetch_and_merge,
+    aggregate_results,
+    add_reference_rows,
+    create_comment_dict,
+    validate_census_requests,
+    encode_geoid_key,
+    encode_geoidfq,
+    geoid_key_to_geoid,
+    geoid_key_to_geoidfq,
+)
+from utilities.export import write_results_parquet
+
+# columns of the lookup table
+lookup_cols = [
+    "id",
+    "name",
+    "alt_name",
+    "region",
+    "country",
+    "latitude",
+    "longitude",
+    "type",
+    "GEOIDFQ",
+    "PLACENAME",
+    "AREATYPE",
+    "COMMENT",
+]
+
+# geography clauses used to list every geography of an area type in a state, and the AREATYPE of the geographies in the lookup table
+# (places are listed as incorporated places, or census designated places if their name ends with "CDP")
+national_areatype_dict = {
+    "tract": {
+        "clause": "for=tract:*&in=state:{state}&in=county:*",
+        "AREATYPE": "Census tract",
+    },
+    "county": {"clause": "for=county:*&in=state:{state}", "AREATYPE": "County"},
+    "place": {
+        "clause": "for=place:*&in=state:{state}",
+        "AREATYPE": "Incorporated place",
+    },
+}
+
+
+def fetch_state_geographies(state, areatype_str="tract", cache_dir=None, offline=False):
+    """Build a lookup table with one row for every census geography of an area type in a state, listed by the census API (DHC endpoint).
+    Rows have the columns of the lookup table and are keyed by their integer GEOID key, like build_geography_lookup() in utilities/regions.py.
+
+    Args:
+        state (str): 2 digit state FIPS code, a key of state_dict
+        areatype_str (str): area type of the geographies ("tract", "county", or "place")
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        offline (bool): whether to only use cached responses, see request_json()
+    Returns:
+        pandas.DataFrame with the columns of the lookup table
+    """
+    if areatype_str not in national_areatype_dict:
+        raise ValueError(
+            f"Unsupported area type: {areatype_str} (use {list(national_areatype_dict)})"
+        )
+    clause = national_areatype_dict[areatype_str]["clause"].format(state=state)
+    url = f"{var_dict['dhc']['url']}?get=NAME&{clause}&key={census_}"
+    r_json = request_json(url, cache_dir=cache_dir, offline=offline)
+    if r_json is None:
+        raise ValueError(
+            f"Could not list the {areatype_str} geographies of {state_dict[state]['name']}, check your URL: {url}"
+        )
+
+    df = pd.DataFrame(r_json[1:], columns=r_json[0])
+    if areatype_str == "tract":
+        code = df["county"] + df["tract"]
+    else:
+        code = df[areatype_str]
+    geoid_keys = encode_geoid_key(areatype_str, df["state"], code)
+
+    # names are like "Census Tract 1; Aleutians East Borough; Alaska" or "Adak city, Alaska"
+    names = df["NAME"].str.split(r"[;,]").str[0]
+    areatypes = national_areatype_dict[areatype_str]["AREATYPE"]
+    if areatype_str == "place":
+        areatypes = np.where(
+            names.str.endswith(" CDP"), "Census designated place", areatypes
+        )
+
+    return pd.DataFrame(
+        {
+            "id": [f"GEO{key}" for key in geoid_keys],
+            "name": names,
+            "alt_name": np.nan,
+            "region": state_dict[state]["name"],
+            "country": "US",
+            "latitude": np.nan,
+            "longitude": np.nan,
+            "type": areatype_str,
+            "GEOIDFQ": geoid_key_to_geoidfq(geoid_keys),
+            "PLACENAME": names,
+            "AREATYPE": areatypes,
+            "COMMENT": np.nan,
+        }
+    )
+
+
+def batch_state_lookup(lookup_df, batch_size=100):
+    """Split a lookup table of single geographies into batches that can each be fetched with one request per endpoint.
+    Tracts are batched by county, because tract queries are limited to one county. Each batch is a lookup table where every row has
+    the batch ID as its GVV ID, so it is fetched like a one-to-many GVV ID (without aggregating the rows).
+
+    Args:
+        lookup_df (pandas.DataFrame): lookup table from fetch_state_geographies()
+        batch_size (int): maximum number of geographies per batch
+    Returns:
+        list of (batch ID, batch lookup table) tuples
+    """
+    batches = []
+    # GEOIDFQs of tracts are like "1400000US02013000100", with the county FIPS code in characters 11-13
+    is_tract = lookup_df["AREATYPE"] == national_areatype_dict["tract"]["AREATYPE"]
+    group = np.where(is_tract, "tract" + lookup_df["GEOIDFQ"].str[11:14], "other")
+    for _, group_df in lookup_df.groupby([lookup_df["type"], group], sort=False):
+        for i in range(0, len(group_df), batch_size):
+            batch_lu = group_df.iloc[i : i + batch_size].copy()
+            batch_id = f"BATCH-{batch_lu['GEOIDFQ'].iloc[0]}-{len(batch_lu)}"
+            batch_lu["id"] = batch_id
+            batches.append((batch_id, batch_lu))
+    return batches
+
+
+def fetch_batch(lookup_df, batch_id, batch_lu, vintages=None, **fetch_kwargs):
+    """Fetch the data for a batch of geographies with fetch_and_merge(), and restore the GVV ID and comment of each geography.
+
+    Args:
+        lookup_df (pandas.DataFrame): lookup table from fetch_state_geographies() that the batch was taken from
+        batch_id (str): batch ID from batch_state_lookup()
+        batch_lu (pandas.DataFrame): batch lookup table from batch_state_lookup()
+        vintages (list): vintages to fetch, see fetch_and_merge()
+        **fetch_kwargs: cache_dir, max_threads, and offline arguments for fetch_and_merge()
+    Returns:
+        pandas.DataFrame with one row per geography (and vintage)
+    """
+    df = fetch_and_merge(batch_lu, batch_id, {}, vintages, **fetch_kwargs)
+
+    # geographies in a batch are all in one state, so their standard GEOIDs (without the state FIPS code) are unique
+    geo_lu = lookup_df.loc[batch_lu.index]
+    geoids = geoid_key_to_geoid(encode_geoidfq(geo_lu["GEOIDFQ"]))
+    id_dict = dict(zip(geoids, geo_lu["id"]))
+    df["id"] = df["GEOID"].map(id_dict)
+    df["comment"] = df["id"].map(create_comment_dict(geo_lu))
+    return df
+
+
+def run_state_shard(
+    state,
+    shard_path,
+    areatypes=("tract",),
+    batch_size=100,
+    vintages=None,
+    cache_dir=None,
+    max_threads=None,
+    offline=False,
+    ci_method="pooled",
+    n_draws=10000,
+    seed=0,
+):
+    """Fetch, aggregate, and save the results for every geography of the given area types in one state, plus the state reference row (e.g., "AK0").
+
+    Args:
+        state (str): 2 digit state FIPS code, a key of state_dict
+        shard_path (str or pathlib.Path): Parquet file of the state results
+        areatypes (list): area types of the geographies to fetch (keys of national_areatype_dict)
+        batch_size (int): maximum number of geographies per request, see batch_state_lookup()
+        vintages (list): vintages to fetch, see run_fetch_and_merge()
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        max_threads (int): maximum number of concurrent census requests, see fetch_census_data_and_compute()
+        offline (bool): whether to only use cached responses, see request_json()
+        ci_method (str): CI method of aggregate_results()
+        n_draws (int): number of samples per row for the "monte_carlo" CI method
+        seed (int): seed of the random number generator for the "monte_carlo" CI method
+    Returns:
+        pathlib.Path of the Parquet file
+    """
+    fetch_kwargs = {
+        "cache_dir": cache_dir,
+        "max_threads": max_threads,
+        "offline": offline,
+    }
+    lookup_df = pd.concat(
+        [
+            fetch_state_geographies(state, areatype_str, cache_dir, offline)
+            for areatype_str in areatypes
+        ],
+        ignore_index=True,
+    )
+
+    results = []
+    for batch_id, batch_lu in batch_state_lookup(lookup_df, batch_size):
+        results.append(
+            fetch_batch(lookup_df, batch_id, batch_lu, vintages, **fetch_kwargs)
+        )
+
+    # add the state reference row
+    ref_lu = add_reference_rows(lookup_df.iloc[:0], state).iloc[:1]
+    ref_id = ref_lu["id"].iloc[0]
+    results.append(
+        fetch_and_merge(
+            ref_lu, ref_id, create_comment_dict(ref_lu), vintages, **fetch_kwargs
+        )
+    )
+
+    results_df = aggregate_results(pd.concat(results), ci_method, n_draws, seed)
+    print(
+        f"Fetched {len(lookup_df)} geographies of {state_dict[state]['name']} in {len(results) - 1} batches"
+    )
+    return write_results_parquet(results_df, shard_path)
+
+
+def _run_state_shard(args):
+    """Run one state shard with run_state_shard(). Used in a multiprocessing pool."""
+    state, shard_path, kwargs = args
+    return state, run_state_shard(state, shard_path, **kwargs)
+
+
+def run_national(
+    states=None,
+    areatypes=("tract",),
+    out_dir="tbl/national/",
+    processes=None,
+    batch_size=100,
+    vintages=None,
+    cache_dir="tbl/api_cache/",
+    max_threads=None,
+    offline=False,
+    ci_method="pooled",
+    n_draws=10000,
+    seed=0,
+    force=False,
+):
+    """Fetch and aggregate the results for every geography of the given area types in each state, sharded by state across worker processes,
+    and combine them into a single national results table. Each state shard is written to "{out_dir}/shards/{state FIPS}.parquet" as it finishes
+    (see run_state_shard()); states with an existing shard are skipped unless forced, so an interrupted run can be resumed.
+    The national table has one row per geography (with "GEO{GEOID key}" IDs, like utilities/regions.py), a reference row per state (e.g., "AK0", "WA0"),
+    and the US reference row ("US0").
+
+    Args:
+        states (list): 2 digit state FIPS codes to run (keys of state_dict), defaults to the 50 states and DC
+        areatypes (list): area types of the geographies to fetch ("tract", "county", and/or "place")
+        out_dir (str or pathlib.Path): output directory, created if it does not exist
+        processes (int): number of worker processes (one state shard per process at a time), defaults to the number of CPUs
+        batch_size (int): maximum number of geographies per request, see batch_state_lookup()
+        vintages (list): vintages to fetch, see run_fetch_and_merge()
+        cache_dir (str or pathlib.Path): on-disk response cache directory shared by all shards, see request_json()
+        max_threads (int): maximum number of concurrent census requests in each worker process, see fetch_census_data_and_compute()
+        offline (bool): whether to only use responses from cache_dir, see request_json()
+        ci_method (str): CI method of aggregate_results()
+        n_draws (int): number of samples per row for the "monte_carlo" CI method
+        seed (int): seed of the random number generator for the "monte_carlo" CI method
+        force (bool): whether to rerun states that already have a shard
+    Returns:
+        pathlib.Path of the national results Parquet file ("{out_dir}/national_results.parquet")
+    """
+    states = list(states or state_dict)
+    unknown = [state for state in states if state not in state_dict]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown state FIPS codes: {unknown} (see state_dict)")
+    unknown = [a for a in areatypes if a not in national_areatype_dict]
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unsupported area types: {unknown} (use {list(national_areatype_dict)})"
+        )
+    if offline and cache_dir is None:
+        raise ValueError("Offline mode needs a cache_dir of saved responses")
+
+    # fail before scheduling any fetches if a request would be rejected
+    validate_census_requests(
+        pd.DataFrame(
+            {
+                "AREATYPE": [national_areatype_dict[a]["AREATYPE"] for a in areatypes]
+                + ["State", "Nation"]
+            }
+        ),
+        vintages,
+        cache_dir or "tbl/api_cache/",
+        offline,
+    )
+
+    out_dir = Path(out_dir)
+    shard_dir = out_dir / "shards"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    shard_paths = {state: shard_dir / f"{state}.parquet" for state in states}
+
+    kwargs = {
+        "areatypes": areatypes,
+        "batch_size": batch_size,
+        "vintages": vintages,
+        "cache_dir": cache_dir,
+        "max_threads": max_threads,
+        "offline": offline,
+        "ci_method": ci_method,
+        "n_draws": n_draws,
+        "seed": seed,
+    }
+    args = []
+    for state, shard_path in shard_paths.items():
+        if shard_path.exists() and not force:
+            print(f"Using existing shard for {state_dict[state]['name']}: {shard_path}")
+        else:
+            args.append((state, shard_path, kwargs))
+
+    with Pool(processes) as pool:
+        for state, shard_path in pool.imap_unordered(_run_state_shard, args):
+            print(f"Finished shard for {state_dict[state]['name']}: {shard_path}")
+
+    # the US reference row is only fetched once
+    us_path = shard_dir / "us.parquet"
+    if not us_path.exists() or force:
+        us_lu = add_reference_rows(pd.DataFrame(columns=lookup_cols), "02").iloc[1:]
+        us_df = fetch_and_merge(
+            us_lu,
+            "US0",
+            create_comment_dict(us_lu),
+            vintages,
+            cache_dir=cache_dir,
+            max_threads=max_threads,
+            offline=offline,
+        )
+        write_results_parquet(
+            aggregate_results(us_df, ci_method, n_draws, seed), us_path
+        )
+
+    national_df = pd.concat(
+        [pd.read_parquet(shard_paths[state]) for state in states]
+        + [pd.read_parquet(us_path)],
+        ignore_index=True,
+    )
+    return write_results_parquet(
+        national_df, out_dir / "national_results.parquet", row_group_size=10000
+    )
@@ -0,0 +1,139 @@
+"""
+This is used to pre-render the results table as one static JSON document per GVV ID (plus gzip and brotli compressed copies), so that an API can serve the documents as-is.
+"""
+
+import gzip
+import json
+import numpy as np
+from pathlib import Path
+from multiprocessing.pool import Pool
+from utilities.luts import *
+from utilities.functions import get_reference_ids
+from utilities.export import get_column_metadata, select_vintage
+
+# brotli is optional; if it is not installed, only gzip copies are written
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _json_values(values):
+    """Convert a float array to a list with missing values as None, so they can be written as JSON."""
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def results_to_payloads(df, vintage=None):
+    """Convert the results table to one document per row. Each document has the non-data columns of the row,
+    and a list of variables with their value, 90% confidence interval bounds (if any), description, and source.
+    Descriptions and sources are the same as in the wide reports (demographics_descriptions, or the column metadata for other measures).
+    If the results table has several vintages, only the rows of one vintage are converted, so each GVV ID has one document.
+
+    Args:
+        df (pandas.DataFrame): results table from aggregate_results(), or read with read_results()
+        vintage (int): vintage of the documents, if the results table has several vintages; defaults to the latest vintage
+    Returns:
+        dictionary with GVV IDs as keys and documents (dictionaries) as values
+    """
+    df = select_vintage(df, vintage)
+    info_cols = [col for col in df.columns if col in non_data_cols]
+    measures = [
+        col
+        for col in df.columns
+        if col not in non_data_cols and not col.endswith(("_low", "_high"))
+    ]
+    # use the report descriptions, or the column metadata for measures without one
+    metadata = []
+    for col in measures:
+        if col in demographics_descriptions:
+            metadata.append(demographics_descriptions[col])
+        else:
+            column_metadata = get_column_metadata(col)
+            metadata.append(
+                {
+                    "description": column_metadata["long_name"],
+                    "source": column_metadata["source"],
+                }
+            )
+
+    # get the values and CI bounds of each measure as rows of float arrays (bounds are all missing if a measure has none)
+    values = df[measures].to_numpy(dtype="float64")
+    low = df.reindex(columns=[f"{m}_low" for m in measures]).to_numpy(dtype="float64")
+    high = df.reindex(columns=[f"{m}_high" for m in measures]).to_numpy(dtype="float64")
+    values, low, high = [[_json_values(row) for row in a] for a in [values, low, high]]
+
+    info = df[info_cols].astype(object).where(df[info_cols].notna(), None)
+    payloads = {}
+    for i, row in enumerate(info.to_dict("records")):
+        row["data"] = [
+            {
+                "variable": measure,
+                "value": values[i][j],
+                "low": low[i][j],
+                "high": high[i][j],
+                "description": metadata[j]["description"],
+                "source": metadata[j]["source"],
+            }
+            for j, measure in enumerate(measures)
+        ]
+        payloads[row["id"]] = row
+
+    return payloads
+
+
+def _write_payload(args):
+    """Write one JSON document, and its gzip and brotli (if installed) compressed copies. Used in a multiprocessing pool."""
+    out_path, data = args
+    out_path.write_bytes(data)
+    out_path.with_name(out_path.name + ".gz").write_bytes(
+        gzip.compress(data, compresslevel=9, mtime=0)
+    )
+    if brotli is not None:
+        out_path.with_name(out_path.name + ".br").write_bytes(
+            brotli.compress(data, quality=11)
+        )
+    return out_path
+
+
+def export_payloads(df, out_dir="json/", processes=None, vintage=None, state="02"):
+    """Write one compact JSON document per GVV ID (e.g., "json/AK124.json"), and a "reference.json" document of the
+    state and national comparison rows (see get_reference_ids()). Each document is also written gzip compressed (".json.gz"), and
+    brotli compressed (".json.br") if the brotli package is installed. Documents are compressed and written in parallel.
+
+    Args:
+        df (pandas.DataFrame): results table from aggregate_results(), or read with read_results()
+        out_dir (str or pathlib.Path): output directory, created if it does not exist
+        processes (int): number of worker processes, defaults to the number of CPUs
+        vintage (int): vintage of the documents, if the results table has several vintages; defaults to the latest vintage
+        state (str): 2 digit state FIPS code of the state reference row, defaults to "02" (Alaska)
+    Returns:
+        list of pathlib.Paths of the uncompressed JSON documents
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    payloads = results_to_payloads(df, vintage)
+    ref_ids = get_reference_ids(state)
+    reference = {id: payloads[id] for id in ref_ids if id in payloads}
+    if len(reference) < len(ref_ids):
+        print(
+            f"Reference rows missing from results: {[id for id in ref_ids if id not in reference]}"
+        )
+
+    docs = [(out_dir / f"{id}.json", payload) for id, payload in payloads.items()]
+    docs.append((out_dir / "reference.json", reference))
+    docs = [
+        (
+            out_path,
+            json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        )
+        for out_path, doc in docs
+    ]
+
+    with Pool(processes) as pool:
+        paths = pool.map(_write_payload, docs, chunksize=16)
+
+    if brotli is None:
+        print("brotli is not installed, so only gzip compressed copies were written")
+
+    return paths
@@ -0,0 +1,368 @@
+"""
+This is used to run the processing pipeline of fetch_data_and_export.ipynb (and the polygon join) as a chain of memoized stages.
+Each stage is keyed by a content hash of its inputs: the artifacts of the stages it depends on, the parameters it uses,
+the input files it reads, and the source code it runs. Stages with an unchanged key are served from stored artifacts,
+so only the stages whose inputs changed are recomputed.
+"""
+
+import hashlib
+import inspect
+import json
+import time
+import pandas as pd
+from pathlib import Path
+from utilities.luts import *
+from utilities.functions import run_fetch_and_merge, aggregate_results
+from utilities.export import export_results
+from utilities.polygons import (
+    export_demographics,
+    hash_census_shapefiles,
+    load_census_polygons,
+)
+from utilities.reports import write_reports, group_ids_by_borough
+from utilities.payloads import export_payloads
+
+# default parameters of the pipeline; each stage is only keyed by the parameters it uses
+# "processes", "max_threads", and "offline" only limit how the work is done, so they are not part of any key
+default_params = {
+    "lookup_path": "tbl/NCRPlaces_Census_04192024.csv",
+    "ids": None,
+    "reference": "fetch",
+    "reference_cache": "tbl/reference_rows.parquet",
+    "vintages": None,
+    "cache_dir": None,
+    "ci_method": "pooled",
+    "n_draws": 10000,
+    "seed": 0,
+    "processes": None,
+    "max_threads": None,
+    "offline": False,
+    "qc_dir": "qc/",
+    "csv_path": "tbl/data_to_export.csv",
+    "polygon_paths": ["shp/demographics.gpkg"],
+    "shp_dir": "shp/",
+    "store_path": "shp/census_polygons.parquet",
+    "points_path": "tbl/alaska_point_locations.csv",
+    "report_dir": "tbl/reports/",
+    "report_formats": [".csv"],
+    "payload_dir": "json/",
+}
+
+utilities_dir = Path(__file__).parent
+
+
+def hash_file(path):
+    """Compute a content hash of a file.
+
+    Args:
+        path (str or pathlib.Path): file path
+    Returns:
+        hex digest string
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_frame(df):
+    """Compute a content hash of a DataFrame from its column names, dtypes, and values (the index is ignored).
+
+    Args:
+        df (pandas.DataFrame): table to hash
+    Returns:
+        hex digest string
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([[c, str(t)] for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _lookup_stage(inputs, params):
+    """Load the lookup table, optionally limited to a subset of GVV IDs."""
+    df = pd.read_csv(params["lookup_path"])
+    if params["ids"] is not None:
+        df = df[df["id"].isin(params["ids"])]
+    return df.reset_index(drop=True)
+
+
+def _fetch_stage(inputs, params):
+    """Fetch and merge the data for every GVV ID in the lookup table."""
+    results_df = run_fetch_and_merge(
+        inputs["lookup"],
+        reference=params["reference"],
+        reference_cache=params["reference_cache"],
+        vintages=params["vintages"],
+        cache_dir=params["cache_dir"],
+        processes=params["processes"],
+        max_threads=params["max_threads"],
+        offline=params["offline"],
+    )
+    return results_df.reset_index(drop=True)
+
+
+def _aggregate_stage(inputs, params):
+    """Aggregate any rows with duplicate IDs."""
+    return aggregate_results(
+        inputs["fetch"], params["ci_method"], params["n_draws"], params["seed"]
+    )
+
+
+def _qc_stage(inputs, params):
+    """Save the original one-to-many results and the aggregated results to CSV for manual QC."""
+    results_df = inputs["fetch"]
+    aggregated_results_df = inputs["aggregate"]
+    qc_dir = Path(params["qc_dir"])
+    qc_dir.mkdir(parents=True, exist_ok=True)
+
+    dups = results_df[results_df.duplicated(subset="id")]["id"].unique().tolist()
+    paths = [qc_dir / "unaggregated_results.csv", qc_dir / "aggregated_results.csv"]
+    results_df[results_df["id"].isin(dups)].to_csv(paths[0], index=False)
+    aggregated_results_df[aggregated_results_df["id"].isin(dups)].to_csv(
+        paths[1], index=False
+    )
+    return paths
+
+
+def _export_stage(inputs, params):
+    """Save the aggregated results to CSV and Parquet."""
+    parquet_path = export_results(inputs["aggregate"], params["csv_path"])
+    return [Path(params["csv_path"]), parquet_path]
+
+
+def _polygons_stage(inputs, params):
+    """Join the aggregated results to census polygons and export the demographics layer."""
+    export_demographics(
+        inputs["aggregate"],
+        params["polygon_paths"],
+        params["shp_dir"],
+        store_path=params["store_path"],
+    )
+    return [Path(p) for p in params["polygon_paths"]]
+
+
+def _report_stage(inputs, params):
+    """Write a wide report for the communities of each borough."""
+    polys = load_census_polygons(params["shp_dir"], params["store_path"])
+    groups = group_ids_by_borough(pd.read_csv(params["points_path"]), polys)
+    return write_reports(
+        inputs["aggregate"], groups, params["report_dir"], params["report_formats"]
+    )
+
+
+def _payloads_stage(inputs, params):
+    """Pre-render one JSON document per GVV ID for the API."""
+    return export_payloads(
+        inputs["aggregate"], params["payload_dir"], processes=params["processes"]
+    )
+
+
+# pipeline stages, in the order they run
+# "deps" are the stages whose artifacts are inputs, "params" are the parameters the stage uses,
+# "files" gets content hashes of the input files the stage reads, and "modules" are the utilities modules it runs
+# stages return either a DataFrame (stored as Parquet) or a list of output file paths (stored as a manifest of file hashes)
+stages = {
+    "lookup": {
+        "deps": [],
+        "params": ["lookup_path", "ids"],
+        "files": lambda params: {"lookup": hash_file(params["lookup_path"])},
+        "modules": [],
+        "run": _lookup_stage,
+    },
+    "fetch": {
+        "deps": ["lookup"],
+        "params": ["reference", "reference_cache", "vintages"],
+        # reused reference rows come from the reference row cache, so its content is part of the key
+        "files": lambda params: {
+            "reference_cache": (
+                hash_file(params["reference_cache"])
+                if params["reference"] == "cache"
+                and Path(params["reference_cache"]).exists()
+                else None
+            )
+        },
+        "modules": ["functions"],
+        "run": _fetch_stage,
+    },
+    "aggregate": {
+        "deps": ["fetch"],
+        "params": ["ci_method", "n_draws", "seed"],
+        "files": lambda params: {},
+        "modules": ["functions", "uncertainty"],
+        "run": _aggregate_stage,
+    },
+    "qc": {
+        "deps": ["fetch", "aggregate"],
+        "params": ["qc_dir"],
+        "files": lambda params: {},
+        "modules": [],
+        "run": _qc_stage,
+    },
+    "export": {
+        "deps": ["aggregate"],
+        "params": ["csv_path"],
+        "files": lambda params: {},
+        "modules": ["export"],
+        "run": _export_stage,
+    },
+    "polygons": {
+        "deps": ["aggregate"],
+        "params": ["polygon_paths", "shp_dir"],
+        "files": lambda params: {"shp": hash_census_shapefiles(params["shp_dir"])},
+        "modules": ["polygons", "functions"],
+        "run": _polygons_stage,
+    },
+    "report": {
+        "deps": ["aggregate"],
+        "params": ["points_path", "shp_dir", "report_dir", "report_formats"],
+        "files": lambda params: {
+            "points": hash_file(params["points_path"]),
+            "shp": hash_census_shapefiles(params["shp_dir"]),
+        },
+        "modules": ["reports", "polygons", "export"],
+        "run": _report_stage,
+    },
+    "payloads": {
+        "deps": ["aggregate"],
+        "params": ["payload_dir"],
+        "files": lambda params: {},
+        "modules": ["payloads", "export"],
+        "run": _payloads_stage,
+    },
+}
+
+
+def stage_key(name, params, dep_hashes):
+    """Compute the key of a stage from the content hashes of its dependencies, its parameters, its input files,
+    and the source code of the stage function, the modules it runs, and luts.py.
+
+    Args:
+        name (str): stage name
+        params (dict): pipeline parameters
+        dep_hashes (dict): stage names as keys and content hashes of their artifacts as values
+    Returns:
+        hex digest string
+    """
+    stage = stages[name]
+    code = [inspect.getsource(stage["run"])]
+    for module in stage["modules"] + ["luts"]:
+        code.append(hash_file(utilities_dir / f"{module}.py"))
+
+    key = {
+        "stage": name,
+        "params": {p: params[p] for p in stage["params"]},
+        "deps": {dep: dep_hashes[dep] for dep in stage["deps"]},
+        "files": stage["files"](params),
+        "code": code,
+    }
+    return hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+
+
+def _load_stored(store_dir, name, key):
+    """Get the manifest of a stored artifact, or None if there is no valid artifact for the key.
+    Artifacts of output files are only valid if every file still exists with the same content.
+    """
+    manifest_path = store_dir / f"{name}-{key}.json"
+    if not manifest_path.exists():
+        return None
+    manifest = json.loads(manifest_path.read_text())
+    if manifest["type"] == "frame":
+        if not (store_dir / f"{name}-{key}.parquet").exists():
+            return None
+    else:
+        for path, file_hash in manifest["outputs"].items():
+            if not Path(path).exists() or hash_file(path) != file_hash:
+                return None
+    return manifest
+
+
+def _store(store_dir, name, key, artifact):
+    """Store the artifact of a stage and return its manifest."""
+    if isinstance(artifact, pd.DataFrame):
+        artifact.to_parquet(store_dir / f"{name}-{key}.parquet", index=False)
+        manifest = {"type": "frame", "content_hash": hash_frame(artifact)}
+    else:
+        outputs = {str(path): hash_file(path) for path in artifact}
+        manifest = {
+            "type": "files",
+            "outputs": outputs,
+            "content_hash": hashlib.sha256(
+                json.dumps(outputs, sort_keys=True).encode()
+            ).hexdigest(),
+        }
+    (store_dir / f"{name}-{key}.json").write_text(json.dumps(manifest))
+    return manifest
+
+
+def run_pipeline(params=None, targets=None, store_dir="tbl/pipeline/", force=()):
+    """Run the pipeline stages needed for the targets, serving unchanged stages from stored artifacts.
+    Stages run in the order of the stages dictionary: lookup, fetch (and merge, with run_fetch_and_merge()), aggregate,
+    qc (the QC CSVs), export (CSV and Parquet), polygons (the demographics layer), report (wide reports by borough), and payloads (JSON documents).
+    Because stages are keyed by the content of their inputs, a stage that is rerun with the same result (e.g., a forced fetch
+    that returns the same data) does not invalidate the stages after it.
+
+    Args:
+        params (dict): pipeline parameters that differ from default_params
+        targets (list): stages to run, along with the stages they depend on; defaults to all stages
+        store_dir (str or pathlib.Path): directory of the stored artifacts
+        force (list): stages to recompute even if their key is unchanged (e.g., ["fetch"] to get the latest data from the APIs)
+    Returns:
+        dictionary with the target stage names as keys and their artifacts (DataFrames or lists of output paths) as values
+    """
+    unknown = set(params or {}) - set(default_params)
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown pipeline parameters: {sorted(unknown)}")
+    unknown = set(targets or []).union(force) - set(stages)
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Unknown pipeline stages: {sorted(unknown)} (use {list(stages)})"
+        )
+    params = {**default_params, **(params or {})}
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    # find the targets and every stage they depend on
+    needed = set()
+    pending = list(targets or stages)
+    while len(pending) > 0:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(stages[name]["deps"])
+
+    keys = {}
+    dep_hashes = {}
+    artifacts = {}
+
+    def load(name):
+        """Get the artifact of a stage, reading a stored DataFrame only when it is first needed."""
+        if name not in artifacts:
+            artifacts[name] = pd.read_parquet(
+                store_dir / f"{name}-{keys[name]}.parquet"
+            )
+        return artifacts[name]
+
+    for name in stages:
+        if name not in needed:
+            continue
+        stage = stages[name]
+        keys[name] = stage_key(name, params, dep_hashes)
+
+        manifest = None
+        if name not in force:
+            manifest = _load_stored(store_dir, name, keys[name])
+        if manifest is not None:
+            print(f"{name}: unchanged, using stored artifact {keys[name][:12]}")
+            if manifest["type"] == "files":
+                artifacts[name] = [Path(p) for p in manifest["outputs"]]
+        else:
+            start = time.time()
+            inputs = {dep: load(dep) for dep in stage["deps"]}
+            artifacts[name] = stage["run"](inputs, params)
+            manifest = _store(store_dir, name, keys[name], artifacts[name])
+            print(f"{name}: computed in {time.time() - start:.1f}s")
+        dep_hashes[name] = manifest["content_hash"]
+
+    return {name: load(name) for name in targets or stages}
@@ -0,0 +1,422 @@
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+import hashlib
+import json
+from pathlib import Path
+from utilities.luts import *
+from datetime import date
+from utilities.functions import encode_geoid_key, decode_geoid_key, geoid_key_to_geoidfq
+from utilities.export import select_vintage
+
+
+def read_census_polygons(shp_dir="shp/", crs=3857):
+    """Read the 2020 TIGER/Line county, tract, and place polygons into a single geodataframe keyed by integer GEOID keys.
+
+    Args:
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+        crs (int): EPSG code to reproject the polygons to (defaults to web mercator)
+    Returns:
+        geopandas.GeoDataFrame with "geoid_key", "placename", "classfp", and "geometry" columns
+    """
+    shp_dir = Path(shp_dir)
+    polys = []
+
+    for areatype_str, shp in tigerline_dict.items():
+        gdf = gpd.read_file(shp_dir / shp["fname"]).to_crs(crs)
+        # tract codes are the concatenated county and tract codes, to match the standard 9 digit tract code
+        code = gdf[shp["code_cols"]].sum(axis=1)
+        gdf["geoid_key"] = encode_geoid_key(areatype_str, gdf["STATEFP20"], code)
+        # tract NAMELSAD is just "Census Tract", so add the tract number to match the PLACENAME in the lookup table
+        if areatype_str == "tract":
+            gdf["placename"] = "Census Tract " + gdf["NAME20"]
+            gdf["classfp"] = None
+        else:
+            gdf["placename"] = gdf["NAMELSAD20"]
+            gdf["classfp"] = gdf["CLASSFP20"]
+        polys.append(gdf[["geoid_key", "placename", "classfp", "geometry"]])
+
+    return gpd.GeoDataFrame(pd.concat(polys, ignore_index=True), geometry="geometry")
+
+
+def hash_census_shapefiles(shp_dir="shp/"):
+    """Compute a content hash of the source TIGER/Line shapefiles, used to check if the geometry store needs to be rebuilt.
+
+    Args:
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+    Returns:
+        hex digest string
+    """
+    shp_dir = Path(shp_dir)
+    h = hashlib.sha256()
+    for shp in tigerline_dict.values():
+        for suffix in [".shp", ".shx", ".dbf", ".prj"]:
+            fp = shp_dir / Path(shp["fname"]).with_suffix(suffix)
+            h.update(fp.name.encode())
+            h.update(fp.read_bytes())
+    return h.hexdigest()
+
+
+def build_geometry_store(
+    shp_dir="shp/", store_path="shp/census_polygons.parquet", crs=3857
+):
+    """Read and reproject the census polygons once, and write them to a GeoParquet geometry store.
+    Rows are sorted along a Hilbert curve and written with a bounding box column, so that
+    reads filtered by bounding box only need to touch nearby rows. The hash of the source
+    shapefiles and the CRS are saved in the file metadata.
+
+    Args:
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+        store_path (str or pathlib.Path): output GeoParquet path
+        crs (int): EPSG code to reproject the polygons to (defaults to web mercator)
+    Returns:
+        geopandas.GeoDataFrame of the stored polygons
+    """
+    polys = read_census_polygons(shp_dir, crs)
+    polys = polys.iloc[np.argsort(polys.geometry.hilbert_distance())]
+    polys = polys.reset_index(drop=True)
+
+    polys.to_parquet(store_path, write_covering_bbox=True, row_group_size=100)
+
+    # add the source hash and CRS to the file metadata
+    table = pq.read_table(store_path)
+    metadata = dict(table.schema.metadata)
+    metadata[b"census_polygons"] = json.dumps(
+        {"source_hash": hash_census_shapefiles(shp_dir), "crs": crs}
+    ).encode()
+    pq.write_table(
+        table.replace_schema_metadata(metadata), store_path, row_group_size=100
+    )
+
+    return polys
+
+
+def load_census_polygons(
+    shp_dir="shp/", store_path="shp/census_polygons.parquet", crs=3857, bbox=None
+):
+    """Load the census polygons from the geometry store, rebuilding the store first only if
+    it does not exist, was built with a different CRS, or the source shapefiles have changed.
+
+    Args:
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+        store_path (str or pathlib.Path): GeoParquet geometry store path
+        crs (int): EPSG code of the stored polygons (defaults to web mercator)
+        bbox (tuple): optional (minx, miny, maxx, maxy) in the store CRS; only polygons intersecting the box are read
+    Returns:
+        geopandas.GeoDataFrame with "geoid_key", "placename", "classfp", and "geometry" columns
+    """
+    store_path = Path(store_path)
+
+    rebuild = True
+    if store_path.exists():
+        metadata = pq.read_schema(store_path).metadata or {}
+        if b"census_polygons" in metadata:
+            store_info = json.loads(metadata[b"census_polygons"])
+            rebuild = store_info["crs"] != crs or store_info[
+                "source_hash"
+            ] != hash_census_shapefiles(shp_dir)
+
+    if rebuild:
+        print(f"Building census geometry store: {store_path}")
+        build_geometry_store(shp_dir, store_path, crs)
+
+    return gpd.read_parquet(
+        store_path, columns=["geoid_key", "placename", "classfp", "geometry"], bbox=bbox
+    )
+
+
+def explode_results_geoids(results, state_fips="02"):
+    """List every GEOID used for each GVV ID in the results table, one row per GEOID, with its integer GEOID key.
+    Aggregated results have a comma-separated string of GEOIDs; these are split and exploded in one step.
+
+    Args:
+        results (pandas.DataFrame): results table from aggregate_results(), or read from data_to_export.csv
+        state_fips (str): state FIPS code of the county, place, and tract GEOIDs in the results table
+    Returns:
+        pandas.DataFrame with "id" and "geoid_key" columns
+    """
+    geoids = results[["id", "areatype", "GEOID"]].copy()
+    # GEOIDs may be read from CSV as integers; the integer keys do not depend on zero padding
+    geoids["GEOID"] = geoids["GEOID"].astype(str).str.split(", ")
+    geoids = geoids.explode("GEOID", ignore_index=True)
+    geoids["areatype_str"] = geoids["areatype"].map(areatype_dict)
+    geoids["geoid_key"] = 0
+
+    for areatype_str, idx in geoids.groupby("areatype_str").groups.items():
+        if areatype_str in ["zcta", "us"]:
+            state = 0
+        else:
+            state = state_fips
+        if areatype_str in ["state", "us"]:
+            code = 0
+        else:
+            code = geoids.loc[idx, "GEOID"]
+        geoids.loc[idx, "geoid_key"] = encode_geoid_key(areatype_str, state, code)
+
+    return geoids[["id", "geoid_key"]]
+
+
+def join_results_to_polygons(results, polys, state_fips="02", vintage=None):
+    """Join the results table to census polygons. Results that represent multiple geographies get the dissolved polygon of all their geographies.
+    Results without a polygon (the state of AK and the US) will have empty geometry.
+    If the results table has several vintages, only the rows of one vintage are joined, so each GVV ID has one feature.
+
+    Args:
+        results (pandas.DataFrame): results table from aggregate_results(), or read from data_to_export.csv
+        polys (geopandas.GeoDataFrame): census polygons from load_census_polygons()
+        state_fips (str): state FIPS code of the county, place, and tract GEOIDs in the results table
+        vintage (int): vintage of the demographics, if the results table has several vintages; defaults to the latest vintage
+    Returns:
+        geopandas.GeoDataFrame
+    """
+    results = select_vintage(results, vintage)
+    geoids = explode_results_geoids(results.drop_duplicates("id"), state_fips)
+    geoids = gpd.GeoDataFrame(
+        geoids.merge(polys[["geoid_key", "geometry"]], how="left", on="geoid_key"),
+        geometry="geometry",
+        crs=polys.crs,
+    )
+
+    # dissolve polygons for all multi-geography IDs at once, and keep single polygons as-is
+    is_multi = geoids["id"].duplicated(keep=False)
+    dissolved = geoids[is_multi].dissolve(by="id", as_index=False)
+    id_polys = pd.concat(
+        [geoids[~is_multi][["id", "geometry"]], dissolved[["id", "geometry"]]]
+    )
+
+    gdf = results.merge(id_polys, how="left", on="id")
+    return gpd.GeoDataFrame(gdf, geometry="geometry", crs=polys.crs)
+
+
+def write_demographics_layer(gdf, out_path):
+    """Write the demographics layer with full column names, UTF-8 encoding, and a spatial index.
+    The output format is chosen from the file extension: GeoPackage (".gpkg") or FlatGeobuf (".fgb").
+    FlatGeobuf spatial indexes do not support empty geometry, so rows without a polygon (the state of AK and the US) are not written to ".fgb" files.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): demographics layer from join_results_to_polygons()
+        out_path (str or pathlib.Path): output file path
+    Returns:
+        None
+    """
+    out_path = Path(out_path)
+
+    if out_path.suffix == ".gpkg":
+        driver = "GPKG"
+    elif out_path.suffix == ".fgb":
+        driver = "FlatGeobuf"
+        if gdf.geometry.isna().any():
+            print(
+                f"Rows without geometry are not written to {out_path}: {gdf[gdf.geometry.isna()]['id'].tolist()}"
+            )
+            gdf = gdf[~gdf.geometry.isna()]
+    else:
+        raise ValueError(
+            f"Unsupported demographics layer format: {out_path.suffix} (use .gpkg or .fgb)"
+        )
+
+    # overwrite any existing file, since GeoPackages would otherwise be appended to
+    out_path.unlink(missing_ok=True)
+    gdf.to_file(
+        out_path,
+        driver=driver,
+        layer="demographics",
+        encoding="utf-8",
+        SPATIAL_INDEX="YES",
+    )
+
+
+def export_demographics(
+    results,
+    out_paths=("shp/demographics.gpkg",),
+    shp_dir="shp/",
+    crs=3857,
+    store_path="shp/census_polygons.parquet",
+    vintage=None,
+):
+    """Join the results table to census polygons and write the demographics layer in one call.
+    Polygons are loaded from the geometry store (see load_census_polygons()).
+    The word "county" is replaced with "borough" in the comments before export.
+
+    Args:
+        results (pandas.DataFrame): results table from aggregate_results(), or read from data_to_export.csv
+        out_paths (list): output file paths, each either a GeoPackage (".gpkg") or FlatGeobuf (".fgb")
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+        crs (int): EPSG code of the output geometry (defaults to web mercator)
+        store_path (str or pathlib.Path): GeoParquet geometry store path
+        vintage (int): vintage of the demographics, if the results table has several vintages; defaults to the latest vintage
+    Returns:
+        geopandas.GeoDataFrame that was written to file
+    """
+    polys = load_census_polygons(shp_dir, store_path, crs)
+    gdf = join_results_to_polygons(results, polys, vintage=vintage)
+
+    gdf["comment"] = gdf["comment"].replace({"county": "borough"}, regex=True)
+
+    for out_path in out_paths:
+        write_demographics_layer(gdf, out_path)
+
+    return gdf
+
+
+def assign_geoidfqs(points, polys):
+    """Assign a census geography to each community point with one spatial join against the census polygons.
+    Each point gets the most preferred geography that contains it, in the order of areatype_preference
+    (incorporated place, then census designated place, then tract, then county).
+    Points outside of all polygons (e.g., on small islands or spits) are assigned the nearest county.
+
+    Args:
+        points (pandas.DataFrame): point locations with "id", "latitude", and "longitude" columns
+        polys (geopandas.GeoDataFrame): census polygons from load_census_polygons()
+    Returns:
+        pandas.DataFrame with "id", "GEOIDFQ", "PLACENAME", "AREATYPE", and "COMMENT" columns
+    """
+    points = gpd.GeoDataFrame(
+        points[["id"]],
+        geometry=gpd.points_from_xy(points["longitude"], points["latitude"], crs=4326),
+    ).to_crs(polys.crs)
+
+    polys = polys.copy()
+    sumlev, _, _ = decode_geoid_key(polys["geoid_key"])
+    polys["AREATYPE"] = None
+    polys.loc[sumlev == sumlev_dict["county"]["sumlev"], "AREATYPE"] = "County"
+    polys.loc[sumlev == sumlev_dict["tract"]["sumlev"], "AREATYPE"] = "Census tract"
+    is_place = sumlev == sumlev_dict["place"]["sumlev"]
+    polys.loc[is_place, "AREATYPE"] = polys.loc[is_place, "classfp"].map(
+        place_classfp_dict
+    )
+    # other place classes (e.g., military installations) are not used
+    polys = polys[polys["AREATYPE"].notna()]
+    polys["rank"] = polys["AREATYPE"].map(areatype_preference.index)
+
+    cols = ["id", "geoid_key", "placename", "AREATYPE", "rank"]
+    matches = gpd.sjoin(points, polys, how="inner", predicate="within")[cols]
+    matches = matches.sort_values(["id", "rank"]).drop_duplicates("id")
+    matches["COMMENT"] = np.nan
+
+    unmatched = points[~points["id"].isin(matches["id"])]
+    if len(unmatched) > 0:
+        counties = polys[polys["AREATYPE"] == "County"]
+        nearest = gpd.sjoin_nearest(unmatched, counties, how="inner")[cols]
+        nearest = nearest.drop_duplicates("id")
+        nearest["COMMENT"] = (
+            "Point is outside of all census polygons; nearest county assigned"
+        )
+        matches = pd.concat([matches, nearest])
+
+    matches["GEOIDFQ"] = geoid_key_to_geoidfq(matches["geoid_key"])
+    matches = matches.rename(columns={"placename": "PLACENAME"})
+
+    return matches[["id", "GEOIDFQ", "PLACENAME", "AREATYPE", "COMMENT"]].reset_index(
+        drop=True
+    )
+
+
+def build_candidate_lookup(points, polys, geoid_lu_df=None):
+    """Build a candidate GVV ID / GEOIDFQ lookup table (like NCRPlaces_Census_{MMDDYYYY}.csv) by assigning a census geography to every community point.
+    Rows of the current lookup table for IDs that are not community points (e.g., boroughs and census areas) are kept as-is.
+
+    Args:
+        points (pandas.DataFrame): point locations table (e.g., alaska_point_locations.csv)
+        polys (geopandas.GeoDataFrame): census polygons from load_census_polygons()
+        geoid_lu_df (pandas.DataFrame): current lookup table, optional
+    Returns:
+        pandas.DataFrame with the columns of the lookup table
+    """
+    point_cols = [
+        "id",
+        "name",
+        "alt_name",
+        "region",
+        "country",
+        "latitude",
+        "longitude",
+    ]
+    candidate = points[point_cols].merge(assign_geoidfqs(points, polys), on="id")
+    candidate.insert(point_cols.index("longitude") + 1, "type", "community")
+
+    if geoid_lu_df is not None:
+        other = geoid_lu_df[~geoid_lu_df["id"].isin(points["id"])]
+        candidate = pd.concat([other, candidate], ignore_index=True)
+        candidate = candidate[geoid_lu_df.columns]
+
+    return candidate
+
+
+def diff_geoid_lookup(geoid_lu_df, candidate):
+    """Compare a candidate lookup table to the current one. IDs with multiple GEOIDFQs are compared as a set.
+
+    Args:
+        geoid_lu_df (pandas.DataFrame): current lookup table
+        candidate (pandas.DataFrame): candidate lookup table from build_candidate_lookup()
+    Returns:
+        pandas.DataFrame with one row per added, removed, or changed ID
+    """
+
+    def collapse(df):
+        df = df.sort_values(["id", "GEOIDFQ"])
+        return df.groupby("id").agg(
+            name=("name", "first"),
+            GEOIDFQ=("GEOIDFQ", ", ".join),
+            AREATYPE=("AREATYPE", lambda x: ", ".join(x.astype(str))),
+        )
+
+    diff = collapse(geoid_lu_df).join(
+        collapse(candidate), how="outer", lsuffix="_current", rsuffix="_candidate"
+    )
+    diff["name"] = diff["name_current"].fillna(diff["name_candidate"])
+
+    diff["status"] = "changed"
+    diff.loc[diff["GEOIDFQ_current"].isna(), "status"] = "added"
+    diff.loc[diff["GEOIDFQ_candidate"].isna(), "status"] = "removed"
+    diff.loc[diff["GEOIDFQ_current"] == diff["GEOIDFQ_candidate"], "status"] = (
+        "unchanged"
+    )
+
+    cols = [
+        "name",
+        "status",
+        "GEOIDFQ_current",
+        "GEOIDFQ_candidate",
+        "AREATYPE_current",
+        "AREATYPE_candidate",
+    ]
+    return diff[diff["status"] != "unchanged"][cols].reset_index()
+
+
+def export_candidate_lookup(
+    points_path="tbl/alaska_point_locations.csv",
+    geoid_lu_path="tbl/NCRPlaces_Census_04192024.csv",
+    out_dir="tbl/",
+    shp_dir="shp/",
+    store_path="shp/census_polygons.parquet",
+):
+    """Regenerate the GVV ID / GEOIDFQ lookup table from the point locations, and write it with a diff against the current table.
+    Outputs are NCRPlaces_Census_{MMDDYYYY}_candidate.csv and NCRPlaces_Census_{MMDDYYYY}_diff.csv in the output directory.
+    The candidate table should be reviewed before replacing the current one, since some communities are matched to geographies by hand.
+
+    Args:
+        points_path (str or pathlib.Path): point locations CSV
+        geoid_lu_path (str or pathlib.Path): current lookup table CSV
+        out_dir (str or pathlib.Path): output directory
+        shp_dir (str or pathlib.Path): directory containing the tl_2020_02_*20.shp shapefiles
+        store_path (str or pathlib.Path): GeoParquet geometry store path
+    Returns:
+        Tuple of pandas.DataFrames: (candidate lookup table, diff)
+    """
+    points = pd.read_csv(points_path)
+    geoid_lu_df = pd.read_csv(geoid_lu_path)
+    polys = load_census_polygons(shp_dir, store_path)
+
+    candidate = build_candidate_lookup(points, polys, geoid_lu_df)
+    diff = diff_geoid_lookup(geoid_lu_df, candidate)
+
+    out_dir = Path(out_dir)
+    stem = f"NCRPlaces_Census_{date.today().strftime('%m%d%Y')}"
+    candidate.to_csv(out_dir / f"{stem}_candidate.csv", index=False)
+    diff.to_csv(out_dir / f"{stem}_diff.csv", index=False)
+
+    print(diff["status"].value_counts().to_string())
+
+    return candidate, diff
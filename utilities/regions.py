@@ -0,0 +1,147 @@
+"""
+This is used to compute demographics for custom regions (e.g., a grouping of Anchorage neighborhoods or a service area) from a local cache of results
+for individual census geographies, so that new regions can be defined without adding them to the lookup table and fetching data from the APIs again.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from utilities.luts import *
+from utilities.functions import (
+    aggregate_results,
+    encode_geoidfq,
+    decode_geoid_key,
+    geoid_key_to_geoidfq,
+)
+from utilities.polygons import explode_results_geoids
+
+
+def build_geography_lookup(polys, areatype_str="tract", region="Alaska", country="US"):
+    """Build a lookup table with one row for every census polygon of an area type (e.g., every tract in the state),
+    to fetch the results used to fill the geography cache with run_fetch_and_merge().
+
+    Args:
+        polys (geopandas.GeoDataFrame): census polygons from load_census_polygons()
+        areatype_str (str): area type of the rows ("tract" or "place")
+        region (str): region name for the lookup table rows
+        country (str): country abbreviation for the lookup table rows
+    Returns:
+        pandas.DataFrame with the columns of the lookup table
+    """
+    sumlev, _, _ = decode_geoid_key(polys["geoid_key"])
+    polys = polys[sumlev == sumlev_dict[areatype_str]["sumlev"]]
+    if areatype_str == "place":
+        polys = polys[polys["classfp"].isin(place_classfp_dict)]
+        areatypes = polys["classfp"].map(place_classfp_dict).to_numpy()
+    else:
+        areatypes = "Census tract"
+
+    geoidfqs = geoid_key_to_geoidfq(polys["geoid_key"])
+    return pd.DataFrame(
+        {
+            "id": [f"GEO{key}" for key in polys["geoid_key"]],
+            "name": polys["placename"].to_numpy(),
+            "alt_name": np.nan,
+            "region": region,
+            "country": country,
+            "latitude": np.nan,
+            "longitude": np.nan,
+            "type": areatype_str,
+            "GEOIDFQ": geoidfqs,
+            "PLACENAME": polys["placename"].to_numpy(),
+            "AREATYPE": areatypes,
+            "COMMENT": np.nan,
+        }
+    )
+
+
+def cache_geography_results(results_df, cache_path="tbl/geography_results.parquet"):
+    """Add unaggregated results (one row per census geography, from run_fetch_and_merge()) to the local geography cache.
+    Rows are keyed by their integer GEOID key (and vintage, if the results have a "vintage" column); geographies already in the cache are replaced with the new rows.
+
+    Args:
+        results_df (pandas.DataFrame): unaggregated results from run_fetch_and_merge()
+        cache_path (str or pathlib.Path): Parquet file of the geography cache
+    Returns:
+        pandas.DataFrame of the updated cache
+    """
+    cache_path = Path(cache_path)
+    rows = results_df.reset_index(drop=True)
+    rows["GEOID"] = rows["GEOID"].astype(str)
+    if (rows["GEOID"].str.contains(",")).any():
+        raise ValueError(
+            "The geography cache needs unaggregated results with one GEOID per row (use the output of run_fetch_and_merge())"
+        )
+    rows["geoid_key"] = explode_results_geoids(rows)["geoid_key"].to_numpy()
+
+    if cache_path.exists():
+        rows = pd.concat([pd.read_parquet(cache_path), rows], ignore_index=True)
+    # results with several vintages keep one row per geography and vintage
+    keys = ["geoid_key", "vintage"] if "vintage" in rows.columns else ["geoid_key"]
+    rows = rows.drop_duplicates(keys, keep="last").reset_index(drop=True)
+
+    rows.to_parquet(cache_path, index=False, compression="zstd")
+    return rows
+
+
+def load_geography_cache(cache_path="tbl/geography_results.parquet"):
+    """Load the local geography cache, indexed by integer GEOID key.
+
+    Args:
+        cache_path (str or pathlib.Path): Parquet file of the geography cache
+    Returns:
+        pandas.DataFrame
+    """
+    return pd.read_parquet(cache_path).set_index("geoid_key")
+
+
+def aggregate_regions(cache, regions, ci_method="pooled", n_draws=10000, seed=0):
+    """Compute aggregated demographics and pooled confidence intervals for custom regions from the geography cache, with the same math as aggregate_results().
+    No data are fetched, so every geography in a region must already be in the cache.
+
+    Args:
+        cache (pandas.DataFrame): geography cache from load_geography_cache()
+        regions (dict): region names as keys and lists of the GEOIDFQs of their tracts and/or places as values
+            (e.g., {"Eagle River": ["1400000US02020000201", "1400000US02020000202"]})
+        ci_method (str): how to compute the 90% CIs of the regions, "pooled" or "monte_carlo", see aggregate_results()
+        n_draws (int): number of samples per geography for the "monte_carlo" CI method
+        seed (int): seed of the random number generator for the "monte_carlo" CI method
+    Returns:
+        pandas.DataFrame with one row per region (and vintage, if the cache has several vintages), with the columns of the results table
+    """
+    names = list(regions)
+    geoidfqs = [geoidfq for name in names for geoidfq in regions[name]]
+    keys = encode_geoidfq(geoidfqs)
+
+    missing = [
+        geoidfq for geoidfq, key in zip(geoidfqs, keys) if key not in cache.index
+    ]
+    if len(missing) > 0:
+        raise ValueError(f"GEOIDFQs not found in the geography cache: {missing}")
+
+    # a cache with several vintages has a row per vintage for each geography, which aggregate_results() aggregates separately
+    region_names = np.repeat(names, [len(regions[name]) for name in names])
+    rows = pd.DataFrame({"id": region_names, "geoid_key": keys}).merge(
+        cache.drop(columns=["id", "name"]), left_on="geoid_key", right_index=True
+    )
+    rows = rows.drop(columns="geoid_key").reset_index(drop=True)
+    rows.insert(1, "name", rows["id"])
+
+    # describe the geographies in each region, like the comments for one-to-many places in the lookup table
+    comments = {}
+    for name, placenames in rows.groupby("name", sort=False)["placename"]:
+        placenames = placenames.drop_duplicates().tolist()
+        if len(placenames) == 1:
+            comments[name] = f"Data represent information from {placenames[0]}."
+        elif len(placenames) == 2:
+            comments[name] = (
+                f"Data for this region represent multiple merged census geographies: {' and '.join(placenames)}"
+            )
+        else:
+            comments[name] = (
+                f"Data for this region represent multiple merged census geographies: {', '.join(placenames[:-1])}, and {placenames[-1]}"
+            )
+    rows["comment"] = rows["name"].map(comments)
+
+    results = aggregate_results(rows, ci_method, n_draws, seed)
+    return results.set_index("id").loc[names].reset_index()
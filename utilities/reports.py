@@ -0,0 +1,153 @@
+import re
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pathlib import Path
+from utilities.luts import *
+from utilities.functions import decode_geoid_key
+from utilities.export import get_column_metadata, read_results
+
+
+def build_wide_report(results, ids=None, order=demographics_order):
+    """Reformat rows of the results table into a wide report, with one row per variable and one column per location
+    (named by the location name), plus "description" and "source" columns. This is the layout of the CSV output from the API.
+    If the results table has several vintages, there is one column per location and vintage, named by the location name and vintage (e.g., "Fairbanks (2023)").
+
+    Args:
+        results (pandas.DataFrame): results table from aggregate_results(), or read with read_results()
+        ids (list): GVV IDs to include, in the order of the report columns; defaults to all rows of the results table
+        order (list): fields to include, in order; fields missing from the results table are skipped
+    Returns:
+        pandas.DataFrame
+    """
+    if ids is not None:
+        available = set(results["id"])
+        ids = [id for id in ids if id in available]
+        results = results.set_index("id").loc[ids].reset_index()
+
+    fields = [col for col in order if col in results.columns and col != "name"]
+    # label the columns of results with several vintages by vintage, e.g. "Fairbanks (2023)"
+    labels = results["name"]
+    if "vintage" in results.columns and results["vintage"].nunique() > 1:
+        labels = labels + " (" + results["vintage"].astype(str) + ")"
+    report = results.set_index(labels)[fields].transpose()
+    report.columns.name = None
+
+    # use the report descriptions, or the column metadata for fields without one
+    descriptions = []
+    sources = []
+    for field in fields:
+        if field in demographics_descriptions:
+            descriptions.append(demographics_descriptions[field]["description"])
+            sources.append(demographics_descriptions[field]["source"])
+        else:
+            metadata = get_column_metadata(field)
+            descriptions.append(metadata["long_name"])
+            sources.append(metadata["source"])
+    report["description"] = descriptions
+    report["source"] = sources
+
+    return report.reset_index(names="variable")
+
+
+def write_report(report, out_path, location, description=""):
+    """Write a wide report to CSV with a metadata header (e.g., "# Location: Anchorage Area"), or to Parquet with the header in the file metadata.
+    The format is chosen from the file extension (".csv" or ".parquet").
+
+    Args:
+        report (pandas.DataFrame): wide report from build_wide_report()
+        out_path (str or pathlib.Path): output file path
+        location (str): name of the area covered by the report
+        description (str): description of the report
+    Returns:
+        None
+    """
+    out_path = Path(out_path)
+    header = f"# Location: {location}\n# {description}"
+
+    if out_path.suffix == ".csv":
+        with open(out_path, "w") as file:
+            file.write(header + "\n")
+            report.to_csv(file, index=False)
+    elif out_path.suffix == ".parquet":
+        # values are a mix of comment strings and numbers, so store them as strings like the CSV
+        table = pa.Table.from_pandas(report.astype(str), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"report_header"] = header.encode()
+        pq.write_table(
+            table.replace_schema_metadata(metadata), out_path, compression="zstd"
+        )
+    else:
+        raise ValueError(
+            f"Unsupported report format: {out_path.suffix} (use .csv or .parquet)"
+        )
+
+
+def report_filename(location):
+    """Make a file name for a report from a location name (e.g., "Bethel Census Area" -> "bethel_census_area_data_to_export")."""
+    return re.sub(r"[^a-z0-9]+", "_", location.lower()).strip("_") + "_data_to_export"
+
+
+def write_reports(
+    results,
+    groups,
+    out_dir="tbl/reports/",
+    formats=(".csv",),
+    description="Demographic and health data for communities in {location}.",
+):
+    """Write a wide report for each group of GVV IDs (e.g., the communities of each borough) in one batch.
+    The results for all groups are read at once.
+
+    Args:
+        results (pandas.DataFrame or str or pathlib.Path): results table, or the path of a Parquet file written by export_results()
+        groups (dict): location names as keys and lists of GVV IDs as values (e.g., from group_ids_by_borough())
+        out_dir (str or pathlib.Path): output directory, created if it does not exist
+        formats (tuple): file extensions of the formats to write (".csv" and/or ".parquet")
+        description (str): description of each report; "{location}" is replaced with the location name
+    Returns:
+        list of pathlib.Paths of the reports written
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    all_ids = list(dict.fromkeys(id for ids in groups.values() for id in ids))
+    if isinstance(results, (str, Path)):
+        results = read_results(results, ids=all_ids)
+
+    available = set(results["id"])
+    paths = []
+    for location, ids in groups.items():
+        if not available.intersection(ids):
+            print(f"No results found for {location}, no report written")
+            continue
+        report = build_wide_report(results, ids)
+        for suffix in formats:
+            out_path = out_dir / (report_filename(location) + suffix)
+            write_report(
+                report, out_path, location, description.format(location=location)
+            )
+            paths.append(out_path)
+
+    return paths
+
+
+def group_ids_by_borough(points, polys):
+    """Group community GVV IDs by the borough or census area that contains their point location.
+
+    Args:
+        points (pandas.DataFrame): point locations with "id", "latitude", and "longitude" columns (e.g., alaska_point_locations.csv)
+        polys (geopandas.GeoDataFrame): census polygons from load_census_polygons()
+    Returns:
+        dictionary with borough names as keys and lists of GVV IDs as values
+    """
+    sumlev, _, _ = decode_geoid_key(polys["geoid_key"])
+    counties = polys[sumlev == sumlev_dict["county"]["sumlev"]]
+
+    points = gpd.GeoDataFrame(
+        points[["id"]],
+        geometry=gpd.points_from_xy(points["longitude"], points["latitude"], crs=4326),
+    ).to_crs(polys.crs)
+    joined = gpd.sjoin(points, counties, how="inner", predicate="within")
+
+    return joined.groupby("placename", sort=True)["id"].agg(list).to_dict()
@@ -0,0 +1,258 @@
+import gzip
+import json
+import math
+import sqlite3
+import geopandas as gpd
+import shapely
+import mapbox_vector_tile
+from pathlib import Path
+from shapely.geometry import box
+from multiprocessing.pool import Pool
+
+# half the width of the web mercator (EPSG:3857) world, in meters
+mercator_origin = 20037508.342789244
+
+
+def tile_bounds(zoom, x, y):
+    """Get the web mercator bounds of an XYZ tile.
+
+    Args:
+        zoom (int): zoom level
+        x (int): tile column
+        y (int): tile row, counted from the top of the map
+    Returns:
+        Tuple of (minx, miny, maxx, maxy)
+    """
+    size = 2 * mercator_origin / 2**zoom
+    minx = -mercator_origin + x * size
+    maxy = mercator_origin - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+def tiles_for_bounds(bounds, zoom):
+    """List the XYZ tiles that intersect a web mercator bounding box.
+
+    Args:
+        bounds (tuple): (minx, miny, maxx, maxy) in web mercator
+        zoom (int): zoom level
+    Returns:
+        list of (x, y) tuples
+    """
+    n = 2**zoom
+    size = 2 * mercator_origin / n
+    minx, miny, maxx, maxy = bounds
+    x0 = min(max(math.floor((minx + mercator_origin) / size), 0), n - 1)
+    x1 = min(max(math.floor((maxx + mercator_origin) / size), 0), n - 1)
+    y0 = min(max(math.floor((mercator_origin - maxy) / size), 0), n - 1)
+    y1 = min(max(math.floor((mercator_origin - miny) / size), 0), n - 1)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def simplify_for_zoom(gdf, zoom, tolerance_px=1):
+    """Simplify polygons for display at a given zoom level, without creating invalid geometry.
+    The tolerance is a fraction of a screen pixel (256 pixels per tile) at that zoom level.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): polygons in web mercator (EPSG:3857)
+        zoom (int): zoom level
+        tolerance_px (float): simplification tolerance in screen pixels
+    Returns:
+        geopandas.GeoDataFrame with simplified geometry
+    """
+    tolerance = 2 * mercator_origin / 2**zoom / 256 * tolerance_px
+    gdf = gdf.copy()
+    gdf["geometry"] = gdf.geometry.simplify(tolerance, preserve_topology=True)
+    return gdf
+
+
+def render_zoom(gdf, zoom, layer="demographics", extent=4096, buffer_px=4):
+    """Render all vector tiles for one zoom level. Polygons are simplified for the zoom level, then clipped to each tile.
+    Only tiles that intersect a polygon part are rendered.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): polygons in web mercator (EPSG:3857), with no empty geometry
+        zoom (int): zoom level
+        layer (str): name of the vector tile layer
+        extent (int): tile coordinate extent
+        buffer_px (int): tile buffer in screen pixels (256 pixels per tile), to avoid seams at tile edges
+    Returns:
+        list of (zoom, x, y, gzipped tile bytes) tuples
+    """
+    simplified = simplify_for_zoom(gdf, zoom)
+    geoms = simplified.geometry.values
+    sindex = simplified.sindex
+
+    # drop missing values from feature properties; vector tiles can't encode them
+    properties = [
+        {k: v for k, v in record.items() if v == v and v is not None}
+        for record in simplified.drop(columns="geometry").to_dict("records")
+    ]
+
+    # get tiles from the bounds of each polygon part, since multipolygons may cross the antimeridian
+    tiles = set()
+    for bounds in simplified.geometry.explode(index_parts=False).bounds.values:
+        tiles.update(tiles_for_bounds(bounds, zoom))
+
+    buffer = 2 * mercator_origin / 2**zoom / 256 * buffer_px
+    out = []
+    for x, y in sorted(tiles):
+        bounds = tile_bounds(zoom, x, y)
+        minx, miny, maxx, maxy = bounds
+        buffered = (minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+        idx = sindex.query(box(*buffered))
+        clipped = shapely.clip_by_rect(geoms[idx], *buffered)
+
+        features = [
+            {"geometry": geom, "properties": properties[i]}
+            for i, geom in zip(idx, clipped)
+            if not geom.is_empty
+        ]
+        if len(features) == 0:
+            continue
+
+        data = mapbox_vector_tile.encode(
+            [{"name": layer, "features": features}],
+            default_options={"quantize_bounds": bounds, "extents": extent},
+        )
+        out.append((zoom, x, y, gzip.compress(data)))
+
+    return out
+
+
+def write_mbtiles(tiles, out_path, metadata):
+    """Write vector tiles to an MBTiles file (SQLite), overwriting any existing file.
+
+    Args:
+        tiles (list): (zoom, x, y, gzipped tile bytes) tuples, with XYZ tile rows
+        out_path (str or pathlib.Path): output MBTiles path
+        metadata (dict): MBTiles metadata names and values
+    Returns:
+        None
+    """
+    out_path = Path(out_path)
+    out_path.unlink(missing_ok=True)
+
+    with sqlite3.connect(out_path) as con:
+        con.execute("CREATE TABLE metadata (name text, value text)")
+        con.execute(
+            "CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)"
+        )
+        con.execute(
+            "CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)"
+        )
+        con.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        # MBTiles uses TMS tile rows, counted from the bottom of the map
+        con.executemany(
+            "INSERT INTO tiles VALUES (?, ?, ?, ?)",
+            [(z, x, 2**z - 1 - y, data) for z, x, y, data in tiles],
+        )
+
+
+def read_tile(mbtiles_path, zoom, x, y):
+    """Read one gzipped vector tile from an MBTiles file.
+
+    Args:
+        mbtiles_path (str or pathlib.Path): MBTiles path
+        zoom (int): zoom level
+        x (int): tile column
+        y (int): tile row, counted from the top of the map (XYZ)
+    Returns:
+        gzipped tile bytes, or None if there is no tile
+    """
+    with sqlite3.connect(mbtiles_path) as con:
+        row = con.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, 2**zoom - 1 - y),
+        ).fetchone()
+    if row is None:
+        return None
+    return row[0]
+
+
+def export_demographics_tiles(
+    gdf,
+    out_path="shp/demographics.mbtiles",
+    minzoom=0,
+    maxzoom=8,
+    layer="demographics",
+    processes=None,
+):
+    """Render a vector tile pyramid of the demographics layer, with polygons simplified for each zoom level,
+    and write it to an MBTiles file. Zoom levels are rendered in parallel.
+    Rows without a polygon (the state of AK and the US) are not included.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): demographics layer from export_demographics()
+        out_path (str or pathlib.Path): output MBTiles path
+        minzoom (int): minimum zoom level
+        maxzoom (int): maximum zoom level
+        layer (str): name of the vector tile layer
+        processes (int): number of worker processes, defaults to the number of CPUs
+    Returns:
+        number of tiles written
+    """
+    gdf = gdf[~gdf.geometry.isna()].to_crs(3857)
+    zooms = list(range(minzoom, maxzoom + 1))
+
+    tiles = []
+    with Pool(processes) as pool:
+        for result in pool.starmap(render_zoom, [(gdf, zoom, layer) for zoom in zooms]):
+            tiles.extend(result)
+
+    fields = {
+        col: "Number" if gdf[col].dtype.kind in "if" else "String"
+        for col in gdf.columns
+        if col != "geometry"
+    }
+    lon_lat_bounds = gdf.to_crs(4326).total_bounds
+
+    metadata = {
+        "name": layer,
+        "format": "pbf",
+        "type": "overlay",
+        "minzoom": str(minzoom),
+        "maxzoom": str(maxzoom),
+        "bounds": ",".join(str(round(b, 4)) for b in lon_lat_bounds),
+        "json": json.dumps(
+            {
+                "vector_layers": [
+                    {
+                        "id": layer,
+                        "fields": fields,
+                        "minzoom": minzoom,
+                        "maxzoom": maxzoom,
+                    }
+                ]
+            }
+        ),
+    }
+    write_mbtiles(tiles, out_path, metadata)
+
+    return len(tiles)
+
+
+def write_simplified_layers(gdf, out_path="shp/demographics.gpkg", zooms=(4, 6, 8)):
+    """Write simplified copies of the demographics layer to a GeoPackage, one layer per zoom level
+    (e.g., "demographics_z4"), for map services that do not use vector tiles.
+
+    Args:
+        gdf (geopandas.GeoDataFrame): demographics layer from export_demographics()
+        out_path (str or pathlib.Path): GeoPackage path; existing layers with the same names are overwritten
+        zooms (tuple): zoom levels to simplify the polygons for
+    Returns:
+        None
+    """
+    gdf = gdf.to_crs(3857)
+    for zoom in zooms:
+        simplified = gdf.copy()
+        has_geom = ~simplified.geometry.isna()
+        simplified.loc[has_geom, "geometry"] = simplify_for_zoom(
+            simplified[has_geom], zoom
+        ).geometry
+        simplified.to_file(
+            out_path,
+            driver="GPKG",
+            layer=f"demographics_z{zoom}",
+            encoding="utf-8",
+            SPATIAL_INDEX="YES",
+        )
@@ -0,0 +1,159 @@
+"""
+This is used to estimate confidence intervals of aggregated results by Monte Carlo simulation, instead of the closed-form pooled intervals of aggregate_results().
+Each measure of each input geography is sampled from its reported uncertainty (the 95% CI of CDC PLACES measures, or the 90% MOE of ACS and SDOH measures),
+the samples are aggregated with the same pct -> count -> pct math as aggregate_results(), and the intervals are the quantiles of the aggregated samples.
+"""
+
+import numpy as np
+import pandas as pd
+from utilities.luts import *
+
+# z scores of the reported 95% CIs (CDC PLACES) and 90% MOEs (ACS and SDOH)
+z_95 = 1.96
+z_90 = 1.645
+
+
+def _moe_measure(col):
+    """Get the measure column of an MOE column (e.g., "pct_crowding_moe" -> "pct_crowding", "moe_pct_insured" -> "pct_insured")."""
+    if "_moe" in col:
+        return col.split("_moe")[0]
+    return col.split("moe_")[1]
+
+
+def get_measure_uncertainty(df):
+    """Get the standard deviation of every measure in the results table that reports an uncertainty, and the population it is weighted by when aggregating.
+    Standard deviations are back-calculated from the low and high CI columns of CDC PLACES measures, and from the MOE columns of ACS and SDOH measures.
+
+    Args:
+        df (pandas.DataFrame): unaggregated results from run_fetch_and_merge()
+    Returns:
+        dictionary with measure columns as keys and (standard deviation pandas.Series, weight column name) tuples as values;
+        the weight column is "total_population", "adult_population", or None for measures that are averaged (non_pop_cols)
+    """
+    sds = {}
+    for col in df.columns:
+        if col in non_data_cols or not col.endswith("_low"):
+            continue
+        measure = col.removesuffix("_low")
+        if measure in df.columns and f"{measure}_high" in df.columns:
+            sds[measure] = (df[f"{measure}_high"] - df[col]) / (2 * z_95)
+    for col in moe_cols:
+        if col in df.columns and _moe_measure(col) in df.columns:
+            sds[_moe_measure(col)] = df[col] / z_90
+
+    uncertainty = {}
+    for measure, sd in sds.items():
+        if measure in non_pop_cols:
+            weight = None
+        elif measure in adult_only_cols:
+            weight = "adult_population"
+        else:
+            weight = "total_population"
+        uncertainty[measure] = (sd, weight)
+
+    return uncertainty
+
+
+def _sorted_quantiles(samples, q):
+    """Get quantiles of each row of a 2D array of samples, with the linear interpolation of numpy.quantile(). Sorting the rows in place is faster than numpy.quantile() for many rows of draws."""
+    samples.sort(axis=1)
+    pos = np.asarray(q) * (samples.shape[1] - 1)
+    lower = np.floor(pos).astype(int)
+    upper = np.minimum(lower + 1, samples.shape[1] - 1)
+    return samples[:, lower] * (1 - (pos - lower)) + samples[:, upper] * (pos - lower)
+
+
+def simulate_intervals(
+    df, keys=("id",), n_draws=10000, level=0.90, seed=0, block_size=2**24
+):
+    """Estimate the confidence intervals of aggregated measures by Monte Carlo simulation.
+    For each row, n_draws samples of each measure are drawn from a normal distribution with its reported value and back-calculated standard deviation
+    (see get_measure_uncertainty()), and clipped to 0-100%. The samples of the rows of each group are converted to counts, summed, and converted back to percentages
+    (or averaged, for non_pop_cols), and the intervals are the empirical quantiles of the aggregated samples. A group with any missing value of a measure
+    (or no population) gets missing intervals for that measure.
+
+    The rows of a group get independent draws, but every group and measure reuses the same standard normal draws (the nth row of each group uses the nth row of draws),
+    which does not change the interval of any one group and measure. Because the aggregation is a weighted sum, the aggregated samples of a group that cannot reach
+    the 0-100% bounds are computed from the draws with one matrix product, without the samples of each row; only groups that can reach the bounds are clipped row by row.
+
+    Args:
+        df (pandas.DataFrame): unaggregated results from run_fetch_and_merge(), with one row per census geography
+        keys (list): columns that identify the groups of rows to aggregate (e.g., ["id"], or ["id", "vintage"])
+        n_draws (int): number of samples per row
+        level (float): confidence level of the intervals
+        seed (int): seed of the random number generator, so repeated runs give the same intervals (None for a different seed every run)
+        block_size (int): maximum number of samples held in memory at once
+    Returns:
+        pandas.DataFrame with one row per group, with the key columns and "{measure}_low" and "{measure}_high" columns for each measure with an uncertainty
+    """
+    df = df.reset_index(drop=True)
+    keys = list(keys)
+    if "adult_population" not in df.columns:
+        df["adult_population"] = round(
+            df["total_population"]
+            - (df["total_population"] * (df["pct_under_18"] / 100))
+        )
+
+    grouped = df.groupby(keys, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    pos = grouped.cumcount().to_numpy()
+    n_groups = codes.max() + 1
+    first_rows = np.unique(codes, return_index=True)[1]
+
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((pos.max() + 1, n_draws), dtype="float32")
+    z_min = z.min(axis=1)[pos]
+    z_max = z.max(axis=1)[pos]
+
+    q = [(1 - level) / 2, 1 - (1 - level) / 2]
+    block_groups = max(1, block_size // n_draws)
+    intervals = {}
+
+    def pad(row_values):
+        """Arrange the values of each row in a 2D array with one row per group and one column per position in the group (missing positions are zero)."""
+        padded = np.zeros((n_groups, len(z)), dtype="float32")
+        padded[codes, pos] = row_values
+        return padded
+
+    for measure, (sd, weight) in get_measure_uncertainty(df).items():
+        values = df[measure].to_numpy(dtype="float64")
+        sds = np.nan_to_num(sd.to_numpy(dtype="float64"))
+        if weight is None:
+            weights = np.ones(len(df))
+        else:
+            weights = df[weight].to_numpy(dtype="float64")
+        # share of each row in the total population (or row count) of its group
+        shares = weights / np.bincount(codes, weights, n_groups)[codes]
+
+        missing = np.bincount(codes, ~np.isfinite(values * shares), n_groups) > 0
+        can_clip = (values + sds * z_min < 0) | (values + sds * z_max > 100)
+        clipped = (np.bincount(codes, can_clip, n_groups) > 0) & ~missing
+        bounds = np.full((n_groups, 2), np.nan)
+
+        ok = ~missing[codes]
+        means = np.bincount(codes[ok], (values * shares)[ok], n_groups)
+        values, sds, shares = pad(values), pad(sds), pad(shares)
+
+        # groups that cannot reach the bounds: the mean plus a weighted sum of the draws
+        linear = np.flatnonzero(~missing & ~clipped)
+        for i in range(0, len(linear), block_groups):
+            groups = linear[i : i + block_groups]
+            samples = (shares[groups] * sds[groups]) @ z
+            samples += means[groups, None].astype("float32")
+            bounds[groups] = _sorted_quantiles(samples, q)
+
+        # groups that can reach the bounds: clip the samples of each row, then take the weighted sum
+        clipped = np.flatnonzero(clipped)
+        for i in range(0, len(clipped), max(1, block_groups // len(z))):
+            groups = clipped[i : i + max(1, block_groups // len(z))]
+            samples = sds[groups, :, None] * z
+            samples += values[groups, :, None]
+            np.clip(samples, 0, 100, out=samples)
+            samples = np.matmul(shares[groups, None, :], samples)[:, 0]
+            bounds[groups] = _sorted_quantiles(samples, q)
+
+        intervals[f"{measure}_low"] = bounds[:, 0]
+        intervals[f"{measure}_high"] = bounds[:, 1]
+
+    groups = df.loc[first_rows, keys].reset_index(drop=True)
+    return pd.concat([groups, pd.DataFrame(intervals)], axis=1)
@@ -0,0 +1,549 @@
+"""
+This is used to share one fetch run between several worker processes, on one or more machines, instead of the multiprocessing pool of run_fetch_and_merge().
+The run is a SQLite database (e.g., on a shared drive) with a table of tasks: GVV IDs of the lookup table, or batches of census geographies from utilities/national.py.
+Workers lease tasks from the queue, fetch them with fetch_and_merge(), and store the results in the same database. A task whose worker fails is retried
+after a delay, and a task whose lease expires (e.g., the worker machine went down) is leased again by another worker. Once every task is done,
+collect_results() combines and aggregates the results like run_fetch_and_merge() and aggregate_results().
+Since each worker makes its own requests, workers on several machines also spread the requests over several IP addresses and per-IP rate limits.
+"""
+
+import io
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import closing
+import pandas as pd
+from pathlib import Path
+from multiprocessing.pool import Pool
+from utilities.luts import *
+from utilities.functions import (
+    fetch_and_merge,
+    aggregate_results,
+    add_reference_rows,
+    create_comment_dict,
+    get_reference_ids,
+)
+from utilities.national import (
+    lookup_cols,
+    fetch_state_geographies,
+    batch_state_lookup,
+    fetch_batch,
+)
+
+queue_schema = """
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    lookup TEXT NOT NULL,
+    comment TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    task_id TEXT PRIMARY KEY,
+    worker TEXT NOT NULL,
+    finished REAL NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+
+def connect(db_path):
+    """Open a connection to a queue database. Transactions are managed explicitly, and a locked database is waited on instead of raising an error,
+    since many workers write to the same database.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue
+    Returns:
+        sqlite3.Connection
+    """
+    return sqlite3.connect(db_path, timeout=60, isolation_level=None)
+
+
+def create_queue(db_path, vintages=None, max_attempts=3, retry_delay=60):
+    """Create a queue database, or open an existing one with the same settings (e.g., to add more tasks).
+    The vintages are stored with the queue, so that every worker fetches the same vintages.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue, created if it does not exist
+        vintages (list): vintages to fetch, see fetch_and_merge()
+        max_attempts (int): number of times a task is leased before it is marked as failed
+        retry_delay (float): seconds to wait before retrying a failed task, doubled after each failed attempt
+    Returns:
+        None
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+    config = {
+        "vintages": json.dumps(vintages),
+        "max_attempts": json.dumps(max_attempts),
+        "retry_delay": json.dumps(retry_delay),
+    }
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    with closing(connect(db_path)) as conn:
+        conn.executescript(queue_schema)
+        existing = dict(conn.execute("SELECT key, value FROM config").fetchall())
+        if len(existing) > 0 and existing != config:
+            raise ValueError(
+                f"Queue at {db_path} already exists with other settings: {read_config(conn)}"
+            )
+        conn.executemany(
+            "INSERT OR IGNORE INTO config (key, value) VALUES (?, ?)", config.items()
+        )
+
+
+def read_config(conn):
+    """Read the settings of a queue from create_queue().
+
+    Args:
+        conn (sqlite3.Connection): connection to the queue database
+    Returns:
+        dictionary with "vintages", "max_attempts", and "retry_delay" keys
+    """
+    rows = conn.execute("SELECT key, value FROM config").fetchall()
+    if len(rows) == 0:
+        raise ValueError("Queue has not been created, use create_queue() first")
+    return {key: json.loads(value) for key, value in rows}
+
+
+def add_tasks(db_path, tasks):
+    """Add tasks to a queue. Tasks that are already in the queue (with the same task ID) are left as they are,
+    so tasks can be added again after an interruption without fetching finished tasks again.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+        tasks (list): (task ID, kind, lookup table, comment) tuples, where kind is "gvv" for a GVV ID fetched with fetch_and_merge(),
+            or "batch" for a batch of geographies fetched with fetch_batch()
+    Returns:
+        number of tasks added
+    """
+    rows = [
+        (task_id, kind, lookup_df.to_json(orient="records"), comment)
+        for task_id, kind, lookup_df, comment in tasks
+    ]
+    with closing(connect(db_path)) as conn:
+        read_config(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        before = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO tasks (task_id, kind, lookup, comment) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        after = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        conn.execute("COMMIT")
+    return after - before
+
+
+def enqueue_gvv_ids(db_path, geoid_lu_df, ids=None, reference=True, state="02"):
+    """Add a task for each GVV ID of the lookup table to a queue, with the reference rows of the state and US (see get_reference_ids()).
+    Comments are created from the whole lookup table, like run_fetch_and_merge().
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+        geoid_lu_df (pandas.DataFrame): table with GVV IDs and associated GEOIDFQs, census places, and comments
+        ids (list): GVV IDs to add, defaults to every ID in the lookup table
+        reference (bool): whether to add the state and US reference rows
+        state (str): 2 digit state FIPS code of the state reference row (a key of state_dict)
+    Returns:
+        number of tasks added
+    """
+    ref_ids = get_reference_ids(state)
+    geoid_lu_df = geoid_lu_df[~geoid_lu_df["id"].isin(ref_ids)]
+    if reference:
+        geoid_lu_df = add_reference_rows(geoid_lu_df, state)
+    comment_dict = create_comment_dict(geoid_lu_df)
+
+    if ids is not None:
+        missing = set(ids) - set(geoid_lu_df["id"])
+        if len(missing) > 0:
+            raise ValueError(
+                f"GVV IDs not found in the lookup table: {sorted(missing)}"
+            )
+        geoid_lu_df = geoid_lu_df[geoid_lu_df["id"].isin(list(ids) + ref_ids)]
+    tasks = [
+        (gvv_id, "gvv", id_df, comment_dict[gvv_id])
+        for gvv_id, id_df in geoid_lu_df.groupby("id", sort=False)
+    ]
+    return add_tasks(db_path, tasks)
+
+
+def enqueue_state_batches(
+    db_path,
+    states,
+    areatypes=("tract",),
+    batch_size=100,
+    cache_dir=None,
+    offline=False,
+    reference=True,
+):
+    """Add a task for each batch of census geographies of the given area types in each state to a queue (see batch_state_lookup()),
+    with the reference row of each state and the US reference row. The geographies of each state are listed from the census API.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+        states (list): 2 digit state FIPS codes (keys of state_dict)
+        areatypes (list): area types of the geographies to fetch (keys of national_areatype_dict)
+        batch_size (int): maximum number of geographies per batch
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        offline (bool): whether to only use cached responses, see request_json()
+        reference (bool): whether to add the state and US reference rows
+    Returns:
+        number of tasks added
+    """
+    tasks = []
+    for state in states:
+        lookup_df = pd.concat(
+            [
+                fetch_state_geographies(state, areatype_str, cache_dir, offline)
+                for areatype_str in areatypes
+            ],
+            ignore_index=True,
+        )
+        for batch_id, batch_lu in batch_state_lookup(lookup_df, batch_size):
+            tasks.append((batch_id, "batch", lookup_df.loc[batch_lu.index], None))
+        if reference:
+            state_lu = add_reference_rows(pd.DataFrame(columns=lookup_cols), state)
+            tasks.append((state_lu["id"].iloc[0], "gvv", state_lu.iloc[:1], ""))
+    if reference:
+        # the US reference row is only fetched once
+        us_lu = add_reference_rows(pd.DataFrame(columns=lookup_cols)).iloc[1:]
+        tasks.append(("US0", "gvv", us_lu, ""))
+    return add_tasks(db_path, tasks)
+
+
+def claim_task(conn, worker_id, lease_seconds=600):
+    """Lease the next available task of a queue: a pending task that is not waiting for a retry, or a leased task whose lease has expired.
+    Leased tasks that expired on their last attempt are marked as failed first.
+
+    Args:
+        conn (sqlite3.Connection): connection to the queue database
+        worker_id (str): ID of the worker leasing the task
+        lease_seconds (float): seconds until the lease expires, if it is not renewed with renew_lease()
+    Returns:
+        dictionary with the task columns, or None if no task is available
+    """
+    max_attempts = read_config(conn)["max_attempts"]
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE tasks SET status = 'failed', error = 'Lease expired on the last attempt' "
+            "WHERE status = 'leased' AND lease_expires <= ? AND attempts >= ?",
+            (now, max_attempts),
+        )
+        row = conn.execute(
+            "SELECT task_id, kind, lookup, comment FROM tasks "
+            "WHERE (status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires <= ?) "
+            "ORDER BY rowid LIMIT 1",
+            (now, now),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE task_id = ?",
+                (worker_id, now + lease_seconds, row[0]),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    if row is None:
+        return None
+    return dict(zip(["task_id", "kind", "lookup", "comment"], row))
+
+
+def renew_lease(conn, task_id, worker_id, lease_seconds=600):
+    """Extend the lease of a task, if the worker still holds it.
+
+    Args:
+        conn (sqlite3.Connection): connection to the queue database
+        task_id (str): ID of the leased task
+        worker_id (str): ID of the worker holding the lease
+        lease_seconds (float): seconds from now until the lease expires
+    Returns:
+        True if the lease was extended, or False if the task was leased by another worker or finished
+    """
+    cursor = conn.execute(
+        "UPDATE tasks SET lease_expires = ? WHERE task_id = ? AND worker = ? AND status = 'leased'",
+        (time.time() + lease_seconds, task_id, worker_id),
+    )
+    return cursor.rowcount > 0
+
+
+def complete_task(conn, task_id, worker_id, df):
+    """Store the results of a task and mark it as done. Results of a task that was already finished by another worker
+    (e.g., after its lease expired) are discarded, since both workers fetched the same data.
+
+    Args:
+        conn (sqlite3.Connection): connection to the queue database
+        task_id (str): ID of the leased task
+        worker_id (str): ID of the worker that fetched the task
+        df (pandas.DataFrame): results of the task
+    Returns:
+        True if the results were stored, or False if the task was already done
+    """
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute(
+            "UPDATE tasks SET status = 'done', worker = ?, lease_expires = NULL, error = NULL WHERE task_id = ? AND status != 'done'",
+            (worker_id, task_id),
+        )
+        if cursor.rowcount > 0:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (task_id, worker, finished, data) VALUES (?, ?, ?, ?)",
+                (task_id, worker_id, time.time(), buffer.getvalue()),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.rowcount > 0
+
+
+def fail_task(conn, task_id, worker_id, error):
+    """Record the error of a task, and return it to the queue to be retried after a delay, or mark it as failed if it has no attempts left.
+    Nothing is changed if the worker no longer holds the lease.
+
+    Args:
+        conn (sqlite3.Connection): connection to the queue database
+        task_id (str): ID of the leased task
+        worker_id (str): ID of the worker holding the lease
+        error (str): error message
+    Returns:
+        None
+    """
+    config = read_config(conn)
+    conn.execute(
+        "UPDATE tasks SET "
+        "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "available_at = ? + ? * (1 << (attempts - 1)), lease_expires = NULL, error = ? "
+        "WHERE task_id = ? AND worker = ? AND status = 'leased'",
+        (
+            config["max_attempts"],
+            time.time(),
+            config["retry_delay"],
+            error,
+            task_id,
+            worker_id,
+        ),
+    )
+
+
+def run_task(task, vintages=None, cache_dir=None, max_threads=None, offline=False):
+    """Fetch the data of a task from claim_task().
+
+    Args:
+        task (dictionary): task from claim_task()
+        vintages (list): vintages to fetch, see fetch_and_merge()
+        cache_dir (str or pathlib.Path): on-disk response cache directory, see request_json()
+        max_threads (int): maximum number of concurrent census requests, see fetch_census_data_and_compute()
+        offline (bool): whether to only use cached responses, see request_json()
+    Returns:
+        pandas.DataFrame
+    """
+    lookup_df = pd.read_json(io.StringIO(task["lookup"]), orient="records", dtype=False)
+    # empty fields are stored as nulls, which create_comment_dict() expects to be NaN
+    lookup_df = lookup_df.reindex(columns=lookup_cols).fillna(value=float("nan"))
+    fetch_kwargs = {
+        "cache_dir": cache_dir,
+        "max_threads": max_threads,
+        "offline": offline,
+    }
+    if task["kind"] == "batch":
+        batch_lu = lookup_df.assign(id=task["task_id"])
+        return fetch_batch(
+            lookup_df, task["task_id"], batch_lu, vintages, **fetch_kwargs
+        )
+    if task["kind"] == "gvv":
+        return fetch_and_merge(
+            lookup_df,
+            task["task_id"],
+            {task["task_id"]: task["comment"]},
+            vintages,
+            **fetch_kwargs,
+        )
+    raise ValueError(f"Unknown task kind: {task['kind']}")
+
+
+def _renew_leases(db_path, task_id, worker_id, lease_seconds, stop):
+    """Renew the lease of a task every third of the lease duration until stopped. Used in a thread while the task is fetched."""
+    with closing(connect(db_path)) as conn:
+        while not stop.wait(lease_seconds / 3):
+            if not renew_lease(conn, task_id, worker_id, lease_seconds):
+                return
+
+
+def run_worker(
+    db_path,
+    worker_id=None,
+    lease_seconds=600,
+    cache_dir=None,
+    max_threads=None,
+    offline=False,
+    max_tasks=None,
+    wait=True,
+    poll_seconds=30,
+):
+    """Lease and fetch tasks from a queue until no tasks are left. Workers can be started on any machine that can open the queue database.
+    The lease of a task is renewed while it is fetched, so only the tasks of workers that stop (e.g., a machine that went down) are leased again.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+        worker_id (str): ID of the worker, defaults to the host name and process ID
+        lease_seconds (float): seconds until the lease of a task expires if the worker stops renewing it
+        cache_dir (str or pathlib.Path): on-disk response cache directory of the worker, see request_json()
+        max_threads (int): maximum number of concurrent census requests, see fetch_census_data_and_compute()
+        offline (bool): whether to only use cached responses, see request_json()
+        max_tasks (int): maximum number of tasks to fetch before stopping, defaults to no limit
+        wait (bool): whether to keep polling while tasks are leased by other workers or waiting for a retry, so their tasks are picked up
+            if they fail or their leases expire; if False, the worker stops as soon as no task is available
+        poll_seconds (float): seconds between polls while waiting
+    Returns:
+        number of tasks the worker finished
+    """
+    if offline and cache_dir is None:
+        raise ValueError("Offline mode needs a cache_dir of saved responses")
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    finished = 0
+    with closing(connect(db_path)) as conn:
+        vintages = read_config(conn)["vintages"]
+        while max_tasks is None or finished < max_tasks:
+            task = claim_task(conn, worker_id, lease_seconds)
+            if task is None:
+                unfinished = conn.execute(
+                    "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')"
+                ).fetchone()[0]
+                if not wait or unfinished == 0:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=_renew_leases,
+                args=(db_path, task["task_id"], worker_id, lease_seconds, stop),
+                daemon=True,
+            )
+            heartbeat.start()
+            try:
+                df = run_task(task, vintages, cache_dir, max_threads, offline)
+            except Exception as e:
+                print(f"Task {task['task_id']} failed on {worker_id}: {e!r}")
+                fail_task(conn, task["task_id"], worker_id, repr(e))
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            if complete_task(conn, task["task_id"], worker_id, df):
+                finished += 1
+
+    print(f"Worker {worker_id} finished {finished} tasks")
+    return finished
+
+
+def run_workers(db_path, processes=None, **worker_kwargs):
+    """Run several workers of a queue on this machine with a multiprocessing pool, see run_worker().
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+        processes (int): number of worker processes, defaults to the number of CPUs
+        **worker_kwargs: other arguments of run_worker() (except worker_id)
+    Returns:
+        number of tasks the workers finished
+    """
+    processes = processes or os.cpu_count()
+    with Pool(processes) as pool:
+        results = [
+            pool.apply_async(run_worker, (db_path,), worker_kwargs)
+            for _ in range(processes)
+        ]
+        return sum(result.get() for result in results)
+
+
+def queue_status(db_path):
+    """Summarize the tasks of a queue by status.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+    Returns:
+        pandas.DataFrame with one row per task (task_id, kind, status, attempts, worker, error)
+    """
+    with closing(connect(db_path)) as conn:
+        return pd.read_sql_query(
+            "SELECT task_id, kind, status, attempts, worker, error FROM tasks ORDER BY rowid",
+            conn,
+        )
+
+
+def retry_failed(db_path):
+    """Return the failed tasks of a queue to the queue with their attempts reset, e.g. after fixing the cause of the errors.
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+    Returns:
+        number of tasks returned to the queue
+    """
+    with closing(connect(db_path)) as conn:
+        cursor = conn.execute(
+            "UPDATE tasks SET status = 'pending', attempts = 0, available_at = 0, worker = NULL "
+            "WHERE status = 'failed'"
+        )
+        return cursor.rowcount
+
+
+def collect_results(
+    db_path,
+    aggregate=True,
+    ci_method="pooled",
+    n_draws=10000,
+    seed=0,
+    allow_incomplete=False,
+):
+    """Combine the stored results of the tasks of a queue, and aggregate them with aggregate_results().
+
+    Args:
+        db_path (str or pathlib.Path): SQLite database of the queue from create_queue()
+        aggregate (bool): whether to aggregate the results, or return the unaggregated results (e.g., for regions or to aggregate later)
+        ci_method (str): CI method of aggregate_results()
+        n_draws (int): number of samples per row for the "monte_carlo" CI method
+        seed (int): seed of the random number generator for the "monte_carlo" CI method
+        allow_incomplete (bool): whether to return the finished results while other tasks are unfinished or failed, instead of raising an error
+    Returns:
+        pandas.DataFrame
+    """
+    status = queue_status(db_path)
+    unfinished = status[status["status"] != "done"]
+    if len(unfinished) > 0 and not allow_incomplete:
+        counts = unfinished["status"].value_counts().to_dict()
+        raise ValueError(
+            f"Queue at {db_path} has {len(unfinished)} unfinished tasks: {counts}"
+        )
+
+    with closing(connect(db_path)) as conn:
+        rows = conn.execute(
+            "SELECT results.data FROM results JOIN tasks USING (task_id) ORDER BY tasks.rowid"
+        ).fetchall()
+    if len(rows) == 0:
+        raise ValueError(f"Queue at {db_path} has no finished tasks")
+
+    results_df = pd.concat(
+        [pd.read_parquet(io.BytesIO(data)) for (data,) in rows], ignore_index=True
+    )
+    if not aggregate:
+        return results_df
+    return aggregate_results(results_df, ci_method, n_draws, seed)